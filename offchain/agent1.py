@@ -5,43 +5,45 @@ Fast inference for property valuation
 import os
 import sys
 import json
-from groq import Groq
-from dotenv import load_dotenv
+import time
 
-load_dotenv()
+from agent_batch import assign_property_ids, build_batch_instructions, run_batched
+from agent_input import read_input
+from agent_output import compile_schema, conform, load_output, reask_suffix
+from agent_prompts import (
+    analysis_inputs,
+    build_messages,
+    build_static_prefix,
+    describe_prompt,
+    merge_usage,
+    new_usage,
+    parse_usage,
+    record_usage,
+)
+from deadline import annotate, bounded_client, can_afford, deadline_scope, read_deadline, skip
+from doc_screening import apply_flags, describe_check, record_verdict, rejection_result, screen_documents, should_short_circuit
+from ndvi_history import describe_history
+from profiling import pop_profile_flag, profiled
+from stage_cache import run_stage, stage_log
+from tracing import Trace, get_logger, span
 
-def analyze_property(data):
-    """Analyze property and return valuation"""
-    try:
-        client = Groq(api_key=os.getenv('GROQ_API_KEY'))
-        
-        # Get document contents
-        document_contents = data.get('document_contents', [])
-        has_documents = len(document_contents) > 0
-        
-        # Debug log to stderr
-        print(f"[Agent1 DEBUG] Received {len(document_contents)} documents", file=sys.stderr)
-        for i, content in enumerate(document_contents):
-            print(f"[Agent1 DEBUG] Doc {i+1}: {len(content)} chars, preview: {content[:100]}", file=sys.stderr)
-        
-        document_analysis = ""
-        if has_documents:
-            document_analysis = f"\n\nDOCUMENT CONTENTS TO ANALYZE:\n"
-            for i, content in enumerate(document_contents):
-                # Analyze FULL document text, not just first 1000 chars
-                document_analysis += f"\nDocument {i+1} (FULL TEXT - {len(content)} characters):\n{content}\n"
-        
-        prompt = f"""
-Analyze this real estate property according to land document verification standards and provide a valuation in JSON format.
+logger = get_logger('agent1')
 
-PROPERTY DATA:
-Location: {data.get('latitude')}, {data.get('longitude')}
-Satellite Area: {data.get('satellite_data', {}).get('area_sqm', 'N/A')} sqm
-NDVI (vegetation): {data.get('satellite_data', {}).get('ndvi', 'N/A')}
-Documents: {data.get('document_count', 0)} files
-{document_analysis}
+MODEL = "llama-3.3-70b-versatile"
+MAX_TOKENS = 2000
+
+# Under a deadline with less than FULL_ANALYSIS_BUDGET_S left, ask for a brief analysis instead
+FULL_ANALYSIS_BUDGET_S = 20
+BRIEF_MAX_TOKENS = 700
+BRIEF_INSTRUCTION = "\nTIME LIMITED: keep reasoning to two sentences and list at most three risk factors and red flags.\n"
+
+# Bump when the static prefix or the per-property suffix template changes
+PREFIX_VERSION = "agent1-prefix-v1"
+SUFFIX_VERSION = "agent1-suffix-v4"
+
+SYSTEM_PROMPT = "You are an expert real estate appraiser. Analyze property data and provide accurate valuations."
 
-⚠️ CRITICAL: STRICT LAND DOCUMENT VERIFICATION SYSTEM ⚠️
+VERIFICATION_RULES = """⚠️ CRITICAL: STRICT LAND DOCUMENT VERIFICATION SYSTEM ⚠️
 You are analyzing documents for LAND/PROPERTY TOKENIZATION ONLY.
 
 STEP 1: DOCUMENT TYPE CHECK
@@ -62,7 +64,7 @@ STEP 3: VALIDATION RULES
 - If missing ANY mandatory field → authenticity_score = 0-30, list in missing_fields
 - If contains placeholders (TODO, TBD, N/A) → authenticity_score = 0, red_flags: ["Contains placeholder data"]
 - If document appears forged or fraudulent → authenticity_score = 0-20
-- Compare documented area with satellite area ({data.get('satellite_data', {}).get('area_sqm', 'N/A')} sqm)
+- Compare documented area with the Satellite Area given in PROPERTY DATA
 - If area mismatch > 20% → Add "Area mismatch >20% with satellite data" to red_flags
 
 REJECTION CRITERIA (authenticity_score MUST be 0-40 if ANY apply):
@@ -73,57 +75,237 @@ REJECTION CRITERIA (authenticity_score MUST be 0-40 if ANY apply):
 ❌ Missing total area
 ❌ Missing boundaries
 ❌ Contains placeholder or incomplete data
-❌ Document appears forged or fraudulent
+❌ Document appears forged or fraudulent"""
 
-Provide comprehensive analysis. Return ONLY valid JSON:
-{{
-    "valuation": <number in USD, use 0 if rejecting>,
+RESPONSE_SCHEMA = """"valuation": <number in USD, use 0 if rejecting>,
     "confidence": <number 0-100, use 0-30 if rejecting>,
     "reasoning": "<detailed explanation including SPECIFIC findings from document analysis>",
     "risk_factors": ["<risk1>", "<risk2>"],
-    "document_verification": {{
+    "document_verification": {
         "is_land_document": <true/false>,
         "document_type_found": "<what type of document this appears to be>",
         "authenticity_score": <0-100, MUST be 0-30 if not land document or missing mandatory fields>,
         "missing_fields": ["<field1>", "<field2>"],
         "red_flags": ["<flag1>", "<flag2>"]
-    }}
-}}
-"""
-        
-        completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert real estate appraiser. Analyze property data and provide accurate valuations."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
+    }"""
+
+# Checked (and coerced) locally before the orchestrator sees a result; mirrors RESPONSE_SCHEMA
+SCORE = {'type': 'number', 'minimum': 0, 'maximum': 100}
+STRING_LIST = {'type': 'array', 'items': {'type': 'string'}, 'default': []}
+ANALYSIS_SCHEMA = compile_schema({
+    'type': 'object',
+    'required': ['valuation', 'confidence', 'document_verification'],
+    'properties': {
+        'valuation': {'type': 'number', 'minimum': 0},
+        'confidence': SCORE,
+        'reasoning': {'type': 'string', 'default': ''},
+        'risk_factors': STRING_LIST,
+        'document_verification': {
+            'type': 'object',
+            'required': ['authenticity_score'],
+            'properties': {
+                'is_land_document': {'type': 'boolean', 'default': None},
+                'document_type_found': {'type': 'string', 'default': ''},
+                'authenticity_score': SCORE,
+                'missing_fields': STRING_LIST,
+                'red_flags': STRING_LIST,
+            },
+        },
+    },
+})
+
+# Static prefixes are built once from constants only, so they stay byte-identical across calls
+SINGLE_PREFIX = build_static_prefix(SYSTEM_PROMPT, f"""Analyze this real estate property according to land document verification standards and provide a valuation in JSON format.
+
+{VERIFICATION_RULES}
+
+Provide comprehensive analysis. Return ONLY valid JSON:
+{{
+    {RESPONSE_SCHEMA}
+}}""", PREFIX_VERSION)
+
+BATCH_PREFIX = build_static_prefix(SYSTEM_PROMPT, build_batch_instructions(
+    "Analyze these real estate properties according to land document verification standards "
+    f"and provide a valuation for each in JSON format.\n\n{VERIFICATION_RULES}",
+    RESPONSE_SCHEMA.replace('\n', '\n        ')
+), PREFIX_VERSION + "-batch")
+
+
+def build_property_section(data):
+    """Render the per-property data and document contents"""
+    document_contents = data.get('document_contents', [])
+
+    logger.debug("Received %d documents", len(document_contents))
+    for i, content in enumerate(document_contents):
+        logger.debug("Doc %d: %d chars, preview: %s", i + 1, len(content), content[:100])
+
+    document_analysis = ""
+    if document_contents:
+        document_analysis = f"\n\nDOCUMENT CONTENTS TO ANALYZE:\n"
+        for i, content in enumerate(document_contents):
+            # Analyze FULL document text, not just first 1000 chars
+            document_analysis += f"\nDocument {i+1} (FULL TEXT - {len(content)} characters):\n{content}\n"
+
+    satellite_data = data.get('satellite_data', {})
+    area_basis = f" ({satellite_data['area_basis']})" if satellite_data.get('area_basis') else ""
+
+    return f"""PROPERTY DATA:
+Location: {data.get('latitude')}, {data.get('longitude')}
+Satellite Area: {data.get('satellite_data', {}).get('area_sqm', 'N/A')} sqm{area_basis}
+NDVI (vegetation): {data.get('satellite_data', {}).get('ndvi', 'N/A')}{describe_history(data.get('satellite_data', {}).get('ndvi_history'))}
+Documents: {data.get('document_count', 0)} files
+{document_analysis}"""
+
+
+def create_client():
+    """Create the Groq client, loading the SDK and .env only when a request needs them"""
+    from dotenv import load_dotenv
+    from groq import Groq
+
+    load_dotenv()
+    return Groq(api_key=os.getenv('GROQ_API_KEY'))
+
+
+def complete(client, prefix, suffix, max_tokens, usage=None):
+    """Run a single JSON-mode chat completion and return its content"""
+    with span('llm.completion', model=MODEL, prompt_bytes=len(prefix['text']) + len(suffix)) as s:
+        started = time.perf_counter()
+        completion = bounded_client(client).chat.completions.create(
+            model=MODEL,
+            messages=build_messages(prefix, suffix),
             temperature=0.3,
-            max_tokens=2000,
+            max_tokens=max_tokens,
             response_format={"type": "json_object"}
         )
-        
-        result = json.loads(completion.choices[0].message.content)
-        result['agent'] = 'groq'
-        return result
-        
+        record_usage(usage, completion, started)
+        s.set(**parse_usage(completion))
+        return completion.choices[0].message.content
+
+
+def analyze_property(data, client=None, screening=None):
+    """Analyze property and return valuation (screening: a screen_documents result already computed)"""
+    with Trace('agent1') as trace, stage_log() as stages:
+        try:
+            # Near-duplicates of rejected documents and reused survey numbers (AGENT_DOC_INDEX)
+            fingerprints, duplicate_check = screening if screening is not None else screen_documents(data)
+            if should_short_circuit(duplicate_check):
+                result = rejection_result(duplicate_check, 'groq')
+            else:
+                usage = new_usage()
+                
+                with span('prompt.build') as s:
+                    suffix = build_property_section(data) + describe_check(duplicate_check)
+                    max_tokens = MAX_TOKENS
+                    if not can_afford(FULL_ANALYSIS_BUDGET_S):
+                        # Long-form reasoning would not finish before the deadline
+                        skip('agent1.long_reasoning')
+                        suffix += BRIEF_INSTRUCTION
+                        max_tokens = BRIEF_MAX_TOKENS
+                    s.set(bytes=len(suffix), documents=len(data.get('document_contents', [])))
+                
+                def call_model():
+                    # The client (and the SDK import) is only needed when the stage runs
+                    with span('client.init'):
+                        model_client = client or create_client()
+                    content = complete(model_client, SINGLE_PREFIX, suffix, max_tokens, usage)
+                    # Repaired locally when possible; the model is only asked again if that fails
+                    return load_output(content, ANALYSIS_SCHEMA, usage=usage, reask=lambda problem: complete(
+                        model_client, SINGLE_PREFIX, reask_suffix(suffix, problem), max_tokens, usage))
+                
+                # Reused while the prompt, model and documents are unchanged (STAGE_CACHE)
+                inputs = analysis_inputs(SINGLE_PREFIX, suffix, SUFFIX_VERSION, MODEL,
+                                         data.get('document_contents', []), max_tokens)
+                result = run_stage('agent1.analysis', inputs, call_model)
+                result['agent'] = 'groq'
+                result['prompt'] = describe_prompt(SINGLE_PREFIX, suffix, SUFFIX_VERSION)
+                result['usage'] = usage
+                apply_flags(result, duplicate_check)
+                # Only the model's own verdicts are indexed, not rejections the index itself produced
+                record_verdict(fingerprints, result, data)
+            
+        except Exception as e:
+            logger.warning("Analysis failed: %s", e)
+            result = {
+                "error": str(e),
+                "agent": "groq"
+            }
+    
+    result['stages'] = stages
+    result['trace'] = trace.export()
+    return result
+
+
+def analyze_properties(items):
+    """Analyze several properties with shared-instruction batched requests"""
+    try:
+        client = create_client()
     except Exception as e:
-        return {
-            "error": str(e),
-            "agent": "groq"
-        }
+        return {"error": str(e), "agent": "groq"}
+
+    ids = assign_property_ids(items)
+    usage = new_usage()
+    retried = set()
+
+    def analyze_single(j):
+        # Screens, flags and records the verdict itself
+        retried.add(pending[j])
+        result = analyze_property(items[pending[j]], client, screenings[pending[j]])
+        merge_usage(usage, result.pop('usage', None))
+        return result
+
+    with Trace('agent1.batch') as trace:
+        # Each property is screened as in a single request (AGENT_DOC_INDEX);
+        # short-circuited rejections are left out of the batch
+        screenings = [screen_documents(data) for data in items]
+        pending = [i for i, (_, check) in enumerate(screenings) if not should_short_circuit(check)]
+        batched, stats = run_batched(
+            ids=[ids[i] for i in pending],
+            sections=[build_property_section(items[i]) + describe_check(screenings[i][1]) for i in pending],
+            instructions=BATCH_PREFIX['text'],
+            model=MODEL,
+            output_tokens_per_item=MAX_TOKENS,
+            complete=lambda suffix, max_tokens: complete(client, BATCH_PREFIX, suffix, max_tokens, usage),
+            validate=lambda item: conform(ANALYSIS_SCHEMA, item),
+            analyze_single=analyze_single
+        )
+
+    results = [None] * len(items)
+    for i, result in zip(pending, batched):
+        results[i] = result
+        if i not in retried:
+            fingerprints, check = screenings[i]
+            apply_flags(result, check)
+            record_verdict(fingerprints, result, items[i])
+    for i, property_id in enumerate(ids):
+        if results[i] is None:
+            results[i] = rejection_result(screenings[i][1], 'groq')
+        results[i]['property_id'] = property_id
+        results[i]['agent'] = 'groq'
+    stats['short_circuited'] = len(items) - len(pending)
+
+    return {
+        "results": results,
+        "batch": stats,
+        "prompt": {'prefix_version': BATCH_PREFIX['version'], 'prefix_hash': BATCH_PREFIX['hash']},
+        "usage": usage,
+        "trace": trace.export(),
+        "agent": "groq"
+    }
+
 
 if __name__ == "__main__":
-    # Read input from stdin or args
-    if len(sys.argv) > 1:
-        input_data = json.loads(sys.argv[1])
-    else:
-        input_data = json.loads(sys.stdin.read())
+    # --profile / PROFILE=cpu,sample,memory writes profiles to PROFILE_DIR (see profiling.py)
+    args = pop_profile_flag(sys.argv[1:])
     
-    result = analyze_property(input_data)
+    with profiled('agent1'):
+        # Read input from args, an input file or stdin (see agent_input.py)
+        input_data = read_input(args)
+        
+        # Optional "deadline" (Unix time) or "budget_s" bounds every model call (see deadline.py)
+        with deadline_scope(read_deadline(input_data)):
+            if 'properties' in input_data:
+                result = analyze_properties(input_data['properties'])
+            else:
+                result = analyze_property(input_data)
+            annotate(result)
     print(json.dumps(result))
@@ -5,21 +5,47 @@ Property analysis using OpenRouter API with Google Custom Search price data
 import os
 import sys
 import json
+import time
 from datetime import datetime
-from dotenv import load_dotenv
-from openai import OpenAI
 
-# Import price oracle
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from src.services.priceOracle import get_market_valuation
+from agent_batch import assign_property_ids, build_batch_instructions, run_batched
+from agent_input import read_input
+from agent_output import compile_schema, conform, load_output, reask_suffix
+from agent_prompts import (
+    analysis_inputs,
+    build_messages,
+    build_static_prefix,
+    describe_prompt,
+    new_usage,
+    parse_usage,
+    record_usage,
+)
+from deadline import DeadlineExceeded, annotate, bounded_client, can_afford, deadline_scope, read_deadline, skip
+from doc_screening import apply_flags, describe_check, rejection_result, screen_documents, should_short_circuit
+from ndvi_history import describe_history
+from profiling import pop_profile_flag, profiled
+from stage_cache import run_stage, stage_log
+from tracing import Trace, get_logger, span
 
-load_dotenv()
+logger = get_logger('agent2')
 
-# Configure OpenAI client for OpenRouter
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv('OPENROUTER_API_KEY')
-)
+# OpenAI client for OpenRouter, created on first use so cold start stays cheap
+_client = None
+
+MODEL = "openai/gpt-4o-mini"
+
+# Bump when the static prefix or the per-property suffix template changes
+PREFIX_VERSION = "agent2-prefix-v2"
+SUFFIX_VERSION = "agent2-suffix-v5"
+
+# Completion budget reserved per property in batched mode
+REASONING_TOKENS = 600
+
+# Under a deadline, the model is only asked for reasoning with at least this much time left
+REASONING_BUDGET_S = 10
+
+# Offline valuation model; valuation_model.py is only imported when this is on
+VALUATION_MODEL = os.getenv('VALUATION_MODEL', '0').lower() in ('1', 'true', 'yes', 'on')
 
 def calculate_valuation(area_sqm: float, ndvi: float, cloud_coverage: float, document_count: int) -> dict:
     """
@@ -73,93 +99,9 @@ def calculate_valuation(area_sqm: float, ndvi: float, cloud_coverage: float, doc
     
     return result
 
-def analyze_property(data):
-    """Analyze property using OpenRouter with direct API call and market price data"""
-    try:
-        api_key = os.getenv('OPENROUTER_API_KEY')
-        
-        if not api_key:
-            raise ValueError("OPENROUTER_API_KEY not configured")
-        
-        # Extract data
-        satellite_data = data.get('satellite_data', {})
-        area_sqm = satellite_data.get('area_sqm', 200)
-        ndvi = satellite_data.get('ndvi', 0.5)
-        cloud_coverage = satellite_data.get('cloud_coverage', 5)
-        document_count = data.get('document_count', 0)
-        latitude = data.get('latitude', 0)
-        longitude = data.get('longitude', 0)
-        location = data.get('location', f"{latitude},{longitude}")
-        
-        # Fetch market price data from Google Custom Search
-        market_data = {}
-        try:
-            market_data = get_market_valuation(location, latitude, longitude, area_sqm)
-            if not market_data.get('error'):
-                print(f"✓ Market data: ${market_data.get('average_price', 0):,} avg, {market_data.get('price_count', 0)} sources", file=sys.stderr)
-        except Exception as e:
-            print(f"⚠️  Market price fetch failed: {e}", file=sys.stderr)
-        
-        # Calculate valuation with market data influence
-        base_valuation = calculate_valuation(area_sqm, ndvi, cloud_coverage, document_count)
-        
-        # If we have market data, blend it with satellite-based valuation
-        final_valuation = base_valuation['valuation']
-        final_confidence = base_valuation['confidence']
-        
-        if market_data.get('average_price') and not market_data.get('error'):
-            market_price = market_data.get('estimated_valuation', market_data.get('average_price', 0))
-            # Weighted average: 60% market data, 40% satellite data
-            if market_price > 0:
-                final_valuation = int(market_price * 0.6 + base_valuation['valuation'] * 0.4)
-                # Increase confidence if market data available
-                final_confidence = min(95, final_confidence + 10)
-        
-        # Use OpenRouter API for reasoning
-        try:
-            # Get document contents for analysis
-            document_contents = data.get('document_contents', [])
-            has_documents = len(document_contents) > 0
-            
-            # Debug log to stderr
-            print(f"[Agent2 DEBUG] Received {len(document_contents)} documents", file=sys.stderr)
-            for i, content in enumerate(document_contents):
-                print(f"[Agent2 DEBUG] Doc {i+1}: {len(content)} chars, preview: {content[:100]}", file=sys.stderr)
-            
-            document_section = ""
-            if has_documents:
-                document_section = "\n\nACTUAL DOCUMENT CONTENT FOR VERIFICATION:\n"
-                for i, content in enumerate(document_contents):
-                    # Analyze FULL document text, not just first 800 chars
-                    document_section += f"\nDocument {i+1} (FULL TEXT - {len(content)} characters):\n{content}\n"
-            
-            market_info = ""
-            if market_data.get('average_price') and not market_data.get('error'):
-                market_info = f"\n- Market Average: ${market_data.get('average_price', 0):,} ({market_data.get('price_count', 0)} sources)"
-            
-            response = client.chat.completions.create(
-                model="openai/gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a real estate valuation expert specialized in land document verification. You MUST analyze the actual document content provided and verify it matches standard land document templates. REJECT if mandatory fields are missing."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"""Property Analysis (STRICT Land Document Verification):
-
-SATELLITE DATA:
-- Area: {area_sqm} sqm
-- Vegetation Health (NDVI): {ndvi}
-- Cloud Coverage: {cloud_coverage}%
+SYSTEM_PROMPT = "You are a real estate valuation expert specialized in land document verification. You MUST analyze the actual document content provided and verify it matches standard land document templates. REJECT if mandatory fields are missing."
 
-DOCUMENTATION:
-- Documents Submitted: {document_count}
-- Calculated Valuation: ${valuation_result['valuation']:,}
-- Confidence: {valuation_result['confidence']}%{market_info}
-{document_section}
-
-⚠️ CRITICAL: STRICT LAND DOCUMENT TYPE VERIFICATION ⚠️
+VERIFICATION_RULES = """⚠️ CRITICAL: STRICT LAND DOCUMENT TYPE VERIFICATION ⚠️
 This is a LAND/PROPERTY TOKENIZATION system. You must REJECT any document that is NOT a land document.
 
 STEP 1: VERIFY DOCUMENT TYPE
@@ -188,51 +130,355 @@ STEP 3: STRICT VALIDATION RULES
 - Missing total area → REJECT with score 0-20
 - Missing boundaries → REJECT with score 0-30
 - Contains placeholders (TODO, TBD, N/A) → REJECT with score 0
-- Area differs from satellite {area_sqm} sqm by >20% → Flag "Area mismatch >20%"
+- Area differs from the satellite area by >20% → Flag "Area mismatch >20%"
 - Document appears incomplete or fraudulent → REJECT with score 0-30
 
 PROVIDE DETAILED ANALYSIS:
 1. State clearly: Is this a land/property document? If NO → explain why it's being rejected
 2. List SPECIFIC fields found vs missing from the actual document content
-3. Compare documented area with satellite measurement ({area_sqm} sqm)
+3. Compare documented area with the satellite measurement
 4. Identify any red flags or inconsistencies
-5. Give clear verdict: ACCEPT or REJECT with specific reason
+5. Give clear verdict: ACCEPT or REJECT with specific reason"""
 
-Return detailed reasoning (4-5 sentences) with SPECIFIC findings from the document content."""
-                    }
-                ]
-            )
-            
-            reasoning = response.choices[0].message.content
-        except Exception as e:
-            reasoning = f"Analysis based on {area_sqm} sqm property with NDVI {ndvi} and {document_count} documents. "
-            if market_data.get('average_price'):
-                reasoning += f"Market data shows average price of ${market_data.get('average_price', 0):,}. "
-            reasoning += f"Vegetation health indicates {'premium' if ndvi > 0.6 else 'moderate' if ndvi > 0.4 else 'standard'} land quality."
-        
-        result = {
-            "valuation": final_valuation,
-            "confidence": final_confidence,
-            "reasoning": reasoning,
-            "risk_factors": [
-                "Cloud coverage impact" if cloud_coverage > 10 else None,
-                "Limited documentation" if document_count < 2 else None,
-                "Low vegetation index" if ndvi < 0.3 else None,
-                "No market data" if market_data.get('error') else None
-            ],
-            "agent": "openrouter",
-            "market_data": {
-                "has_data": not market_data.get('error'),
-                "average_price": market_data.get('average_price', 0),
-                "source_count": market_data.get('price_count', 0)
-            } if market_data else {}
+REASONING_SCHEMA_TEXT = '''"reasoning": "<detailed reasoning (4-5 sentences) with SPECIFIC findings from the document content>",
+    "verdict": "<ACCEPT or REJECT>"'''
+
+REASONING_INSTRUCTION = f"""Return ONLY valid JSON:
+{{
+    {REASONING_SCHEMA_TEXT}
+}}"""
+
+BATCH_ITEM_SCHEMA = REASONING_SCHEMA_TEXT.replace('\n', '\n        ')
+
+# Checked (and coerced) locally; an unrecognized verdict is dropped rather than failing the reasoning
+REASONING_SCHEMA = compile_schema({
+    'type': 'object',
+    'required': ['reasoning'],
+    'properties': {
+        'reasoning': {'type': 'string', 'minLength': 1},
+        'verdict': {'type': 'string', 'enum': ['ACCEPT', 'REJECT'], 'default': None},
+    },
+})
+
+# Static prefixes are built once from constants only, so they stay byte-identical across calls
+SINGLE_PREFIX = build_static_prefix(
+    SYSTEM_PROMPT,
+    f"Property Analysis (STRICT Land Document Verification):\n\n{VERIFICATION_RULES}\n\n{REASONING_INSTRUCTION}",
+    PREFIX_VERSION
+)
+
+BATCH_PREFIX = build_static_prefix(
+    SYSTEM_PROMPT,
+    build_batch_instructions(f"Property Analysis (STRICT Land Document Verification):\n\n{VERIFICATION_RULES}", BATCH_ITEM_SCHEMA),
+    PREFIX_VERSION + "-batch"
+)
+
+
+def prepare_property(data):
+    """Extract inputs, fetch market data and compute the blended valuation"""
+    satellite_data = data.get('satellite_data', {})
+    latitude = data.get('latitude', 0)
+    longitude = data.get('longitude', 0)
+    context = {
+        'area_sqm': satellite_data.get('area_sqm', 200),
+        'ndvi': satellite_data.get('ndvi', 0.5),
+        'cloud_coverage': satellite_data.get('cloud_coverage', 5),
+        'document_count': data.get('document_count', 0),
+        'document_contents': data.get('document_contents', []),
+        'ndvi_history': satellite_data.get('ndvi_history'),
+        'area_basis': satellite_data.get('area_basis'),
+    }
+    location = data.get('location', f"{latitude},{longitude}")
+    
+    # Fetch market price data from Google Custom Search
+    market_data = {}
+    try:
+        # Imported here so requests only loads when market data is fetched
+        from src.services.priceOracle import get_market_valuation
+        with span('market.fetch') as s:
+            market_data = get_market_valuation(location, latitude, longitude, context['area_sqm'])
+            s.set(sources=market_data.get('price_count', 0), error=bool(market_data.get('error')))
+        if not market_data.get('error'):
+            logger.info("✓ Market data: $%s avg, %d sources", f"{market_data.get('average_price', 0):,}", market_data.get('price_count', 0))
+    except Exception as e:
+        logger.warning("Market price fetch failed: %s", e)
+    
+    # Calculate valuation with market data influence
+    base_valuation = calculate_valuation(context['area_sqm'], context['ndvi'], context['cloud_coverage'], context['document_count'])
+    has_market_price = market_data.get('average_price') and not market_data.get('error')
+    market_price = market_data.get('estimated_valuation', market_data.get('average_price', 0)) if has_market_price else 0
+    
+    if VALUATION_MODEL and market_price > 0:
+        from valuation_model import record_observation
+        # Training data for the offline valuation model
+        record_observation('market', latitude, longitude, context['area_sqm'], context['ndvi'],
+                           context['cloud_coverage'], market_price)
+    elif VALUATION_MODEL:
+        from valuation_model import apply_estimate, estimate_valuation
+        # Without market data, the offline model's estimate replaces the NDVI step function
+        estimate = estimate_valuation(context['area_sqm'], context['ndvi'], context['cloud_coverage'], latitude, longitude)
+        if estimate:
+            logger.info("✓ Valuation model v%d: $%s ($%s - $%s)", estimate['model_version'],
+                        f"{estimate['valuation']:,}", f"{estimate['low']:,}", f"{estimate['high']:,}")
+            base_valuation = apply_estimate(base_valuation, estimate)
+    
+    # If we have market data, blend it with satellite-based valuation
+    final_valuation = base_valuation['valuation']
+    final_confidence = base_valuation['confidence']
+    
+    if has_market_price:
+        # Weighted average: 60% market data, 40% satellite data
+        if market_price > 0:
+            final_valuation = int(market_price * 0.6 + base_valuation['valuation'] * 0.4)
+            # Increase confidence if market data available
+            final_confidence = min(95, final_confidence + 10)
+    
+    context.update({
+        'market_data': market_data,
+        'base_valuation': base_valuation,
+        'final_valuation': final_valuation,
+        'final_confidence': final_confidence,
+    })
+    return context
+
+
+def build_property_section(context):
+    """Render the per-property satellite, documentation and document content block"""
+    document_contents = context['document_contents']
+    market_data = context['market_data']
+    base_valuation = context['base_valuation']
+    
+    logger.debug("Received %d documents", len(document_contents))
+    for i, content in enumerate(document_contents):
+        logger.debug("Doc %d: %d chars, preview: %s", i + 1, len(content), content[:100])
+    
+    document_section = ""
+    if document_contents:
+        document_section = "\n\nACTUAL DOCUMENT CONTENT FOR VERIFICATION:\n"
+        for i, content in enumerate(document_contents):
+            # Analyze FULL document text, not just first 800 chars
+            document_section += f"\nDocument {i+1} (FULL TEXT - {len(content)} characters):\n{content}\n"
+    
+    # Only the offline model's valuations carry an interval
+    valuation_note = ""
+    if 'interval' in base_valuation:
+        from valuation_model import describe_estimate
+        valuation_note = describe_estimate(base_valuation)
+    
+    market_info = ""
+    if market_data.get('average_price') and not market_data.get('error'):
+        market_info = f"\n- Market Average: ${market_data.get('average_price', 0):,} ({market_data.get('price_count', 0)} sources)"
+    
+    return f"""SATELLITE DATA:
+- Area: {context['area_sqm']} sqm{f" ({context['area_basis']})" if context['area_basis'] else ''}
+- Vegetation Health (NDVI): {context['ndvi']}{describe_history(context['ndvi_history'])}
+- Cloud Coverage: {context['cloud_coverage']}%
+
+DOCUMENTATION:
+- Documents Submitted: {context['document_count']}
+- Calculated Valuation: ${base_valuation['valuation']:,}{valuation_note}
+- Confidence: {base_valuation['confidence']}%{market_info}
+{describe_check(context.get('duplicate_check'))}{document_section}"""
+
+
+def fallback_reasoning(context):
+    """Deterministic reasoning used when the LLM call fails"""
+    area_sqm = context['area_sqm']
+    ndvi = context['ndvi']
+    market_data = context['market_data']
+    reasoning = f"Analysis based on {area_sqm} sqm property with NDVI {ndvi} and {context['document_count']} documents. "
+    if market_data.get('average_price'):
+        reasoning += f"Market data shows average price of ${market_data.get('average_price', 0):,}. "
+    reasoning += f"Vegetation health indicates {'premium' if ndvi > 0.6 else 'moderate' if ndvi > 0.4 else 'standard'} land quality."
+    return reasoning
+
+
+def load_env():
+    """Load .env on the code paths that read API keys"""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+def get_client():
+    """Configure the OpenAI client for OpenRouter on first use"""
+    global _client
+    if _client is None:
+        from openai import OpenAI
+
+        load_env()
+        _client = OpenAI(
+            base_url=os.getenv('OPENROUTER_BASE_URL', "https://openrouter.ai/api/v1"),
+            api_key=os.getenv('OPENROUTER_API_KEY')
+        )
+    return _client
+
+
+def complete(prefix, suffix, max_tokens=None, usage=None):
+    """Run a single chat completion and return its content"""
+    options = {"max_tokens": max_tokens} if max_tokens else {}
+    with span('llm.completion', model=MODEL, prompt_bytes=len(prefix['text']) + len(suffix)) as s:
+        started = time.perf_counter()
+        response = bounded_client(get_client()).chat.completions.create(
+            model=MODEL,
+            messages=build_messages(prefix, suffix),
+            **options
+        )
+        record_usage(usage, response, started)
+        s.set(**parse_usage(response))
+        return response.choices[0].message.content
+
+
+def reason(suffix, usage=None):
+    """Long-form reasoning from the model, unless the deadline leaves too little time for it"""
+    if not can_afford(REASONING_BUDGET_S):
+        skip('agent2.reasoning')
+        raise DeadlineExceeded("Not enough time left for reasoning")
+    content = complete(SINGLE_PREFIX, suffix, usage=usage)
+    # Repaired locally when possible; the model is only asked again if that fails
+    return load_output(content, REASONING_SCHEMA, usage=usage,
+                       reask=lambda problem: complete(SINGLE_PREFIX, reask_suffix(suffix, problem), usage=usage))
+
+
+def request_reasoning(context, suffix, usage=None):
+    """Use OpenRouter API for reasoning about a single property"""
+    try:
+        # Reused while the prompt, model and documents are unchanged (STAGE_CACHE)
+        inputs = analysis_inputs(SINGLE_PREFIX, suffix, SUFFIX_VERSION, MODEL, context['document_contents'])
+        return run_stage('agent2.reasoning', inputs, lambda: reason(suffix, usage))
+    except Exception as e:
+        logger.warning("Reasoning request failed, using fallback: %s", e)
+        return {'reasoning': fallback_reasoning(context)}
+
+
+def build_result(context, analysis):
+    """Assemble the agent response for one property"""
+    market_data = context['market_data']
+    cloud_coverage = context['cloud_coverage']
+    document_count = context['document_count']
+    ndvi = context['ndvi']
+    
+    result = {
+        "valuation": context['final_valuation'],
+        "confidence": context['final_confidence'],
+        "reasoning": analysis['reasoning'],
+        "risk_factors": [
+            "Cloud coverage impact" if cloud_coverage > 10 else None,
+            "Limited documentation" if document_count < 2 else None,
+            "Low vegetation index" if ndvi < 0.3 else None,
+            "No market data" if market_data.get('error') else None
+        ],
+        "agent": "openrouter",
+        "market_data": {
+            "has_data": not market_data.get('error'),
+            "average_price": market_data.get('average_price', 0),
+            "source_count": market_data.get('price_count', 0)
+        } if market_data else {}
+    }
+    if 'interval' in context['base_valuation']:
+        result["valuation_model"] = {
+            "version": context['base_valuation']['factors']['model_version'],
+            "interval": context['base_valuation']['interval'],
         }
+    
+    # Filter out None values from risk_factors
+    result["risk_factors"] = [r for r in result["risk_factors"] if r]
+    if analysis.get('verdict'):
+        result["verdict"] = analysis['verdict']
+    
+    return result
+
+
+def analyze_property(data):
+    """Analyze property using OpenRouter with direct API call and market price data"""
+    try:
+        load_env()
+        api_key = os.getenv('OPENROUTER_API_KEY')
         
-        # Filter out None values from risk_factors
-        result["risk_factors"] = [r for r in result["risk_factors"] if r]
+        if not api_key:
+            raise ValueError("OPENROUTER_API_KEY not configured")
         
+        with Trace('agent2') as trace, stage_log() as stages:
+            # Near-duplicates of rejected documents and reused survey numbers (AGENT_DOC_INDEX)
+            _, duplicate_check = screen_documents(data)
+            if should_short_circuit(duplicate_check):
+                result = rejection_result(duplicate_check, 'openrouter')
+            else:
+                context = prepare_property(data)
+                context['duplicate_check'] = duplicate_check
+                with span('prompt.build') as s:
+                    suffix = build_property_section(context)
+                    s.set(bytes=len(suffix), documents=len(context['document_contents']))
+                usage = new_usage()
+                
+                result = build_result(context, request_reasoning(context, suffix, usage))
+                result['prompt'] = describe_prompt(SINGLE_PREFIX, suffix, SUFFIX_VERSION)
+                result['usage'] = usage
+                apply_flags(result, duplicate_check)
+        result['stages'] = stages
+        result['trace'] = trace.export()
         return result
         
+    except Exception as e:
+        logger.warning("Analysis failed: %s", e)
+        return {
+            "error": str(e),
+            "agent": "openrouter"
+        }
+
+
+def analyze_properties(items):
+    """Analyze several properties with shared-instruction batched requests"""
+    try:
+        load_env()
+        if not os.getenv('OPENROUTER_API_KEY'):
+            raise ValueError("OPENROUTER_API_KEY not configured")
+        
+        ids = assign_property_ids(items)
+        with Trace('agent2.batch') as trace:
+            # Each property is screened as in a single request (AGENT_DOC_INDEX);
+            # short-circuited rejections are left out of the batch
+            checks = [screen_documents(data)[1] for data in items]
+            pending = [i for i, check in enumerate(checks) if not should_short_circuit(check)]
+            contexts = []
+            for i in pending:
+                context = prepare_property(items[i])
+                context['duplicate_check'] = checks[i]
+                contexts.append(context)
+            with span('prompt.build', properties=len(pending)) as s:
+                sections = [build_property_section(context) for context in contexts]
+                s.set(bytes=sum(len(section) for section in sections))
+            usage = new_usage()
+            
+            reasonings, stats = run_batched(
+                ids=[ids[i] for i in pending],
+                sections=sections,
+                instructions=BATCH_PREFIX['text'],
+                model=MODEL,
+                output_tokens_per_item=REASONING_TOKENS,
+                complete=lambda suffix, max_tokens: complete(BATCH_PREFIX, suffix, max_tokens, usage),
+                validate=lambda item: conform(REASONING_SCHEMA, item),
+                analyze_single=lambda i: request_reasoning(contexts[i], sections[i], usage)
+            )
+        
+        results = [None] * len(items)
+        for i, context, item in zip(pending, contexts, reasonings):
+            results[i] = build_result(context, item)
+            apply_flags(results[i], checks[i])
+        for i, property_id in enumerate(ids):
+            if results[i] is None:
+                results[i] = rejection_result(checks[i], 'openrouter')
+            results[i]['property_id'] = property_id
+        stats['short_circuited'] = len(items) - len(pending)
+        
+        return {
+            "results": results,
+            "batch": stats,
+            "prompt": {'prefix_version': BATCH_PREFIX['version'], 'prefix_hash': BATCH_PREFIX['hash']},
+            "usage": usage,
+            "trace": trace.export(),
+            "agent": "openrouter"
+        }
+        
     except Exception as e:
         return {
             "error": str(e),
@@ -240,11 +486,18 @@ Return detailed reasoning (4-5 sentences) with SPECIFIC findings from the docume
         }
 
 if __name__ == "__main__":
-    # Read input from stdin or args
-    if len(sys.argv) > 1:
-        input_data = json.loads(sys.argv[1])
-    else:
-        input_data = json.loads(sys.stdin.read())
+    # --profile / PROFILE=cpu,sample,memory writes profiles to PROFILE_DIR (see profiling.py)
+    args = pop_profile_flag(sys.argv[1:])
     
-    result = analyze_property(input_data)
+    with profiled('agent2'):
+        # Read input from args, an input file or stdin (see agent_input.py)
+        input_data = read_input(args)
+        
+        # Optional "deadline" (Unix time) or "budget_s" bounds every network call (see deadline.py)
+        with deadline_scope(read_deadline(input_data)):
+            if 'properties' in input_data:
+                result = analyze_properties(input_data['properties'])
+            else:
+                result = analyze_property(input_data)
+            annotate(result)
     print(json.dumps(result))
@@ -5,17 +5,47 @@ Property analysis using OpenRouter with Llama 3.1
 import os
 import sys
 import json
+import time
 from datetime import datetime
-from dotenv import load_dotenv
-from openai import OpenAI
 
-load_dotenv()
-
-# Configure OpenAI client for OpenRouter
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv('OPENROUTER_API_KEY')
+from agent_batch import assign_property_ids, build_batch_instructions, run_batched
+from agent_input import read_input
+from agent_output import compile_schema, conform, load_output, reask_suffix
+from agent_prompts import (
+    analysis_inputs,
+    build_messages,
+    build_static_prefix,
+    describe_prompt,
+    new_usage,
+    parse_usage,
+    record_usage,
 )
+from deadline import DeadlineExceeded, annotate, bounded_client, can_afford, deadline_scope, read_deadline, skip
+from doc_screening import apply_flags, describe_check, rejection_result, screen_documents, should_short_circuit
+from ndvi_history import describe_history
+from profiling import pop_profile_flag, profiled
+from stage_cache import run_stage, stage_log
+from tracing import Trace, get_logger, span
+
+logger = get_logger('agent3')
+
+# OpenAI client for OpenRouter, created on first use so cold start stays cheap
+_client = None
+
+MODEL = "meta-llama/llama-3.1-8b-instruct:free"
+
+# Bump when the static prefix or the per-property suffix template changes
+PREFIX_VERSION = "agent3-prefix-v2"
+SUFFIX_VERSION = "agent3-suffix-v5"
+
+# Completion budget reserved per property in batched mode
+REASONING_TOKENS = 400
+
+# Under a deadline, the model is only asked for reasoning with at least this much time left
+REASONING_BUDGET_S = 10
+
+# Offline valuation model; valuation_model.py is only imported when this is on
+VALUATION_MODEL = os.getenv('VALUATION_MODEL', '0').lower() in ('1', 'true', 'yes', 'on')
 
 def calculate_valuation(area_sqm: float, ndvi: float, cloud_coverage: float, document_count: int) -> dict:
     """
@@ -63,65 +93,9 @@ def calculate_valuation(area_sqm: float, ndvi: float, cloud_coverage: float, doc
         "confidence": max(55, min(95, confidence))
     }
 
-def analyze_property(data):
-    """Analyze property using OpenRouter with Llama 3.1"""
-    try:
-        api_key = os.getenv('OPENROUTER_API_KEY')
-        
-        if not api_key:
-            raise ValueError("OPENROUTER_API_KEY not configured")
-        
-        # Extract data
-        satellite_data = data.get('satellite_data', {})
-        area_sqm = satellite_data.get('area_sqm', 200)
-        ndvi = satellite_data.get('ndvi', 0.5)
-        cloud_coverage = satellite_data.get('cloud_coverage', 5)
-        document_count = data.get('document_count', 0)
-        
-        # Calculate valuation directly
-        valuation_result = calculate_valuation(area_sqm, ndvi, cloud_coverage, document_count)
-        
-        # Get document contents for analysis
-        document_contents = data.get('document_contents', [])
-        has_documents = len(document_contents) > 0
-        
-        # Debug log to stderr
-        print(f"[Agent3 DEBUG] Received {len(document_contents)} documents", file=sys.stderr)
-        for i, content in enumerate(document_contents):
-            print(f"[Agent3 DEBUG] Doc {i+1}: {len(content)} chars, preview: {content[:100]}", file=sys.stderr)
-        
-        document_text = ""
-        if has_documents:
-            document_text = "\n\nDOCUMENT CONTENT FOR VERIFICATION:\n"
-            for i, content in enumerate(document_contents):
-                # Analyze FULL document text, not just first 800 chars
-                document_text += f"\nDocument {i+1} (FULL TEXT - {len(content)} characters):\n{content}\n"
-        
-        # Use OpenRouter API for reasoning with Llama 3.1
-        try:
-            response = client.chat.completions.create(
-                model="meta-llama/llama-3.1-8b-instruct:free",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a certified land surveyor and real estate expert specializing in land document verification. You MUST analyze actual document content and verify it contains all mandatory fields required for land documents. REJECT documents that don't meet standards."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"""STRICT Land Document Verification & Property Authentication:
-
-SATELLITE MEASUREMENTS:
-- Measured Area: {area_sqm} sqm
-- Vegetation Index (NDVI): {ndvi}
-- Image Quality (Cloud Coverage): {cloud_coverage}%
-
-SUBMITTED DOCUMENTATION:
-- Document Count: {document_count}
-- Preliminary Valuation: ${valuation_result['valuation']:,}
-- Data Confidence: {valuation_result['confidence']}%
-{document_text}
+SYSTEM_PROMPT = "You are a certified land surveyor and real estate expert specializing in land document verification. You MUST analyze actual document content and verify it contains all mandatory fields required for land documents. REJECT documents that don't meet standards."
 
-⚠️ CRITICAL: STRICT DOCUMENT TYPE VERIFICATION ⚠️
+VERIFICATION_RULES = """⚠️ CRITICAL: STRICT DOCUMENT TYPE VERIFICATION ⚠️
 This system ONLY accepts LAND/PROPERTY DOCUMENTS for tokenization.
 
 STEP 1: DOCUMENT TYPE AUTHENTICATION
@@ -132,7 +106,7 @@ The submitted document MUST be a recognized land document:
 If document is NOT a land/property document → REJECT IMMEDIATELY with score 0
 
 STEP 2: MANDATORY LAND DOCUMENT FIELD VERIFICATION
-Analyze the ACTUAL document content above and verify ALL these fields are present:
+Analyze the ACTUAL document content and verify ALL these fields are present:
 
 CRITICAL FIELDS (ALL required):
 1. Survey Number / Plot Number / Deed Number - Property unique identifier
@@ -153,7 +127,7 @@ STEP 3: VALIDATION & REJECTION RULES
 ✗ Missing total area → Score: 0-20, Reason: "Property size not documented"
 ✗ Missing boundaries → Score: 0-25, Reason: "Boundary description missing"
 ✗ Contains placeholders (TODO, TBD, N/A, etc.) → Score: 0, Reason: "Incomplete document"
-✗ Area mismatch >20% from satellite ({area_sqm} sqm) → Flag: "Area discrepancy detected"
+✗ Area mismatch >20% from the measured satellite area → Flag: "Area discrepancy detected"
 ✗ Document appears forged or fraudulent → Score: 0-10, Reason: "Suspicious document"
 
 AUTHENTICATION ANALYSIS REQUIRED:
@@ -161,33 +135,288 @@ AUTHENTICATION ANALYSIS REQUIRED:
 2. List which mandatory fields ARE present from actual content
 3. List which mandatory fields are MISSING
 4. Compare documented area with satellite measurement
-5. State authenticity verdict: AUTHENTIC or REJECTED with specific reason
+5. State authenticity verdict: AUTHENTIC or REJECTED with specific reason"""
 
-Provide detailed professional analysis (3-4 sentences) with SPECIFIC findings, listing exactly which fields were found or missing from the document content above."""
-                    }
-                ]
-            )
-            
-            reasoning = response.choices[0].message.content
-        except Exception as e:
-            reasoning = f"Analysis based on {area_sqm} sqm property with NDVI {ndvi} and {document_count} documents. Vegetation health and area indicate {'strong' if ndvi > 0.6 else 'moderate' if ndvi > 0.4 else 'fair'} land quality with documentation {'complete' if document_count >= 2 else 'limited'}."
+REASONING_SCHEMA_TEXT = '''"reasoning": "<detailed professional analysis (3-4 sentences) listing exactly which fields were found or missing>",
+    "verdict": "<AUTHENTIC or REJECTED>"'''
+
+REASONING_INSTRUCTION = f"""Provide detailed professional analysis with SPECIFIC findings from the document content provided below. Return ONLY valid JSON:
+{{
+    {REASONING_SCHEMA_TEXT}
+}}"""
+
+BATCH_ITEM_SCHEMA = REASONING_SCHEMA_TEXT.replace('\n', '\n        ')
+
+# Checked (and coerced) locally; an unrecognized verdict is dropped rather than failing the reasoning
+REASONING_SCHEMA = compile_schema({
+    'type': 'object',
+    'required': ['reasoning'],
+    'properties': {
+        'reasoning': {'type': 'string', 'minLength': 1},
+        'verdict': {'type': 'string', 'enum': ['AUTHENTIC', 'REJECTED'], 'default': None},
+    },
+})
+
+# Static prefixes are built once from constants only, so they stay byte-identical across calls
+SINGLE_PREFIX = build_static_prefix(
+    SYSTEM_PROMPT,
+    f"STRICT Land Document Verification & Property Authentication:\n\n{VERIFICATION_RULES}\n\n{REASONING_INSTRUCTION}",
+    PREFIX_VERSION
+)
+
+BATCH_PREFIX = build_static_prefix(
+    SYSTEM_PROMPT,
+    build_batch_instructions(f"STRICT Land Document Verification & Property Authentication:\n\n{VERIFICATION_RULES}", BATCH_ITEM_SCHEMA),
+    PREFIX_VERSION + "-batch"
+)
+
+
+def prepare_property(data):
+    """Extract inputs and compute the satellite-based valuation"""
+    satellite_data = data.get('satellite_data', {})
+    context = {
+        'area_sqm': satellite_data.get('area_sqm', 200),
+        'ndvi': satellite_data.get('ndvi', 0.5),
+        'cloud_coverage': satellite_data.get('cloud_coverage', 5),
+        'document_count': data.get('document_count', 0),
+        'document_contents': data.get('document_contents', []),
+        'ndvi_history': satellite_data.get('ndvi_history'),
+        'area_basis': satellite_data.get('area_basis'),
+    }
+    
+    # Calculate valuation directly
+    context['valuation_result'] = calculate_valuation(
+        context['area_sqm'], context['ndvi'], context['cloud_coverage'], context['document_count']
+    )
+    if VALUATION_MODEL:
+        from valuation_model import apply_estimate, estimate_valuation
+        # The offline valuation model, when fitted, replaces the NDVI step function
+        estimate = estimate_valuation(context['area_sqm'], context['ndvi'], context['cloud_coverage'],
+                                      data.get('latitude', 0), data.get('longitude', 0))
+        if estimate:
+            context['valuation_result'] = apply_estimate(context['valuation_result'], estimate)
+    return context
+
+
+def build_property_section(context):
+    """Render the per-property measurements, documentation and document content block"""
+    document_contents = context['document_contents']
+    valuation_result = context['valuation_result']
+    
+    logger.debug("Received %d documents", len(document_contents))
+    for i, content in enumerate(document_contents):
+        logger.debug("Doc %d: %d chars, preview: %s", i + 1, len(content), content[:100])
+    
+    # Only the offline model's valuations carry an interval
+    valuation_note = ""
+    if 'interval' in valuation_result:
+        from valuation_model import describe_estimate
+        valuation_note = describe_estimate(valuation_result)
+    
+    document_text = ""
+    if document_contents:
+        document_text = "\n\nDOCUMENT CONTENT FOR VERIFICATION:\n"
+        for i, content in enumerate(document_contents):
+            # Analyze FULL document text, not just first 800 chars
+            document_text += f"\nDocument {i+1} (FULL TEXT - {len(content)} characters):\n{content}\n"
+    
+    return f"""SATELLITE MEASUREMENTS:
+- Measured Area: {context['area_sqm']} sqm{f" ({context['area_basis']})" if context['area_basis'] else ''}
+- Vegetation Index (NDVI): {context['ndvi']}{describe_history(context['ndvi_history'])}
+- Image Quality (Cloud Coverage): {context['cloud_coverage']}%
+
+SUBMITTED DOCUMENTATION:
+- Document Count: {context['document_count']}
+- Preliminary Valuation: ${valuation_result['valuation']:,}{valuation_note}
+- Data Confidence: {valuation_result['confidence']}%
+{describe_check(context.get('duplicate_check'))}{document_text}"""
+
+
+def fallback_reasoning(context):
+    """Deterministic reasoning used when the LLM call fails"""
+    ndvi = context['ndvi']
+    document_count = context['document_count']
+    return f"Analysis based on {context['area_sqm']} sqm property with NDVI {ndvi} and {document_count} documents. Vegetation health and area indicate {'strong' if ndvi > 0.6 else 'moderate' if ndvi > 0.4 else 'fair'} land quality with documentation {'complete' if document_count >= 2 else 'limited'}."
+
+
+def load_env():
+    """Load .env on the code paths that read API keys"""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+def get_client():
+    """Configure the OpenAI client for OpenRouter on first use"""
+    global _client
+    if _client is None:
+        from openai import OpenAI
+
+        load_env()
+        _client = OpenAI(
+            base_url=os.getenv('OPENROUTER_BASE_URL', "https://openrouter.ai/api/v1"),
+            api_key=os.getenv('OPENROUTER_API_KEY')
+        )
+    return _client
+
+
+def complete(prefix, suffix, max_tokens=None, usage=None):
+    """Run a single chat completion and return its content"""
+    options = {"max_tokens": max_tokens} if max_tokens else {}
+    with span('llm.completion', model=MODEL, prompt_bytes=len(prefix['text']) + len(suffix)) as s:
+        started = time.perf_counter()
+        response = bounded_client(get_client()).chat.completions.create(
+            model=MODEL,
+            messages=build_messages(prefix, suffix),
+            **options
+        )
+        record_usage(usage, response, started)
+        s.set(**parse_usage(response))
+        return response.choices[0].message.content
+
+
+def reason(suffix, usage=None):
+    """Long-form reasoning from the model, unless the deadline leaves too little time for it"""
+    if not can_afford(REASONING_BUDGET_S):
+        skip('agent3.reasoning')
+        raise DeadlineExceeded("Not enough time left for reasoning")
+    content = complete(SINGLE_PREFIX, suffix, usage=usage)
+    # Repaired locally when possible; the model is only asked again if that fails
+    return load_output(content, REASONING_SCHEMA, usage=usage,
+                       reask=lambda problem: complete(SINGLE_PREFIX, reask_suffix(suffix, problem), usage=usage))
+
+
+def request_reasoning(context, suffix, usage=None):
+    """Use OpenRouter API for reasoning with Llama 3.1 about a single property"""
+    try:
+        # Reused while the prompt, model and documents are unchanged (STAGE_CACHE)
+        inputs = analysis_inputs(SINGLE_PREFIX, suffix, SUFFIX_VERSION, MODEL, context['document_contents'])
+        return run_stage('agent3.reasoning', inputs, lambda: reason(suffix, usage))
+    except Exception as e:
+        logger.warning("Reasoning request failed, using fallback: %s", e)
+        return {'reasoning': fallback_reasoning(context)}
+
+
+def build_result(context, analysis):
+    """Assemble the agent response for one property"""
+    cloud_coverage = context['cloud_coverage']
+    document_count = context['document_count']
+    ndvi = context['ndvi']
+    
+    result = {
+        "valuation": context['valuation_result']["valuation"],
+        "confidence": context['valuation_result']["confidence"],
+        "reasoning": analysis['reasoning'],
+        "risk_factors": [
+            "High cloud coverage" if cloud_coverage > 15 else None,
+            "Insufficient documentation" if document_count < 2 else None,
+            "Poor vegetation health" if ndvi < 0.25 else None
+        ],
+        "agent": "llama"
+    }
+    if 'interval' in context['valuation_result']:
+        result["valuation_model"] = {
+            "version": context['valuation_result']['factors']['model_version'],
+            "interval": context['valuation_result']['interval'],
+        }
+    
+    # Filter out None values from risk_factors
+    result["risk_factors"] = [r for r in result["risk_factors"] if r]
+    if analysis.get('verdict'):
+        result["verdict"] = analysis['verdict']
+    
+    return result
+
+
+def analyze_property(data):
+    """Analyze property using OpenRouter with Llama 3.1"""
+    try:
+        load_env()
+        api_key = os.getenv('OPENROUTER_API_KEY')
+        
+        if not api_key:
+            raise ValueError("OPENROUTER_API_KEY not configured")
         
-        result = {
-            "valuation": valuation_result["valuation"],
-            "confidence": valuation_result["confidence"],
-            "reasoning": reasoning,
-            "risk_factors": [
-                "High cloud coverage" if cloud_coverage > 15 else None,
-                "Insufficient documentation" if document_count < 2 else None,
-                "Poor vegetation health" if ndvi < 0.25 else None
-            ],
+        with Trace('agent3') as trace, stage_log() as stages:
+            # Near-duplicates of rejected documents and reused survey numbers (AGENT_DOC_INDEX)
+            _, duplicate_check = screen_documents(data)
+            if should_short_circuit(duplicate_check):
+                result = rejection_result(duplicate_check, 'llama')
+            else:
+                context = prepare_property(data)
+                context['duplicate_check'] = duplicate_check
+                with span('prompt.build') as s:
+                    suffix = build_property_section(context)
+                    s.set(bytes=len(suffix), documents=len(context['document_contents']))
+                usage = new_usage()
+                
+                result = build_result(context, request_reasoning(context, suffix, usage))
+                result['prompt'] = describe_prompt(SINGLE_PREFIX, suffix, SUFFIX_VERSION)
+                result['usage'] = usage
+                apply_flags(result, duplicate_check)
+        result['stages'] = stages
+        result['trace'] = trace.export()
+        return result
+        
+    except Exception as e:
+        logger.warning("Analysis failed: %s", e)
+        return {
+            "error": str(e),
             "agent": "llama"
         }
+
+
+def analyze_properties(items):
+    """Analyze several properties with shared-instruction batched requests"""
+    try:
+        load_env()
+        if not os.getenv('OPENROUTER_API_KEY'):
+            raise ValueError("OPENROUTER_API_KEY not configured")
         
-        # Filter out None values from risk_factors
-        result["risk_factors"] = [r for r in result["risk_factors"] if r]
+        ids = assign_property_ids(items)
+        with Trace('agent3.batch') as trace:
+            # Each property is screened as in a single request (AGENT_DOC_INDEX);
+            # short-circuited rejections are left out of the batch
+            checks = [screen_documents(data)[1] for data in items]
+            pending = [i for i, check in enumerate(checks) if not should_short_circuit(check)]
+            contexts = []
+            for i in pending:
+                context = prepare_property(items[i])
+                context['duplicate_check'] = checks[i]
+                contexts.append(context)
+            with span('prompt.build', properties=len(pending)) as s:
+                sections = [build_property_section(context) for context in contexts]
+                s.set(bytes=sum(len(section) for section in sections))
+            usage = new_usage()
+            
+            reasonings, stats = run_batched(
+                ids=[ids[i] for i in pending],
+                sections=sections,
+                instructions=BATCH_PREFIX['text'],
+                model=MODEL,
+                output_tokens_per_item=REASONING_TOKENS,
+                complete=lambda suffix, max_tokens: complete(BATCH_PREFIX, suffix, max_tokens, usage),
+                validate=lambda item: conform(REASONING_SCHEMA, item),
+                analyze_single=lambda i: request_reasoning(contexts[i], sections[i], usage)
+            )
         
-        return result
+        results = [None] * len(items)
+        for i, context, item in zip(pending, contexts, reasonings):
+            results[i] = build_result(context, item)
+            apply_flags(results[i], checks[i])
+        for i, property_id in enumerate(ids):
+            if results[i] is None:
+                results[i] = rejection_result(checks[i], 'llama')
+            results[i]['property_id'] = property_id
+        stats['short_circuited'] = len(items) - len(pending)
+        
+        return {
+            "results": results,
+            "batch": stats,
+            "prompt": {'prefix_version': BATCH_PREFIX['version'], 'prefix_hash': BATCH_PREFIX['hash']},
+            "usage": usage,
+            "trace": trace.export(),
+            "agent": "llama"
+        }
         
     except Exception as e:
         return {
@@ -196,11 +425,18 @@ Provide detailed professional analysis (3-4 sentences) with SPECIFIC findings, l
         }
 
 if __name__ == "__main__":
-    # Read input from stdin or args
-    if len(sys.argv) > 1:
-        input_data = json.loads(sys.argv[1])
-    else:
-        input_data = json.loads(sys.stdin.read())
+    # --profile / PROFILE=cpu,sample,memory writes profiles to PROFILE_DIR (see profiling.py)
+    args = pop_profile_flag(sys.argv[1:])
     
-    result = analyze_property(input_data)
+    with profiled('agent3'):
+        # Read input from args, an input file or stdin (see agent_input.py)
+        input_data = read_input(args)
+        
+        # Optional "deadline" (Unix time) or "budget_s" bounds every network call (see deadline.py)
+        with deadline_scope(read_deadline(input_data)):
+            if 'properties' in input_data:
+                result = analyze_properties(input_data['properties'])
+            else:
+                result = analyze_property(input_data)
+            annotate(result)
     print(json.dumps(result))
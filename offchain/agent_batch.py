@@ -0,0 +1,192 @@
+"""
+Batched Property Analysis
+Packs several properties into one chat completion for bulk re-verification
+"""
+from agent_output import OutputError, repair_json
+from tracing import get_logger, span
+
+logger = get_logger('agent_batch')
+
+# Context window / max completion tokens for the models used by the agents
+MODEL_LIMITS = {
+    'llama-3.3-70b-versatile': {'context': 131072, 'output': 32768},
+    'openai/gpt-4o-mini': {'context': 128000, 'output': 16384},
+    'meta-llama/llama-3.1-8b-instruct:free': {'context': 131072, 'output': 8192},
+}
+DEFAULT_MODEL_LIMITS = {'context': 8192, 'output': 4096}
+
+# Rough chars-per-token ratio for English prompt text
+CHARS_PER_TOKEN = 4
+
+# Upper bound on properties per request, even if the context would fit more
+MAX_BATCH_SIZE = 10
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used for batch planning"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def assign_property_ids(items: list) -> list:
+    """Unique per-property IDs used to match batched responses to inputs"""
+    ids, used = [], set()
+    for index, data in enumerate(items):
+        base = str(data.get('property_id') or data.get('request_id') or f"property-{index + 1}")
+        property_id, suffix = base, index + 1
+        # A suffixed ID can itself be taken (["a", "a#3", "a"]), so keep counting until it is free
+        while property_id in used:
+            property_id = f"{base}#{suffix}"
+            suffix += 1
+        used.add(property_id)
+        ids.append(property_id)
+    return ids
+
+
+def plan_batches(sections: list, fixed_tokens: int, model: str, output_tokens_per_item: int,
+                 max_batch_size: int = MAX_BATCH_SIZE) -> list:
+    """
+    Group property sections into batches that fit the model's limits.
+
+    Args:
+        sections: Rendered per-property prompt sections
+        fixed_tokens: Tokens taken by the shared instructions
+        model: Model name used to look up context/output limits
+        output_tokens_per_item: Completion budget reserved per property
+        max_batch_size: Hard cap on properties per batch
+
+    Returns:
+        List of batches, each a list of indexes into sections
+    """
+    limits = MODEL_LIMITS.get(model, DEFAULT_MODEL_LIMITS)
+    input_budget = max(0, limits['context'] - fixed_tokens)
+    items_by_output = max(1, limits['output'] // max(1, output_tokens_per_item))
+    batch_cap = max(1, min(max_batch_size, items_by_output))
+
+    batches = []
+    current = []
+    used = 0
+    for index, section in enumerate(sections):
+        cost = estimate_tokens(section) + output_tokens_per_item
+        if current and (used + cost > input_budget or len(current) >= batch_cap):
+            batches.append(current)
+            current = []
+            used = 0
+        current.append(index)
+        used += cost
+    if current:
+        batches.append(current)
+
+    return batches
+
+
+def build_batch_instructions(instructions: str, item_schema: str) -> str:
+    """Static batch instructions: shared rules plus the JSON-array response schema"""
+    return f"""{instructions}
+
+BATCH ANALYSIS: Several properties follow, each between PROPERTY markers. Analyze EACH property
+independently and never mix findings between properties.
+
+Return ONLY valid JSON with exactly one entry per property ID:
+{{
+    "results": [
+        {{
+            "property_id": "<property ID exactly as given>",
+            {item_schema}
+        }}
+    ]
+}}"""
+
+
+def build_batch_suffix(sections: dict) -> str:
+    """Variable part of a batched prompt: every property section, tagged by ID"""
+    suffix = f"PROPERTIES IN THIS BATCH: {len(sections)}\n"
+    for property_id, section in sections.items():
+        suffix += f"\n=== PROPERTY {property_id} ===\n{section}\n=== END PROPERTY {property_id} ===\n"
+    return suffix
+
+
+def parse_batch_response(content: str) -> tuple:
+    """Parse the batched response into a list of per-property objects, plus the repairs it needed"""
+    try:
+        # Models without JSON mode sometimes wrap the object in prose or run out of tokens
+        parsed, repairs = repair_json(content)
+    except OutputError:
+        return [], []
+
+    if isinstance(parsed, dict):
+        parsed = parsed.get('results', [])
+    return (parsed if isinstance(parsed, list) else []), repairs
+
+
+def split_batch_response(content: str, expected_ids: list, validate) -> tuple:
+    """
+    Split a batched response into validated per-property results.
+
+    Returns:
+        (results keyed by property ID, list of property IDs that failed, repairs applied)
+    """
+    results = {}
+    items, repairs = parse_batch_response(content)
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        property_id = str(item.pop('property_id', ''))
+        if property_id in expected_ids and property_id not in results:
+            item = validate(item)
+            if item is not None:
+                results[property_id] = item
+
+    failed = [property_id for property_id in expected_ids if property_id not in results]
+    return results, failed, repairs
+
+
+def run_batched(ids: list, sections: list, instructions: str, model: str,
+                output_tokens_per_item: int, complete, validate, analyze_single) -> tuple:
+    """
+    Analyze properties in batches, retrying failed items individually.
+
+    Args:
+        ids: Property IDs, one per section
+        sections: Rendered per-property prompt sections
+        instructions: Static batch instructions from build_batch_instructions
+        model: Model name used for batch sizing
+        output_tokens_per_item: Completion budget reserved per property
+        complete: Callable(suffix, max_tokens) -> response text
+        validate: Callable(item) -> the coerced result, or None if it does not fit the schema
+        analyze_single: Callable(index) -> result, used for failed items
+
+    Returns:
+        (results in input order, batch statistics)
+    """
+    batches = plan_batches(sections, estimate_tokens(instructions), model, output_tokens_per_item)
+    results = [None] * len(ids)
+    stats = {'properties': len(ids), 'batches': len(batches), 'batched': 0, 'retried': 0, 'repaired': 0}
+
+    for batch in batches:
+        batch_ids = [ids[i] for i in batch]
+        suffix = build_batch_suffix({ids[i]: sections[i] for i in batch})
+
+        try:
+            with span('batch.completion', properties=len(batch), bytes=len(suffix)):
+                content = complete(suffix, output_tokens_per_item * len(batch))
+            parsed, failed, repairs = split_batch_response(content, batch_ids, validate)
+            if repairs:
+                logger.info("🔧 Repaired batch response locally: %s", ', '.join(repairs))
+                stats['repaired'] += 1
+        except Exception as e:
+            logger.warning("Batch of %d failed, retrying individually: %s", len(batch), e)
+            parsed, failed = {}, batch_ids
+
+        for i in batch:
+            if ids[i] in parsed:
+                results[i] = parsed[ids[i]]
+                stats['batched'] += 1
+
+        if failed:
+            logger.info("Retrying %d of %d properties individually", len(failed), len(batch))
+        for i in batch:
+            if ids[i] in failed:
+                results[i] = analyze_single(i)
+                stats['retried'] += 1
+
+    return results, stats
@@ -0,0 +1,203 @@
+"""
+Agent Input Protocol
+Reads agent requests from argv, files or stdin, with documents passed by reference
+
+Supported inputs:
+    python agent1.py '<json>'                     # legacy: whole request in argv
+    python agent1.py < request.json               # legacy: whole request on stdin
+    python agent1.py --input request.json         # request file (JSON or msgpack)
+    python agent1.py --framing ndjson < stream    # line 1: request, then one JSON string per document
+    python agent1.py --framing msgpack < stream   # msgpack request object, then one object per document
+
+Instead of inlining OCR text in `document_contents`, a request may list
+`document_refs`, each either {"path": "/abs/file.txt"} or {"sha256": "<hex>"}
+pointing into the local document store. Referenced files are read through
+mmap and decoded once, so large documents skip argv limits and the
+JSON-escape / parse copies.
+
+Inline documents are parsed like any JSON: a request file costs one decoded
+copy plus the parsed request at peak, and the streamed framings parse one
+document frame at a time. `python benchmark.py --filter input` reports
+parse time and peak RSS for a multi-MB request on each path.
+"""
+import hashlib
+import json
+import mmap
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Content-addressed store for document text, laid out as <store>/<sha[:2]>/<sha>
+DOCUMENT_STORE_DIR = os.getenv('DOCUMENT_STORE_DIR', os.path.join(BASE_DIR, '.document-store'))
+
+# Chunk size for streamed stdin reads
+STREAM_CHUNK_BYTES = 1 << 16
+
+
+def store_path(digest: str) -> str:
+    """Location of a document in the local store"""
+    return os.path.join(DOCUMENT_STORE_DIR, digest[:2], digest)
+
+
+def put_document(content) -> str:
+    """Write document text into the store and return its sha256"""
+    data = content.encode('utf-8') if isinstance(content, str) else content
+    digest = hashlib.sha256(data).hexdigest()
+    path = store_path(digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return digest
+
+
+def read_mapped_text(path: str, expected_sha256: str = None) -> str:
+    """Decode a UTF-8 file through mmap, optionally verifying its hash"""
+    with open(path, 'rb') as f:
+        # mmap cannot map empty files
+        empty = os.fstat(f.fileno()).st_size == 0
+        content = b'' if empty else mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if expected_sha256 and hashlib.sha256(content).hexdigest() != expected_sha256:
+                raise ValueError(f"Document hash mismatch for {path}")
+            return str(content, 'utf-8', 'replace')
+        finally:
+            if not empty:
+                content.close()
+
+
+def resolve_document_ref(ref) -> str:
+    """Load one document reference ({"path": ...} or {"sha256": ...})"""
+    if isinstance(ref, str):
+        ref = {'path': ref}
+    if ref.get('sha256'):
+        digest = ref['sha256'].lower()
+        return read_mapped_text(ref.get('path') or store_path(digest), digest)
+    if ref.get('path'):
+        return read_mapped_text(ref['path'])
+    raise ValueError(f"Invalid document reference: {ref}")
+
+
+def resolve_documents(data: dict) -> dict:
+    """Append referenced documents to document_contents"""
+    refs = data.pop('document_refs', None)
+    if refs:
+        contents = list(data.get('document_contents') or [])
+        contents.extend(resolve_document_ref(ref) for ref in refs)
+        data['document_contents'] = contents
+
+    # Batched requests carry their own per-property references
+    for item in data.get('properties') or []:
+        resolve_documents(item)
+    return data
+
+
+def _load_msgpack():
+    """msgpack is optional; only the msgpack framings need it"""
+    try:
+        import msgpack
+    except ImportError:
+        raise ValueError("msgpack input requires the msgpack package (pip install msgpack)")
+    return msgpack
+
+
+def _decode_document(value) -> str:
+    return value.decode('utf-8', 'replace') if isinstance(value, (bytes, bytearray)) else value
+
+
+def _is_json(buffer) -> bool:
+    head = bytes(buffer[:64]).lstrip()
+    return not head or head[:1] in (b'{', b'[')
+
+
+def load_payload(buffer) -> dict:
+    """Parse a complete request held in memory (JSON or msgpack)"""
+    if _is_json(buffer):
+        return json.loads(buffer)
+    return _load_msgpack().unpackb(buffer, raw=False)
+
+
+def load_file(path: str) -> dict:
+    """
+    Parse a request file (JSON or msgpack).
+
+    JSON is decoded straight from a read-only mapping, which is released
+    before parsing, so the peak is one decoded copy of the file plus the
+    parsed request. msgpack is unpacked from the mapping itself.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"Empty input file: {path}")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if not _is_json(mapped):
+                return _load_msgpack().unpackb(mapped, raw=False)
+            text = str(mapped, 'utf-8')
+    return json.loads(text)
+
+
+def read_ndjson_stream(stream) -> dict:
+    """First line is the request object; each following line is one document as a JSON string"""
+    data = json.loads(stream.readline())
+    contents = list(data.get('document_contents') or [])
+    for line in stream:
+        if line.strip():
+            contents.append(json.loads(line))
+    data['document_contents'] = contents
+    return data
+
+
+def read_msgpack_stream(stream) -> dict:
+    """First object is the request map; each following object is one document"""
+    unpacker = _load_msgpack().Unpacker(raw=False, max_buffer_size=0)
+    data = None
+    contents = []
+    while True:
+        chunk = stream.read(STREAM_CHUNK_BYTES)
+        if not chunk:
+            break
+        unpacker.feed(chunk)
+        for obj in unpacker:
+            if data is None:
+                data = obj
+                contents = list(data.get('document_contents') or [])
+            else:
+                contents.append(_decode_document(obj))
+    if data is None:
+        raise ValueError("Empty msgpack input stream")
+    data['document_contents'] = contents
+    return data
+
+
+def read_input(args: list, stdin=None) -> dict:
+    """Read an agent request from command-line args or stdin and resolve document references"""
+    stdin = stdin or sys.stdin.buffer
+
+    if len(args) >= 2 and args[0] == '--input':
+        data = load_file(args[1])
+    elif len(args) >= 2 and args[0] == '--framing':
+        if args[1] == 'ndjson':
+            data = read_ndjson_stream(stdin)
+        elif args[1] == 'msgpack':
+            data = read_msgpack_stream(stdin)
+        else:
+            raise ValueError(f"Unknown framing: {args[1]}")
+    elif args:
+        data = json.loads(args[0])
+    else:
+        data = load_payload(stdin.read())
+
+    return resolve_documents(data)
+
+
+if __name__ == "__main__":
+    # Add documents to the local store: python agent_input.py put <file> [<file> ...]
+    if len(sys.argv) > 2 and sys.argv[1] == 'put':
+        for path in sys.argv[2:]:
+            with open(path, 'rb') as f:
+                print(json.dumps({'path': path, 'sha256': put_document(f.read())}))
+    else:
+        print("Usage: python agent_input.py put <file> [<file> ...]", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,420 @@
+"""
+Agent Output Validation
+Validates model responses against precompiled schemas, repairing them locally before re-asking
+
+Models often return almost-valid JSON: wrapped in a code fence or prose,
+with single quotes or Python literals, trailing commas, or cut off at the
+token limit. repair_json() fixes these in one pass without another model
+call. A compiled schema then coerces types ("85%" -> 85, "yes" -> true,
+a bare string -> [string]), clamps bounded values such as scores to 0-100
+and fills defaults. Only when neither works does load_output() re-ask the
+model once; repairs and re-asks are counted in the agent's usage totals.
+Schemas use a JSON Schema subset: type, properties, required, items,
+minimum, maximum, minLength, enum, default.
+"""
+import json
+import re
+
+from tracing import get_logger, span
+
+logger = get_logger('agent_output')
+
+# Compiled on first use (re caches them), so importing an agent does not pay for them
+CODE_FENCE = r'```[a-zA-Z]*\s*(.*?)(?:```|$)'
+CONTROL_CHARACTER = r'[\x00-\x1f]'
+NUMBER_TEXT = r'-?\d[\d,]*(?:\.\d+)?(?:[eE][-+]?\d+)?'
+
+LITERALS = {'true': 'true', 'false': 'false', 'null': 'null', 'none': 'null', 'undefined': 'null', 'nan': 'null'}
+ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', '/': '/', '\\': '\\', '"': '"', "'": "'"}
+# A list field answered with one of these means an empty list
+EMPTY_WORDS = ('', 'none', 'n/a', 'na', 'null', '-')
+VALUE_END = ('string', 'number', 'literal', '}', ']')
+VALUE_START = ('string', 'number', 'literal', '{', '[')
+
+REASK_INSTRUCTION = "\n\nYOUR PREVIOUS REPLY COULD NOT BE USED ({problem}). Reply again with ONLY the JSON object described above.\n"
+
+
+class OutputError(ValueError):
+    """A response that neither parses nor repairs into the expected structure"""
+
+
+def _read_string(text: str, i: int) -> tuple:
+    """Decode a string literal opened at text[i] with either quote; returns (value, next index, closed)"""
+    quote, chars, i = text[i], [], i + 1
+    while i < len(text):
+        c = text[i]
+        if c == '\\' and i + 1 < len(text):
+            escape = text[i + 1]
+            if escape == 'u' and re.fullmatch(r'[0-9a-fA-F]{4}', text[i + 2:i + 6]):
+                chars.append(chr(int(text[i + 2:i + 6], 16)))
+                i += 6
+            else:
+                chars.append(ESCAPES.get(escape, escape))
+                i += 2
+            continue
+        if c == quote:
+            return ''.join(chars), i + 1, True
+        chars.append(c)
+        i += 1
+    return ''.join(chars), i, False
+
+
+def _tokenize(text: str, start: int, repairs: set) -> tuple:
+    """
+    Tokens of the first JSON value from text[start], repaired as it goes.
+
+    Returns (tokens, open containers, end index, truncated)
+    """
+    tokens, stack, i, n = [], [], start, len(text)
+    while i < n:
+        c = text[i]
+        if c in ' \t\r\n':
+            i += 1
+            continue
+        if c in '"\'':
+            if c == "'":
+                repairs.add('single_quotes')
+            begin = i
+            value, i, closed = _read_string(text, i)
+            if re.compile(CONTROL_CHARACTER).search(text, begin, i):
+                repairs.add('control_characters')
+            token = ('string', json.dumps(value, ensure_ascii=False))
+            if not closed:
+                tokens.append(token)
+                return tokens, stack, i, True
+        elif c in '{[':
+            token = (c, c)
+            stack.append('}' if c == '{' else ']')
+            i += 1
+        elif c in '}]':
+            if not stack:
+                break
+            while tokens and tokens[-1][0] == ',':
+                repairs.add('trailing_comma')
+                tokens.pop()
+            tokens.append((stack[-1], stack.pop()))
+            i += 1
+            if not stack:
+                return tokens, stack, i, False
+            continue
+        elif c in ',:':
+            tokens.append((c, c))
+            i += 1
+            continue
+        elif c in '-+.' or c.isdigit():
+            match = re.match(r'[-+]?[\d.]*(?:[eE][-+]?\d*)?', text[i:])
+            raw = match.group(0) or c
+            i += len(raw)
+            try:
+                number = float(raw)
+            except ValueError:
+                if i >= n:
+                    return tokens, stack, i, True
+                repairs.add('invalid_number')
+                token = ('literal', 'null')
+            else:
+                literal = raw.lstrip('+')
+                try:
+                    json.loads(literal)
+                    if literal != raw:
+                        raise ValueError(raw)
+                except ValueError:
+                    repairs.add('invalid_number')
+                    literal = repr(int(number)) if number.is_integer() else repr(number)
+                token = ('number', literal)
+        elif c.isalpha() or c == '_':
+            word = re.match(r'\w+', text[i:]).group(0)
+            i += len(word)
+            literal = LITERALS.get(word.lower())
+            if literal is None and i >= n and tokens and tokens[-1][0] == ':' and any(
+                    name.startswith(word.lower()) for name in LITERALS):
+                # A literal cut off by the token limit
+                return tokens, stack, i, True
+            if literal is not None:
+                if word != literal:
+                    repairs.add('python_literals')
+                token = ('literal', literal)
+            else:
+                repairs.add('unquoted_strings')
+                token = ('string', json.dumps(word))
+        else:
+            # Stray characters between tokens (ellipses, comments' text, ...)
+            repairs.add('stray_characters')
+            i += 1
+            continue
+
+        if tokens and tokens[-1][0] in VALUE_END and token[0] in VALUE_START:
+            repairs.add('missing_comma')
+            tokens.append((',', ','))
+        tokens.append(token)
+        if not stack:
+            # A bare top-level scalar
+            return tokens, stack, i, False
+    return tokens, stack, i, bool(stack)
+
+
+def _close_truncated(tokens: list, stack: list) -> None:
+    """Drop a dangling key or separator and close the containers left open, in place"""
+    while tokens:
+        kind = tokens[-1][0]
+        if kind in (',', ':'):
+            tokens.pop()
+        elif kind == 'string' and stack and stack[-1] == '}' and len(tokens) > 1 and tokens[-2][0] in ('{', ','):
+            # A key without its value
+            tokens.pop()
+        else:
+            break
+    for closer in reversed(stack):
+        tokens.append((closer, closer))
+
+
+def repair_json(text: str, expect: str = None) -> tuple:
+    """
+    Parse model output as JSON, repairing common defects.
+
+    Args:
+        text: Raw response content
+        expect: 'object' or 'array' to start at the first '{' or '['
+
+    Returns:
+        (parsed value, sorted list of repairs applied; empty when it parsed as-is)
+    """
+    if not isinstance(text, str):
+        raise OutputError(f"Expected text, got {type(text).__name__}")
+    try:
+        return json.loads(text), []
+    except ValueError:
+        pass
+
+    repairs = set()
+    fenced = re.search(CODE_FENCE, text, re.S)
+    if fenced:
+        repairs.add('code_fence')
+        text = fenced.group(1)
+
+    openers = {'object': '{', 'array': '['}.get(expect, '{[')
+    starts = [position for position in (text.find(opener) for opener in openers) if position >= 0]
+    if not starts:
+        raise OutputError(f"No JSON {expect or 'value'} in response")
+    start = min(starts)
+    if text[:start].strip():
+        repairs.add('leading_text')
+
+    tokens, stack, end, truncated = _tokenize(text, start, repairs)
+    if truncated:
+        repairs.add('truncated')
+        _close_truncated(tokens, stack)
+    elif text[end:].strip():
+        repairs.add('trailing_text')
+
+    try:
+        value = json.loads(''.join(token for _, token in tokens))
+    except ValueError as e:
+        raise OutputError(f"Unrepairable JSON: {e}")
+    return value, sorted(repairs)
+
+
+def _coerce_number(value):
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        # "$450,000", "85%", "1.2e6 USD"
+        match = re.search(NUMBER_TEXT, value)
+        if match:
+            number = float(match.group(0).replace(',', ''))
+            return int(number) if number.is_integer() else number
+    raise TypeError
+
+
+def _coerce_boolean(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return value != 0
+    if isinstance(value, str) and value.strip().lower() in ('true', 'yes', 'y', '1'):
+        return True
+    if isinstance(value, str) and value.strip().lower() in ('false', 'no', 'n', '0'):
+        return False
+    raise TypeError
+
+
+def compile_schema(schema: dict):
+    """
+    Validator for a schema, so checking a response is plain function calls.
+
+    The returned function takes a parsed value and a list that collects
+    coercions, and returns the coerced value or raises OutputError. Agents
+    compile their schemas at import; the closures are only built on the
+    first check.
+    """
+    compiled = None
+
+    def check(value, coercions, path='$'):
+        nonlocal compiled
+        if compiled is None:
+            compiled = _compile_schema(schema)
+        return compiled(value, coercions, path)
+    return check
+
+
+def _compile_schema(schema: dict):
+    kind = schema.get('type')
+    if kind == 'object':
+        fields = {name: _compile_schema(sub) for name, sub in schema.get('properties', {}).items()}
+        defaults = {name: sub['default'] for name, sub in schema.get('properties', {}).items() if 'default' in sub}
+        required = tuple(schema.get('required', ()))
+
+        def check(value, coercions, path='$'):
+            if not isinstance(value, dict):
+                raise OutputError(f"{path}: expected an object")
+            result = dict(value)
+            for name in required:
+                if result.get(name) is None and name not in defaults:
+                    raise OutputError(f"{path}.{name}: missing")
+            for name, field in fields.items():
+                if result.get(name) is None:
+                    if name in defaults:
+                        if name in value:
+                            coercions.append(f"{path}.{name}: null -> default")
+                        result[name] = json.loads(json.dumps(defaults[name]))
+                    continue
+                result[name] = field(result[name], coercions, f"{path}.{name}")
+            return result
+        return check
+
+    if kind == 'array':
+        item = _compile_schema(schema.get('items', {}))
+
+        def check(value, coercions, path='$'):
+            if isinstance(value, str) and value.strip().lower() in EMPTY_WORDS:
+                coercions.append(f"{path}: {value!r:.40} -> []")
+                value = []
+            elif not isinstance(value, list):
+                coercions.append(f"{path}: wrapped in a list")
+                value = [value]
+            items = []
+            for index, entry in enumerate(value):
+                if entry is None:
+                    coercions.append(f"{path}[{index}]: dropped null")
+                    continue
+                items.append(item(entry, coercions, f"{path}[{index}]"))
+            return items
+        return check
+
+    if kind in ('number', 'integer'):
+        minimum, maximum = schema.get('minimum'), schema.get('maximum')
+
+        def check(value, coercions, path='$'):
+            try:
+                number = _coerce_number(value)
+            except (TypeError, ValueError):
+                raise OutputError(f"{path}: expected a number, got {value!r:.40}")
+            if number is not value:
+                coercions.append(f"{path}: {value!r:.40} -> {number}")
+            if kind == 'integer' and not isinstance(number, int):
+                number = int(round(number))
+            if minimum is not None and number < minimum or maximum is not None and number > maximum:
+                clamped = min(max(number, minimum if minimum is not None else number),
+                              maximum if maximum is not None else number)
+                coercions.append(f"{path}: {number} clamped to {clamped}")
+                number = clamped
+            return number
+        return check
+
+    if kind == 'boolean':
+        def check(value, coercions, path='$'):
+            try:
+                flag = _coerce_boolean(value)
+            except TypeError:
+                raise OutputError(f"{path}: expected a boolean, got {value!r:.40}")
+            if flag is not value:
+                coercions.append(f"{path}: {value!r:.40} -> {flag}")
+            return flag
+        return check
+
+    if kind == 'string':
+        choices = {choice.lower(): choice for choice in schema.get('enum', ())}
+        min_length = schema.get('minLength', 0)
+
+        def check(value, coercions, path='$'):
+            if isinstance(value, (dict, list)):
+                raise OutputError(f"{path}: expected a string")
+            text = value if isinstance(value, str) else str(value)
+            if text is not value:
+                coercions.append(f"{path}: {value!r:.40} -> string")
+            if len(text.strip()) < min_length:
+                raise OutputError(f"{path}: shorter than {min_length} characters")
+            if choices:
+                choice = choices.get(text.strip().lower())
+                if choice is None:
+                    if 'default' not in schema:
+                        raise OutputError(f"{path}: expected one of {sorted(choices.values())}")
+                    coercions.append(f"{path}: {text!r:.40} -> default")
+                    return schema['default']
+                if choice != text:
+                    coercions.append(f"{path}: {text!r:.40} -> {choice}")
+                text = choice
+            return text
+        return check
+
+    return lambda value, coercions, path='$': value
+
+
+def parse_output(content: str, validator, expect: str = 'object') -> tuple:
+    """
+    Repair and validate one response.
+
+    Returns:
+        (value, {'repairs': [...], 'coercions': [...]})
+    """
+    value, repairs = repair_json(content, expect)
+    coercions = []
+    return validator(value, coercions), {'repairs': repairs, 'coercions': coercions}
+
+
+def conform(validator, value):
+    """The coerced value, or None if it does not fit the schema (for batch items)"""
+    try:
+        return validator(value, [])
+    except OutputError:
+        return None
+
+
+def reask_suffix(suffix: str, problem: str) -> str:
+    """The property suffix with a request to resend the answer as valid JSON"""
+    return suffix + REASK_INSTRUCTION.format(problem=problem[:200])
+
+
+def load_output(content: str, validator, reask=None, usage: dict = None, expect: str = 'object'):
+    """
+    Validated value from a model response, repaired locally and re-asked only if that fails.
+
+    Args:
+        content: Raw response content
+        validator: A compiled schema
+        reask: Callable(problem) -> new response content, tried once (None to fail instead)
+        usage: Usage totals; 'repaired' and 'reasked' are incremented
+
+    Returns:
+        The coerced value; raises OutputError if the (re-asked) response is unusable
+    """
+    with span('output.parse', bytes=len(content or '')) as s:
+        try:
+            value, report = parse_output(content, validator, expect)
+        except OutputError as e:
+            if reask is None:
+                raise
+            logger.warning("Response not repairable (%s), asking the model again", e)
+            if usage is not None:
+                usage['reasked'] += 1
+            s.set(reasked=True)
+            value, report = parse_output(reask(str(e)), validator, expect)
+
+        if report['repairs'] or report['coercions']:
+            logger.info("🔧 Repaired response locally: %s", ', '.join(report['repairs'] + report['coercions'][:5]))
+            if usage is not None:
+                usage['repaired'] += 1
+        s.set(repairs=len(report['repairs']), coercions=len(report['coercions']))
+    return value
@@ -0,0 +1,125 @@
+"""
+Agent Prompt Assembly
+Byte-stable static prefixes followed by variable suffixes, so providers
+can reuse cached prompt prefixes between calls
+"""
+import hashlib
+import time
+
+
+def prompt_hash(text: str) -> str:
+    """Short content hash identifying an exact prompt part"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def build_static_prefix(system_prompt: str, instructions: str, version: str) -> dict:
+    """
+    Freeze the static part of an agent prompt.
+
+    Build this once at import time from module constants only. Anything that
+    varies per request (coordinates, areas, document text) belongs in the suffix.
+    """
+    return {
+        'system': system_prompt,
+        'text': instructions,
+        'version': version,
+        'hash': prompt_hash(system_prompt + '\x00' + instructions),
+    }
+
+
+def build_messages(prefix: dict, suffix: str) -> list:
+    """Chat messages with the static prefix first and the variable suffix last"""
+    return [
+        {
+            "role": "system",
+            "content": prefix['system']
+        },
+        {
+            "role": "user",
+            "content": f"{prefix['text']}\n\n{suffix}"
+        }
+    ]
+
+
+def describe_prompt(prefix: dict, suffix: str, suffix_version: str) -> dict:
+    """Version and hash metadata reported alongside agent results"""
+    return {
+        'prefix_version': prefix['version'],
+        'prefix_hash': prefix['hash'],
+        'suffix_version': suffix_version,
+        'suffix_hash': prompt_hash(suffix),
+    }
+
+
+def analysis_inputs(prefix: dict, suffix: str, suffix_version: str, model: str,
+                    documents: list, max_tokens: int = None) -> dict:
+    """Stage cache inputs of one model call: prompt hashes and versions, model and document hashes"""
+    return {
+        'model': model,
+        'max_tokens': max_tokens,
+        'prefix_version': prefix['version'],
+        'prefix_hash': prefix['hash'],
+        'suffix_version': suffix_version,
+        'suffix_hash': prompt_hash(suffix),
+        'document_hashes': [hashlib.sha256(text.encode('utf-8')).hexdigest() for text in documents],
+    }
+
+
+def new_usage() -> dict:
+    """Empty usage totals for one agent invocation"""
+    return {
+        'requests': 0,
+        'prompt_tokens': 0,
+        'cached_tokens': 0,
+        'completion_tokens': 0,
+        'latency_ms': 0,
+        # Responses fixed locally vs re-asked of the model (agent_output.py)
+        'repaired': 0,
+        'reasked': 0,
+    }
+
+
+def _field(obj, name):
+    """Read a field from either an SDK object or a plain dict"""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def parse_usage(response) -> dict:
+    """
+    Extract token counts, including cached prompt tokens, from a completion.
+
+    OpenAI-compatible providers (OpenRouter, Groq) report cache hits under
+    usage.prompt_tokens_details.cached_tokens; some report
+    usage.prompt_cache_hit_tokens instead.
+    """
+    usage = _field(response, 'usage')
+    details = _field(usage, 'prompt_tokens_details')
+    cached = _field(details, 'cached_tokens') or _field(usage, 'prompt_cache_hit_tokens') or 0
+
+    return {
+        'prompt_tokens': _field(usage, 'prompt_tokens') or 0,
+        'cached_tokens': cached,
+        'completion_tokens': _field(usage, 'completion_tokens') or 0,
+    }
+
+
+def record_usage(totals: dict, response, started: float) -> None:
+    """Add one completion's usage and latency to the running totals"""
+    if totals is None:
+        return
+    totals['requests'] += 1
+    totals['latency_ms'] += int((time.perf_counter() - started) * 1000)
+    for key, value in parse_usage(response).items():
+        totals[key] += value
+
+
+def merge_usage(totals: dict, other: dict) -> None:
+    """Fold another invocation's usage totals into these"""
+    if not other:
+        return
+    for key in totals:
+        totals[key] += other.get(key, 0)
@@ -0,0 +1,207 @@
+"""
+Satellite Artifact Store
+Content-addressed storage for downloaded satellite images, with retention and a size quota
+
+Artifacts live under ARTIFACT_STORE_DIR as <sha[:2]>/<sha><ext>. Identical
+images are stored once, writes are atomic (temp file + rename) and a JSON
+sidecar next to each artifact remembers its IPFS hash so the orchestrator
+can skip re-uploading a scene it has already pinned.
+
+The orchestrator (uploadSatelliteLayer in src/orchestrator.ts) is the only
+writer of the sidecar: it merges {"ipfs_hash", "uploaded_at"} into any
+existing keys. This module only reads it (read_meta).
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+from tracing import get_logger
+
+logger = get_logger('artifact_store')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ARTIFACT_STORE_DIR = os.getenv('ARTIFACT_STORE_DIR', os.path.join(BASE_DIR, '.artifact-store'))
+
+# Artifacts not used for this long are removed
+ARTIFACT_RETENTION_HOURS = float(os.getenv('ARTIFACT_RETENTION_HOURS', '24'))
+
+# Total size cap; least recently used artifacts are evicted first
+ARTIFACT_STORE_MAX_MB = float(os.getenv('ARTIFACT_STORE_MAX_MB', '512'))
+
+# Never evict artifacts younger than this, so in-flight uploads keep their files
+ARTIFACT_MIN_AGE_SECONDS = 600
+
+# The satellite service collects garbage at most this often (each run lists the whole store)
+ARTIFACT_GC_INTERVAL_MINUTES = float(os.getenv('ARTIFACT_GC_INTERVAL_MINUTES', '10'))
+
+META_SUFFIX = '.json'
+
+
+def _artifact_path(artifact_id: str, extension: str) -> str:
+    return os.path.join(ARTIFACT_STORE_DIR, artifact_id[:2], artifact_id + extension)
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Write to a temp file in the target directory, then rename into place"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def maintenance_due(stamp_path: str, interval_s: float, now: float = None) -> bool:
+    """
+    Whether periodic maintenance tracked by stamp_path is due; if so, claims it by touching the stamp.
+
+    Lets request paths run cache cleanup at most once per interval instead of walking the cache every time.
+    """
+    now = now or time.time()
+    try:
+        if now - os.stat(stamp_path).st_mtime < interval_s:
+            return False
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(stamp_path), exist_ok=True)
+    with open(stamp_path, 'a'):
+        pass
+    os.utime(stamp_path, (now, now))
+    return True
+
+
+def read_meta(path: str) -> dict:
+    """Sidecar metadata for an artifact (empty if none recorded)"""
+    try:
+        with open(path + META_SUFFIX) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def put_artifact(data: bytes, extension: str = '.png', kind: str = None) -> dict:
+    """
+    Store bytes and return a stable artifact handle.
+
+    Args:
+        data: Artifact contents
+        extension: File extension, including the dot
+        kind: Optional label such as 'rgb' or 'ndvi'
+
+    Returns:
+        Handle with id, path, size, whether it was already stored and any known ipfs_hash
+    """
+    artifact_id = hashlib.sha256(data).hexdigest()
+    path = _artifact_path(artifact_id, extension)
+    existed = os.path.exists(path)
+
+    if existed:
+        # Refresh last-use time so retention and LRU eviction see it as recent
+        os.utime(path)
+    else:
+        write_atomic(path, data)
+
+    meta = read_meta(path)
+    return {
+        'id': artifact_id,
+        'kind': kind,
+        'path': path,
+        'meta_path': path + META_SUFFIX,
+        'size': len(data),
+        'deduplicated': existed,
+        'ipfs_hash': meta.get('ipfs_hash'),
+    }
+
+
+def _list_artifacts() -> list:
+    """(path, size, last use) for every artifact in the store"""
+    artifacts = []
+    if not os.path.isdir(ARTIFACT_STORE_DIR):
+        return artifacts
+    for shard in os.scandir(ARTIFACT_STORE_DIR):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            if entry.name.endswith(META_SUFFIX) or entry.name.endswith('.tmp'):
+                continue
+            stat = entry.stat()
+            artifacts.append((entry.path, stat.st_size, stat.st_mtime))
+    return artifacts
+
+
+def _remove(path: str) -> None:
+    for target in (path, path + META_SUFFIX):
+        try:
+            os.unlink(target)
+        except FileNotFoundError:
+            pass
+
+
+def collect_garbage(now: float = None) -> dict:
+    """
+    Apply the retention policy, then evict least recently used artifacts until under quota.
+
+    Returns:
+        Counts and bytes of removed and remaining artifacts
+    """
+    now = now or time.time()
+    retention_cutoff = now - ARTIFACT_RETENTION_HOURS * 3600
+    min_age_cutoff = now - ARTIFACT_MIN_AGE_SECONDS
+    quota_bytes = ARTIFACT_STORE_MAX_MB * 1024 * 1024
+
+    removed = 0
+    removed_bytes = 0
+    kept = []
+    for path, size, last_used in _list_artifacts():
+        if last_used < retention_cutoff:
+            _remove(path)
+            removed += 1
+            removed_bytes += size
+        else:
+            kept.append((path, size, last_used))
+
+    total = sum(size for _, size, _ in kept)
+    kept.sort(key=lambda artifact: artifact[2])
+    remaining = []
+    for path, size, last_used in kept:
+        if total > quota_bytes and last_used < min_age_cutoff:
+            _remove(path)
+            removed += 1
+            removed_bytes += size
+            total -= size
+        else:
+            remaining.append(path)
+
+    if total > quota_bytes:
+        logger.warning("Artifact store over quota (%d bytes), newest artifacts kept", total)
+
+    return {
+        'removed': removed,
+        'removed_bytes': removed_bytes,
+        'remaining': len(remaining),
+        'remaining_bytes': total,
+    }
+
+
+def collect_garbage_if_due(now: float = None):
+    """collect_garbage at most every ARTIFACT_GC_INTERVAL_MINUTES; None when it was not due"""
+    if not maintenance_due(os.path.join(ARTIFACT_STORE_DIR, '.last-gc'), ARTIFACT_GC_INTERVAL_MINUTES * 60, now):
+        return None
+    return collect_garbage(now)
+
+
+if __name__ == "__main__":
+    # Run retention and quota eviction: python artifact_store.py gc
+    if len(sys.argv) > 1 and sys.argv[1] == 'gc':
+        print(json.dumps(collect_garbage()))
+    else:
+        print("Usage: python artifact_store.py gc", file=sys.stderr)
+        sys.exit(1)
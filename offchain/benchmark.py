@@ -0,0 +1,277 @@
+"""
+Hot-Path Micro-Benchmarks
+Ops/sec and allocation benchmarks for the pure CPU functions and request parsing, with regression thresholds
+
+Usage:
+    python benchmark.py                     # compare against benchmarks/baseline.json
+    python benchmark.py --update-baseline   # record a new baseline
+    python benchmark.py --filter prompt     # only benchmarks whose name contains "prompt"
+
+Throughput is normalized by a fixed pure-Python calibration loop, so a
+baseline recorded on one machine remains meaningful on another. A benchmark
+fails when its calibrated ops/sec drops more than --threshold below the
+baseline, or its peak allocation per call grows more than --alloc-threshold.
+Peak RSS growth per call is measured in a forked child and reported alongside.
+"""
+import argparse
+import atexit
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = os.path.join(BASE_DIR, 'benchmarks')
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+
+sys.path.insert(0, BASE_DIR)
+
+
+def load_search_snippets() -> list:
+    """Saved Custom Search results (title + snippet) as the price extractor sees them"""
+    with open(os.path.join(BENCH_DIR, 'search_snippets.json'), encoding='utf-8') as f:
+        return [f"{item['title']} {item['snippet']}" for item in json.load(f)]
+
+
+def load_ocr_deed(pages: int = 8) -> str:
+    """Multi-page OCR deed text built from the extracted sample sale deed"""
+    with open(os.path.join(BASE_DIR, 'sale-deed-extracted.json'), encoding='utf-8') as f:
+        page = json.load(f)['extracted_text']
+    return ''.join(f"\n--- Page {i + 1} ---\n{page}" for i in range(pages))
+
+
+def write_large_request(directory: str, megabytes: int = 8) -> tuple:
+    """A multi-MB request with four inline documents, as a JSON file and as an ndjson stream"""
+    deed = load_ocr_deed()
+    document = deed * max(1, megabytes * (1 << 20) // 4 // len(deed))
+    request = {'latitude': 12.9716, 'longitude': 77.5946, 'document_contents': [document] * 4}
+    json_path = os.path.join(directory, 'request.json')
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(request, f)
+    stream = json.dumps({'latitude': 12.9716, 'longitude': 77.5946}) + '\n'
+    stream += ''.join(json.dumps(document) + '\n' for document in request['document_contents'])
+    return json_path, stream.encode('utf-8')
+
+
+def synthetic_parcels(count: int = 500, seed: int = 11) -> list:
+    """Parcel feature tuples (area_sqm, ndvi, cloud_coverage, document_count)"""
+    rng = random.Random(seed)
+    return [
+        (rng.uniform(80, 5000), rng.uniform(-0.1, 0.9), rng.uniform(0, 40), rng.randint(0, 4))
+        for _ in range(count)
+    ]
+
+
+def build_benchmarks() -> dict:
+    """Name -> zero-argument callable for every benchmarked hot path"""
+    import agent1
+    import agent2
+    import agent3
+    from agent_batch import build_batch_suffix
+    from agent_input import load_file, read_ndjson_stream
+    from agent_prompts import build_messages
+    from src.services.priceOracle import apply_area_valuation, calculate_price_statistics, extract_prices_from_text
+
+    snippets = load_search_snippets()
+    deed = load_ocr_deed()
+    parcels = synthetic_parcels()
+    rng = random.Random(3)
+    prices = [rng.uniform(50000, 5000000) for _ in range(200)]
+
+    package = {
+        'latitude': 12.9716, 'longitude': 77.5946, 'document_count': 2,
+        'document_contents': [deed, deed[:4000]],
+        'satellite_data': {'area_sqm': 223.0, 'ndvi': 0.41, 'cloud_coverage': 3.2},
+    }
+    agent2_context = {
+        'area_sqm': 223.0, 'ndvi': 0.41, 'cloud_coverage': 3.2, 'document_count': 2,
+        'document_contents': package['document_contents'],
+        'market_data': {'average_price': 2500000, 'price_count': 12},
+        'ndvi_history': None,
+        'area_basis': None,
+        'base_valuation': agent2.calculate_valuation(223.0, 0.41, 3.2, 2),
+    }
+    agent3_context = agent3.prepare_property(package)
+
+    request_path, request_stream = write_large_request(tempfile.mkdtemp(prefix='bench-input-'))
+    atexit.register(shutil.rmtree, os.path.dirname(request_path), True)
+
+    def market_statistics():
+        price_data = calculate_price_statistics(prices)
+        return apply_area_valuation(price_data, 223.0)
+
+    return {
+        'extract_prices_from_text': lambda: [extract_prices_from_text(text) for text in snippets],
+        'agent2.calculate_valuation': lambda: [agent2.calculate_valuation(*parcel) for parcel in parcels],
+        'agent3.calculate_valuation': lambda: [agent3.calculate_valuation(*parcel) for parcel in parcels],
+        'market_valuation_statistics': market_statistics,
+        'agent1.prompt_assembly': lambda: build_messages(agent1.SINGLE_PREFIX, agent1.build_property_section(package)),
+        'agent2.prompt_assembly': lambda: build_messages(agent2.SINGLE_PREFIX, agent2.build_property_section(agent2_context)),
+        'agent3.prompt_assembly': lambda: build_messages(agent3.SINGLE_PREFIX, agent3.build_property_section(agent3_context)),
+        'batch_prompt_assembly': lambda: build_batch_suffix(
+            {f"property-{i}": agent1.build_property_section(package) for i in range(10)}
+        ),
+        'input.load_file': lambda: load_file(request_path),
+        'input.ndjson_stream': lambda: read_ndjson_stream(io.BytesIO(request_stream)),
+    }
+
+
+def calibrate() -> float:
+    """Ops/sec of a fixed pure-Python workload, used to normalize across machines"""
+    def workload():
+        total = 0
+        for i in range(2000):
+            total += (i * i) % 7
+        return sorted(str(total) * 20)
+    return measure_ops(workload)
+
+
+def measure_ops(fn, repeat: int = 5) -> float:
+    """Best-of-N calls per second"""
+    timer = timeit.Timer(fn)
+    timer.timeit(number=3)  # warm up before sizing the loop
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return number / best
+
+
+def measure_alloc(fn) -> int:
+    """Peak bytes allocated during one call"""
+    fn()  # warm caches (compiled regexes, interned strings) before tracing
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return max(0, peak - before)
+
+
+def measure_rss(fn):
+    """Peak resident memory growth during one call, in bytes (None without fork/resource)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    if not hasattr(os, 'fork'):
+        return None
+    # ru_maxrss never goes down, so the call runs in a fresh child with its own peak
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        fn()
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        os.write(write_end, str(after - before).encode())
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as f:
+        growth = int(f.read() or 0)
+    os.waitpid(pid, 0)
+    # Kilobytes on Linux, bytes on macOS
+    return growth if sys.platform == 'darwin' else growth * 1024
+
+
+def run(names_filter: str = None) -> dict:
+    """Measure every benchmark and the calibration loop"""
+    results = {}
+    # Agents log document previews to stderr; keep that out of the report
+    with contextlib.redirect_stderr(open(os.devnull, 'w')):
+        benchmarks = build_benchmarks()
+        calibration = calibrate()
+        for name, fn in benchmarks.items():
+            if names_filter and names_filter not in name:
+                continue
+            # RSS first: a child forked after the timing loops would reuse their already-resident heap
+            rss_peak_bytes = measure_rss(fn)
+            results[name] = {
+                'ops_per_sec': round(measure_ops(fn), 2),
+                'alloc_peak_bytes': measure_alloc(fn),
+                'rss_peak_bytes': rss_peak_bytes,
+            }
+    return {'calibration_ops_per_sec': round(calibration, 2), 'benchmarks': results}
+
+
+def compare(current: dict, baseline: dict, threshold: float, alloc_threshold: float) -> list:
+    """Print a comparison table and return names of regressed benchmarks"""
+    scale = current['calibration_ops_per_sec'] / baseline['calibration_ops_per_sec']
+    regressions = []
+
+    print(f"Machine speed vs baseline: {scale:.2f}x\n")
+    print(f"{'benchmark':30} {'ops/sec':>12} {'expected':>12} {'change':>8} {'alloc KiB':>10} {'base KiB':>9} "
+          f"{'RSS KiB':>9}  status")
+    for name, stats in current['benchmarks'].items():
+        # Peak RSS growth is reported, not gated: page granularity makes it noisy for small calls
+        rss = '-' if stats.get('rss_peak_bytes') is None else f"{stats['rss_peak_bytes'] / 1024:.0f}"
+        base = baseline['benchmarks'].get(name)
+        if not base:
+            print(f"{name:30} {stats['ops_per_sec']:>12.1f} {'-':>12} {'-':>8} {stats['alloc_peak_bytes'] / 1024:>10.1f} "
+                  f"{'-':>9} {rss:>9}  NEW")
+            continue
+
+        expected = base['ops_per_sec'] * scale
+        change = stats['ops_per_sec'] / expected - 1
+        alloc_change = (stats['alloc_peak_bytes'] + 1) / (base['alloc_peak_bytes'] + 1) - 1
+        regressed = change < -threshold or alloc_change > alloc_threshold
+        if regressed:
+            regressions.append(name)
+
+        print(f"{name:30} {stats['ops_per_sec']:>12.1f} {expected:>12.1f} {change:>+8.1%} "
+              f"{stats['alloc_peak_bytes'] / 1024:>10.1f} {base['alloc_peak_bytes'] / 1024:>9.1f} {rss:>9}  "
+              f"{'REGRESSED' if regressed else 'OK'}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the Python hot paths')
+    parser.add_argument('--update-baseline', action='store_true', help='write results to benchmarks/baseline.json')
+    parser.add_argument('--threshold', type=float, default=0.30, help='allowed ops/sec drop (fraction)')
+    parser.add_argument('--alloc-threshold', type=float, default=0.25, help='allowed peak allocation growth (fraction)')
+    parser.add_argument('--filter', help='only run benchmarks whose name contains this')
+    args = parser.parse_args()
+
+    current = run(args.filter)
+
+    if args.update_baseline:
+        baseline = {'calibration_ops_per_sec': current['calibration_ops_per_sec'], 'benchmarks': {}}
+        if os.path.exists(BASELINE_PATH) and args.filter:
+            with open(BASELINE_PATH) as f:
+                baseline = json.load(f)
+            # Partial updates keep other entries comparable to the old calibration
+            scale = baseline['calibration_ops_per_sec'] / current['calibration_ops_per_sec']
+            for stats in current['benchmarks'].values():
+                stats['ops_per_sec'] = round(stats['ops_per_sec'] * scale, 2)
+        baseline['benchmarks'].update(current['benchmarks'])
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"✅ Baseline written to {os.path.relpath(BASELINE_PATH, BASE_DIR)} ({len(current['benchmarks'])} benchmarks)")
+        return 0
+
+    if not os.path.exists(BASELINE_PATH):
+        print("❌ No baseline found, run with --update-baseline first")
+        return 1
+
+    with open(BASELINE_PATH) as f:
+        baseline = json.load(f)
+
+    regressions = compare(current, baseline, args.threshold, args.alloc_threshold)
+    if regressions:
+        print(f"\n❌ Regressed: {', '.join(regressions)}")
+        return 1
+
+    print("\n✅ No hot-path regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Import-Time Budget Check
+Fails if any Python entry point's cold import goes over its budget.
+
+Usage:
+    python check_import_time.py [--runs 5]
+
+Uses `python -X importtime` and compares the cumulative import time of each
+entry module (best of several runs) against IMPORT_BUDGETS_MS. Bytecode is
+compiled first, so the runs time imports rather than compilation. Heavy SDKs
+(groq, openai, ee, requests, dotenv) must stay behind the code paths that
+need them for these budgets to hold. tests/test_import_time.py runs the
+same check under pytest.
+"""
+import argparse
+import compileall
+import os
+import subprocess
+import sys
+
+# Cold import budget per entry point, in milliseconds: about twice the best
+# of 20 runs (agents ~9 ms, satellite_service ~9 ms, priceOracle ~6 ms).
+# Fix a regression rather than raising these.
+IMPORT_BUDGETS_MS = {
+    'agent1': 20,
+    'agent2': 20,
+    'agent3': 20,
+    'satellite_service': 20,
+    'src.services.priceOracle': 14,
+}
+
+# Modules that must never be imported just by loading an entry point
+HEAVY_MODULES = ('groq', 'openai', 'ee', 'requests', 'dotenv')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_import(module: str) -> tuple:
+    """Import a module in a fresh interpreter and return (cumulative ms, imported names)"""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=BASE_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    cumulative_us = None
+    imported = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        stripped = name.strip()
+        imported.add(stripped)
+        # The entry module is the only top-level (unindented) line with its name
+        if name == ' ' + module:
+            cumulative_us = int(cumulative)
+
+    if cumulative_us is None:
+        raise RuntimeError(f"no importtime record for {module}")
+    return cumulative_us / 1000, imported
+
+
+def compile_sources() -> None:
+    """Write current bytecode, so a stale or missing .pyc is not timed as import work"""
+    compileall.compile_dir(BASE_DIR, maxlevels=0, quiet=1)
+    compileall.compile_dir(os.path.join(BASE_DIR, 'src'), quiet=1)
+
+
+def check_budgets(runs: int) -> dict:
+    """Module -> (best cumulative ms over runs, eagerly imported heavy modules)"""
+    compile_sources()
+    results = {}
+    for module in IMPORT_BUDGETS_MS:
+        best_ms = None
+        imported = set()
+        for _ in range(runs):
+            elapsed_ms, imported = measure_import(module)
+            best_ms = elapsed_ms if best_ms is None else min(best_ms, elapsed_ms)
+        results[module] = (best_ms, sorted(name for name in imported if name.split('.')[0] in HEAVY_MODULES))
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=10, help='runs per entry point (best is kept)')
+    args = parser.parse_args()
+
+    failures = []
+    for module, (best_ms, heavy) in check_budgets(args.runs).items():
+        budget_ms = IMPORT_BUDGETS_MS[module]
+        status = 'OK' if best_ms <= budget_ms and not heavy else 'FAIL'
+        print(f"{status:4} {module:28} {best_ms:7.1f} ms (budget {budget_ms} ms)")
+        if heavy:
+            print(f"     eagerly imports: {', '.join(heavy[:5])}")
+        if status == 'FAIL':
+            failures.append(module)
+
+    if failures:
+        print(f"\n❌ Import budget exceeded: {', '.join(failures)}")
+        return 1
+
+    print("\n✅ All entry points within import budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+Deadlines
+One overall time budget per request, passed down to every network call
+
+An entry point reads "deadline" (Unix time in seconds) or "budget_s" from its
+input and opens a scope; inside it every network call asks request_timeout()
+for its timeout, so no single call can outlive the request. Optional work
+(extra image layers, the second search query, long-form reasoning) checks
+can_afford() first and is recorded with skip() when the budget is too tight;
+the entry point then reports the budget and the skipped steps, and marks the
+result partial. Without a deadline every call keeps its usual timeout.
+
+    from deadline import deadline_scope, read_deadline, request_timeout
+
+    with deadline_scope(read_deadline(data)):
+        requests.get(url, timeout=request_timeout(10))
+"""
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+from tracing import get_logger
+
+logger = get_logger('deadline')
+
+# Kept back from every call's timeout for assembling and returning the result
+DEADLINE_RESERVE_S = float(os.getenv('DEADLINE_RESERVE_S', '1'))
+
+_scope = contextvars.ContextVar('deadline_scope', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's budget ran out before a required call"""
+
+
+def read_deadline(data: dict):
+    """Absolute deadline from a request's 'deadline' or 'budget_s' (None if neither is given)"""
+    if data.get('deadline') is not None:
+        return float(data['deadline'])
+    if data.get('budget_s') is not None:
+        return time.time() + float(data['budget_s'])
+    return None
+
+
+def new_scope(deadline: float = None) -> dict:
+    return {'deadline': deadline, 'started': time.time(), 'skipped': []}
+
+
+def extend_deadline(scope: dict, deadline: float = None) -> None:
+    """Move a running scope's deadline later (None removes it); never earlier"""
+    if deadline is None or scope['deadline'] is None:
+        scope['deadline'] = None
+    else:
+        scope['deadline'] = max(scope['deadline'], deadline)
+
+
+@contextmanager
+def deadline_scope(deadline: float = None, scope: dict = None):
+    """
+    Run the block under a deadline.
+
+    With deadline=None an enclosing scope is kept, so helpers called from an
+    entry point (the market search inside agent2) share its budget. scope
+    runs the block under an existing new_scope(), whose deadline the caller
+    can still extend (pipeline_service.py, for requests joining a computation).
+    """
+    outer = _scope.get()
+    if scope is None and deadline is None and outer is not None:
+        yield outer
+        return
+    scope = scope if scope is not None else new_scope(deadline)
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+def current_deadline():
+    scope = _scope.get()
+    return scope['deadline'] if scope else None
+
+
+def remaining():
+    """Seconds left for network calls, or None without a deadline"""
+    deadline = current_deadline()
+    if deadline is None:
+        return None
+    return deadline - time.time() - DEADLINE_RESERVE_S
+
+
+def request_timeout(default):
+    """
+    Timeout for one network call: the default, capped at the remaining budget.
+
+    default may be None (the SDK's own timeout); the result is then None
+    unless a deadline is set. Raises DeadlineExceeded once the budget is spent.
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded(f"Deadline exceeded by {-left:.1f}s")
+    return left if default is None else min(default, left)
+
+
+def bounded_client(client):
+    """An OpenAI/Groq SDK client whose requests time out with the remaining budget"""
+    timeout = request_timeout(None)
+    if timeout is None:
+        return client
+    # No SDK retries: a retry would start after the budget the timeout was cut to
+    return client.with_options(timeout=timeout, max_retries=0)
+
+
+def can_afford(estimate_s: float) -> bool:
+    """Whether optional work expected to take estimate_s fits in the remaining budget"""
+    left = remaining()
+    return left is None or left >= estimate_s
+
+
+def skip(step: str) -> None:
+    """Record optional work left out to stay within the deadline"""
+    scope = _scope.get()
+    left = remaining()
+    logger.info("⏱️  Skipping %s (%.1fs of budget left)", step, left if left is not None else 0)
+    if scope is not None:
+        scope['skipped'].append({'step': step, 'remaining_s': round(left, 2) if left is not None else None})
+
+
+def merge_skipped(steps: list) -> None:
+    """Record steps another process skipped for this request (a pipeline service response)"""
+    scope = _scope.get()
+    if scope is not None:
+        scope['skipped'].extend(steps or [])
+
+
+def skipped() -> list:
+    scope = _scope.get()
+    return list(scope['skipped']) if scope else []
+
+
+def annotate(result: dict) -> dict:
+    """Add the budget, the skipped steps and 'partial' to an entry point's result, in place"""
+    scope = _scope.get()
+    if scope is None or scope['deadline'] is None:
+        return result
+    result['deadline'] = {
+        'budget_s': round(scope['deadline'] - scope['started'], 2),
+        'remaining_s': round(scope['deadline'] - time.time(), 2),
+    }
+    result['skipped'] = list(scope['skipped'])
+    result['partial'] = bool(scope['skipped'])
+    return result
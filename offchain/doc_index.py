@@ -0,0 +1,407 @@
+"""
+Document Similarity Index
+Near-duplicate detection for submitted deeds, so resubmissions skip re-analysis
+
+Each document is normalized, shingled into word 5-grams and summarized as a
+128-value MinHash signature. Signatures are split into 16 LSH bands of 8
+rows, and documents sharing any band bucket are candidates whose Jaccard
+similarity is then estimated from their signatures. The index is a SQLite
+database under DOC_INDEX_DIR holding signatures, band buckets, the extracted
+survey number and owner, and the verdict agent1 reached.
+
+Enabled in the agents with AGENT_DOC_INDEX=1; they go through
+doc_screening.py, which only imports this module when the index is on.
+agent1 is the only writer: agent2 and agent3 screen against the index but
+do not judge authenticity, so they have no verdict to record. Requires NumPy.
+
+    python doc_index.py stats               # documents, buckets, rejected count
+    python doc_index.py bench [documents]   # lookup latency on a synthetic index
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+
+from tracing import get_logger, span
+
+logger = get_logger('doc_index')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DOC_INDEX_DIR = os.getenv('DOC_INDEX_DIR', os.path.join(BASE_DIR, '.doc-index'))
+
+# Estimated Jaccard similarity at or above which two documents are near-duplicates
+DOC_INDEX_SIMILARITY = float(os.getenv('DOC_INDEX_SIMILARITY', '0.85'))
+
+# Same survey number within this distance is treated as the same parcel
+DOC_INDEX_SURVEY_RADIUS_KM = float(os.getenv('DOC_INDEX_SURVEY_RADIUS_KM', '5'))
+
+# agent1 authenticity scores at or below this count as rejections (its rejection criteria use 0-40)
+REJECTION_SCORE = 40
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# Universal hashing (a * x + b) mod p over 32-bit shingle hashes; a, b < 2^32 keeps a * x + b below 2^64
+_PRIME = 4294967311
+_MAX_HASH = (1 << 32) - 1
+
+# Most near-duplicates checked per document, best bucket overlap first
+MAX_CANDIDATES = 64
+
+SURVEY_PATTERN = re.compile(
+    r'\b(?:survey|s\.?\s?no|sy\.?\s?no|r\.?\s?s\.?\s?no)\.?\s*(?:no\.?|number|nos\.?)?\s*[:\-]?\s*'
+    r'(\d+[a-z]?\b(?:\s*[/\-]\s*(?:\d+[a-z]?|[a-z])\b)*)',
+    re.IGNORECASE
+)
+OWNER_PATTERN = re.compile(r'\b(?:buyer|purchaser|vendee)\s*:?\s*([a-z][a-z0-9 .]*?)\s*(?:,|\n|\r|\t|$)', re.IGNORECASE)
+SELLER_PATTERN = re.compile(r'\b(?:seller|vendor)\s*:?\s*([a-z][a-z0-9 .]*?)\s*(?:,|\n|\r|\t|$)', re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT UNIQUE NOT NULL,
+    request_id TEXT,
+    signature BLOB NOT NULL,
+    survey TEXT,
+    owner TEXT,
+    seller TEXT,
+    latitude REAL,
+    longitude REAL,
+    verdict TEXT,
+    score REAL,
+    red_flags TEXT,
+    recorded_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    key INTEGER NOT NULL,
+    doc INTEGER NOT NULL,
+    PRIMARY KEY (key, doc)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS documents_survey ON documents (survey);
+"""
+
+_permutations = None
+_local = threading.local()
+
+
+def index_path() -> str:
+    return os.path.join(DOC_INDEX_DIR, 'index.sqlite3')
+
+
+def connect():
+    """This thread's connection to the index, opened (and the schema created) on first use"""
+    # Imported here so agents only load sqlite3 when the index is enabled
+    import sqlite3
+
+    path = index_path()
+    connection = getattr(_local, 'connections', {}).get(path)
+    if connection is None:
+        os.makedirs(DOC_INDEX_DIR, exist_ok=True)
+        # The three agents read and write concurrently from separate processes
+        connection = sqlite3.connect(path, timeout=10)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript(SCHEMA)
+        _local.__dict__.setdefault('connections', {})[path] = connection
+    return connection
+
+
+def normalize_text(text: str) -> list:
+    """Lowercased alphanumeric words, so OCR spacing and punctuation do not matter"""
+    text = unicodedata.normalize('NFKC', text).lower()
+    return re.findall(r'[0-9a-z\u0080-\uffff]+', text)
+
+
+def _normalize_name(name: str) -> str:
+    return ' '.join(normalize_text(name)) if name else None
+
+
+def _shingle_hashes(words: list) -> list:
+    count = max(1, len(words) - SHINGLE_WORDS + 1)
+    shingles = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(count)}
+    return [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), 'little') for s in shingles]
+
+
+def minhash(words: list) -> bytes:
+    """NUM_PERM 32-bit MinHash values as little-endian bytes"""
+    global _permutations
+    import numpy as np
+
+    if _permutations is None:
+        rng = np.random.RandomState(1)
+        _permutations = (
+            rng.randint(1, _MAX_HASH, size=NUM_PERM, dtype=np.uint64),
+            rng.randint(0, _MAX_HASH, size=NUM_PERM, dtype=np.uint64),
+        )
+    a, b = _permutations
+    hashes = np.array(_shingle_hashes(words), dtype=np.uint64)
+    values = (np.outer(hashes, a) + b) % np.uint64(_PRIME)
+    return (values.min(axis=0) & np.uint64(0xFFFFFFFF)).astype('<u4').tobytes()
+
+
+def band_keys(signature: bytes) -> list:
+    """One bucket key per band (63-bit, so it fits SQLite's signed integers)"""
+    size = ROWS * 4
+    return [
+        int.from_bytes(hashlib.blake2b(bytes([band]) + signature[band * size:(band + 1) * size],
+                                       digest_size=8).digest(), 'little') & 0x7FFFFFFFFFFFFFFF
+        for band in range(BANDS)
+    ]
+
+
+def similarity(signature: bytes, other: bytes) -> float:
+    """Estimated Jaccard similarity of two documents"""
+    import numpy as np
+    return float(np.mean(np.frombuffer(signature, dtype='<u4') == np.frombuffer(other, dtype='<u4')))
+
+
+def _first_match(pattern, text: str) -> str:
+    match = pattern.search(text)
+    return match.group(1).strip() if match else None
+
+
+def fingerprint(text: str) -> dict:
+    """Signature, bucket keys and extracted parcel identity of one document"""
+    words = normalize_text(text)
+    signature = minhash(words)
+    survey = _first_match(SURVEY_PATTERN, text)
+    return {
+        'sha256': hashlib.sha256(' '.join(words).encode('utf-8')).hexdigest(),
+        'signature': signature,
+        'bands': band_keys(signature),
+        'survey': re.sub(r'\s+', '', survey).lower() if survey else None,
+        'owner': _normalize_name(_first_match(OWNER_PATTERN, text)),
+        'seller': _normalize_name(_first_match(SELLER_PATTERN, text)),
+    }
+
+
+def _distance_km(lat1, lon1, lat2, lon2) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(min(1.0, h)))
+
+
+def _near_duplicates(connection, fp: dict, request_id: str) -> list:
+    placeholders = ','.join('?' * BANDS)
+    rows = connection.execute(
+        f"SELECT d.id, d.request_id, d.signature, d.verdict, d.score, d.red_flags, COUNT(*) AS shared "
+        f"FROM buckets b JOIN documents d ON d.id = b.doc WHERE b.key IN ({placeholders}) "
+        f"GROUP BY d.id ORDER BY shared DESC LIMIT {MAX_CANDIDATES}",
+        fp['bands']
+    ).fetchall()
+    matches = []
+    for _, match_request, signature, verdict, score, red_flags, _ in rows:
+        if request_id and match_request == request_id:
+            continue
+        estimate = similarity(fp['signature'], signature)
+        if estimate >= DOC_INDEX_SIMILARITY:
+            matches.append({
+                'request_id': match_request,
+                'similarity': round(estimate, 3),
+                'verdict': verdict,
+                'score': score,
+                'red_flags': json.loads(red_flags) if red_flags else [],
+            })
+    return sorted(matches, key=lambda m: m['similarity'], reverse=True)
+
+
+def _survey_conflicts(connection, fp: dict, request_id: str, latitude, longitude) -> list:
+    """Earlier documents naming the same survey number nearby under a different owner"""
+    if not fp['survey'] or not fp['owner']:
+        return []
+    conflicts = []
+    rows = connection.execute(
+        "SELECT request_id, owner, seller, latitude, longitude FROM documents WHERE survey = ?", (fp['survey'],)
+    ).fetchall()
+    for match_request, owner, seller, lat, lon in rows:
+        if (request_id and match_request == request_id) or not owner or owner == fp['owner']:
+            continue
+        if None not in (latitude, longitude, lat, lon) and \
+                _distance_km(latitude, longitude, lat, lon) > DOC_INDEX_SURVEY_RADIUS_KM:
+            continue
+        # The previous owner selling the parcel on is a normal chain of title
+        if owner == fp['seller']:
+            continue
+        conflicts.append({'request_id': match_request, 'survey': fp['survey'], 'owner': owner})
+    return conflicts
+
+
+def check_documents(fingerprints: list, request_id: str = None, latitude=None, longitude=None) -> dict:
+    """
+    Look up near-duplicates and survey number conflicts for a request's documents.
+
+    Returns:
+        Per-document matches, the best match that was rejected (or None),
+        red flags to report and the lookup time
+    """
+    connection = connect()
+    started = time.perf_counter()
+    documents = []
+    for fp in fingerprints:
+        documents.append({
+            'sha256': fp['sha256'],
+            'survey': fp['survey'],
+            'near_duplicates': _near_duplicates(connection, fp, request_id),
+            'survey_conflicts': _survey_conflicts(connection, fp, request_id, latitude, longitude),
+        })
+
+    rejected = [m for doc in documents for m in doc['near_duplicates'] if m['verdict'] == 'rejected']
+    red_flags = []
+    if rejected:
+        best = max(rejected, key=lambda m: m['similarity'])
+        red_flags.append(f"Near-duplicate ({best['similarity']:.0%}) of a previously rejected document")
+    for doc in documents:
+        for conflict in doc['survey_conflicts']:
+            red_flags.append(f"Survey No. {conflict['survey']} previously submitted under a different owner "
+                             f"({conflict['owner']})")
+    return {
+        'documents': documents,
+        'rejected_duplicate': max(rejected, key=lambda m: m['similarity']) if rejected else None,
+        'red_flags': list(dict.fromkeys(red_flags)),
+        'lookup_ms': round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+def verdict_from_result(result: dict) -> tuple:
+    """('rejected' | 'accepted' | None, authenticity score, red flags) from an agent1 result"""
+    verification = result.get('document_verification')
+    if not isinstance(verification, dict) or not isinstance(verification.get('authenticity_score'), (int, float)):
+        return None, None, []
+    score = verification['authenticity_score']
+    rejected = verification.get('is_land_document') is False or score <= REJECTION_SCORE
+    return ('rejected' if rejected else 'accepted'), score, list(verification.get('red_flags') or [])
+
+
+def record_documents(fingerprints: list, result: dict, request_id: str = None, latitude=None, longitude=None) -> None:
+    """Store documents with the verdict reached on them (resubmissions update the verdict)"""
+    verdict, score, red_flags = verdict_from_result(result)
+    connection = connect()
+    with connection:
+        for fp in fingerprints:
+            row = connection.execute("SELECT id FROM documents WHERE sha256 = ?", (fp['sha256'],)).fetchone()
+            values = (request_id, fp['survey'], fp['owner'], fp['seller'], latitude, longitude,
+                      verdict, score, json.dumps(red_flags), time.time())
+            if row:
+                connection.execute(
+                    "UPDATE documents SET request_id = ?, survey = ?, owner = ?, seller = ?, latitude = ?, "
+                    "longitude = ?, verdict = COALESCE(?, verdict), score = COALESCE(?, score), "
+                    "red_flags = ?, recorded_at = ? WHERE id = ?", values + (row[0],)
+                )
+                continue
+            doc_id = connection.execute(
+                "INSERT INTO documents (request_id, survey, owner, seller, latitude, longitude, verdict, score, "
+                "red_flags, recorded_at, sha256, signature) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                values + (fp['sha256'], fp['signature'])
+            ).lastrowid
+            connection.executemany("INSERT OR IGNORE INTO buckets (key, doc) VALUES (?, ?)",
+                                   [(key, doc_id) for key in fp['bands']])
+
+
+def screen(data: dict) -> tuple:
+    """
+    Fingerprint a request's documents and check them against the index
+    (called through doc_screening.screen_documents, which checks the flag).
+
+    Returns:
+        (fingerprints, check) or (None, None) when the lookup failed
+    """
+    documents = data['document_contents']
+    try:
+        with span('doc_index.lookup', documents=len(documents)) as s:
+            started = time.perf_counter()
+            fingerprints = [fingerprint(text) for text in documents]
+            signature_ms = round((time.perf_counter() - started) * 1000, 3)
+            check = check_documents(fingerprints, data.get('request_id'), data.get('latitude'), data.get('longitude'))
+            check['signature_ms'] = signature_ms
+            s.set(lookup_ms=check['lookup_ms'], red_flags=len(check['red_flags']))
+    except Exception as e:
+        logger.warning("Document index lookup failed: %s", e)
+        return None, None
+    if check['red_flags']:
+        logger.info("Document index: %s", '; '.join(check['red_flags']))
+    return fingerprints, check
+
+
+def record_verdict(fingerprints: list, result: dict, data: dict) -> None:
+    """Record agent1's verdict for the screened documents (failures are logged, not raised)"""
+    # A short-circuited rejection only repeats an indexed one; recording it would reinforce the match
+    if not fingerprints or result.get('error') or result.get('short_circuited'):
+        return
+    try:
+        record_documents(fingerprints, result, data.get('request_id'), data.get('latitude'), data.get('longitude'))
+    except Exception as e:
+        logger.warning("Could not record documents in the index: %s", e)
+
+
+def index_stats() -> dict:
+    connection = connect()
+    documents, rejected = connection.execute("SELECT COUNT(*), SUM(verdict = 'rejected') FROM documents").fetchone()
+    buckets = connection.execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+    return {'path': index_path(), 'documents': documents, 'rejected': rejected or 0, 'buckets': buckets}
+
+
+def _bench(count: int) -> dict:
+    """Fill a scratch index with synthetic deeds and time lookups of edited copies"""
+    import random
+    import tempfile
+
+    global DOC_INDEX_DIR
+    DOC_INDEX_DIR = tempfile.mkdtemp(prefix='doc-index-bench-')
+    rng = random.Random(5)
+    vocabulary = [f"w{i}" for i in range(5000)]
+
+    def deed(i):
+        words = [rng.choice(vocabulary) for _ in range(300)]
+        return words, f"SALE DEED\nSELLER: Seller {i}, BUYER: Buyer {i}, Survey No. {i}/1\n"
+
+    connection = connect()
+    edited = []
+    with connection:
+        for i in range(count):
+            words, header = deed(i)
+            fp = fingerprint(header + ' '.join(words))
+            doc_id = connection.execute(
+                "INSERT INTO documents (sha256, request_id, signature, survey, owner, seller, verdict, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (fp['sha256'], f"bench-{i}", fp['signature'], fp['survey'], fp['owner'], fp['seller'],
+                 'rejected' if i % 10 == 0 else 'accepted', time.time())
+            ).lastrowid
+            connection.executemany("INSERT INTO buckets (key, doc) VALUES (?, ?)",
+                                   [(key, doc_id) for key in fp['bands']])
+            if len(edited) < 200 and i % max(1, count // 200) == 0:
+                # A lightly edited resubmission: two words changed
+                words[rng.randrange(300)], words[rng.randrange(300)] = 'edited', 'copy'
+                edited.append(fingerprint(header + ' '.join(words)))
+
+    timings, found = [], 0
+    for fp in edited:
+        check = check_documents([fp])
+        timings.append(check['lookup_ms'])
+        found += bool(check['documents'][0]['near_duplicates'])
+    timings.sort()
+    return {
+        'documents': count,
+        'lookups': len(timings),
+        'near_duplicates_found': found,
+        'p50_ms': timings[len(timings) // 2],
+        'p99_ms': timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+    }
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    if command == 'stats':
+        print(json.dumps(index_stats(), indent=2))
+    elif command == 'bench':
+        print(json.dumps(_bench(int(sys.argv[2]) if len(sys.argv) > 2 else 100000), indent=2))
+    else:
+        print("Usage: python doc_index.py [stats | bench [documents]]", file=sys.stderr)
+        sys.exit(1)
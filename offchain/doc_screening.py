@@ -0,0 +1,88 @@
+"""
+Document Screening
+The agents' side of the document similarity index, cheap to import while it is off
+
+Holds the AGENT_DOC_INDEX flags and the helpers that work on a screening
+result. doc_index.py, with its patterns, MinHash and SQLite code, is only
+imported once the index is enabled and a request has documents to screen.
+"""
+import os
+
+AGENT_DOC_INDEX = os.getenv('AGENT_DOC_INDEX', '0').lower() in ('1', 'true', 'yes', 'on')
+
+# Answer near-duplicates of rejected documents without calling the model
+AGENT_DOC_INDEX_SHORT_CIRCUIT = os.getenv('AGENT_DOC_INDEX_SHORT_CIRCUIT', '0').lower() in ('1', 'true', 'yes', 'on')
+
+
+def screen_documents(data: dict) -> tuple:
+    """
+    Fingerprint a request's documents and check them against the index.
+
+    Returns:
+        (fingerprints, check) or (None, None) when the index is disabled,
+        there are no documents or the lookup failed
+    """
+    if not AGENT_DOC_INDEX or not data.get('document_contents'):
+        return None, None
+    # Imported here so agents with the index off never load it
+    from doc_index import screen
+
+    return screen(data)
+
+
+def record_verdict(fingerprints: list, result: dict, data: dict) -> None:
+    """Record agent1's verdict for the screened documents (failures are logged, not raised)"""
+    if not fingerprints:
+        return
+    from doc_index import record_verdict
+
+    record_verdict(fingerprints, result, data)
+
+
+def describe_check(check: dict) -> str:
+    """Prompt lines for the model ("" when nothing was found)"""
+    if not check or not check['red_flags']:
+        return ""
+    return "\n\nDOCUMENT INDEX FINDINGS:\n" + '\n'.join(f"- {flag}" for flag in check['red_flags'])
+
+
+def apply_flags(result: dict, check: dict) -> None:
+    """Attach the check to an agent result and add its red flags"""
+    if not check:
+        return
+    result['duplicate_check'] = check
+    for flag in check['red_flags']:
+        if flag not in result.setdefault('risk_factors', []):
+            result['risk_factors'].append(flag)
+        verification = result.get('document_verification')
+        if isinstance(verification, dict) and flag not in verification.setdefault('red_flags', []):
+            verification['red_flags'].append(flag)
+
+
+def rejection_result(check: dict, agent: str) -> dict:
+    """Agent response for a near-duplicate of a rejected document, without a model call"""
+    match = check['rejected_duplicate']
+    previous_flags = [flag for flag in match['red_flags'] if flag not in check['red_flags']]
+    result = {
+        'valuation': 0,
+        'confidence': 20,
+        'reasoning': f"REJECT: the submitted document is a {match['similarity']:.0%} near-duplicate of a document "
+                     f"rejected for request {match['request_id']} (authenticity score {match['score']}). "
+                     f"Previous findings: {'; '.join(previous_flags) or 'none recorded'}.",
+        'risk_factors': [],
+        'document_verification': {
+            'is_land_document': not any('NOT A LAND DOCUMENT' in flag.upper() for flag in previous_flags),
+            'document_type_found': 'Resubmitted document',
+            'authenticity_score': match['score'] if match['score'] is not None else 0,
+            'missing_fields': [],
+            'red_flags': previous_flags,
+        },
+        'agent': agent,
+        'short_circuited': True,
+    }
+    apply_flags(result, check)
+    return result
+
+
+def should_short_circuit(check: dict) -> bool:
+    return bool(AGENT_DOC_INDEX_SHORT_CIRCUIT and check and check['rejected_duplicate'])
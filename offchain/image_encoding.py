@@ -0,0 +1,107 @@
+"""
+Satellite Image Encoding
+Transcodes rendered layers to a compact format and builds a thumbnail variant
+
+SATELLITE_IMAGE_FORMAT picks the stored format: webp (default), avif, png
+(lossless, optimized) or original (Earth Engine's PNG as returned).
+SATELLITE_IMAGE_QUALITY applies to webp and avif. Requires Pillow; without
+it layers are stored unchanged.
+"""
+import io
+import os
+import time
+
+from tracing import get_logger
+
+logger = get_logger('image_encoding')
+
+SATELLITE_IMAGE_FORMAT = os.getenv('SATELLITE_IMAGE_FORMAT', 'webp').lower()
+SATELLITE_IMAGE_QUALITY = int(os.getenv('SATELLITE_IMAGE_QUALITY', '80'))
+
+# Longest side of the thumbnail variant, in pixels (0 disables thumbnails)
+SATELLITE_THUMBNAIL_SIZE = int(os.getenv('SATELLITE_THUMBNAIL_SIZE', '512'))
+
+# Pillow format name and file extension per supported format
+FORMATS = {
+    'webp': ('WEBP', '.webp'),
+    'avif': ('AVIF', '.avif'),
+    'png': ('PNG', '.png'),
+}
+
+
+def resolve_format(name: str = None) -> str:
+    """Configured format, falling back to webp when the Pillow build lacks AVIF"""
+    name = (name or SATELLITE_IMAGE_FORMAT).lower()
+    if name == 'original':
+        return name
+    if name not in FORMATS:
+        logger.warning("Unknown image format '%s', using webp", name)
+        return 'webp'
+    if name == 'avif':
+        from PIL import features
+        if not features.check('avif'):
+            logger.warning("Pillow was built without AVIF support, using webp")
+            return 'webp'
+    return name
+
+
+def _save(image, fmt: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    pil_format, _ = FORMATS[fmt]
+    if fmt == 'png':
+        image.save(buffer, pil_format, optimize=True)
+    else:
+        image.save(buffer, pil_format, quality=quality)
+    return buffer.getvalue()
+
+
+def encode_layer(data: bytes, fmt: str = None, quality: int = None, thumbnail_size: int = None) -> dict:
+    """
+    Transcode one rendered layer and build its thumbnail.
+
+    Args:
+        data: Image bytes as downloaded (PNG from getThumbURL)
+        fmt: 'webp', 'avif', 'png' or 'original' (default SATELLITE_IMAGE_FORMAT)
+        quality: Lossy quality 1-100 (default SATELLITE_IMAGE_QUALITY)
+        thumbnail_size: Longest thumbnail side (default SATELLITE_THUMBNAIL_SIZE)
+
+    Returns:
+        Encoded bytes, extension, thumbnail bytes (or None) and size/time stats
+    """
+    fmt = resolve_format(fmt)
+    quality = quality or SATELLITE_IMAGE_QUALITY
+    thumbnail_size = SATELLITE_THUMBNAIL_SIZE if thumbnail_size is None else thumbnail_size
+    started = time.perf_counter()
+
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        if fmt in ('webp', 'avif') and image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+
+        if fmt == 'original':
+            encoded, extension = data, '.png'
+        else:
+            encoded, extension = _save(image, fmt, quality), FORMATS[fmt][1]
+            # An "optimized" re-encode can lose to Earth Engine's own PNG; keep the smaller one
+            if len(encoded) >= len(data) and fmt == 'png':
+                encoded = data
+
+        thumbnail = None
+        if 0 < thumbnail_size < max(image.size):
+            preview = image.copy()
+            preview.thumbnail((thumbnail_size, thumbnail_size), Image.LANCZOS)
+            thumbnail = _save(preview, 'png' if fmt == 'original' else fmt, quality)
+
+    return {
+        'format': fmt,
+        'extension': extension,
+        'data': encoded,
+        'thumbnail': thumbnail,
+        'quality': quality if fmt in ('webp', 'avif') else None,
+        'original_bytes': len(data),
+        'encoded_bytes': len(encoded),
+        'thumbnail_bytes': len(thumbnail) if thumbnail else 0,
+        'encode_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
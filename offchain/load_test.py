@@ -0,0 +1,654 @@
+"""
+Offline Load Test
+Drives the Python pipeline (satellite service + 3 agents) against local stand-ins
+
+Starts local HTTP stand-ins for Groq, OpenRouter, Google Custom Search and
+the Earth Engine thumbnail host, installs a mocked `ee` module, points the
+agents and price oracle at the stand-ins and submits synthetic parcels at a
+target request rate. No API keys or network access are needed.
+
+Usage:
+    python load_test.py --rate 2 --duration 30 --concurrency 8
+    python load_test.py --config loadtest.json --output report.json
+
+Config file (all keys optional) overrides the stand-in profiles, e.g.:
+    {"groq": {"latency": "lognormal:900:0.4", "error_rate": 0.01, "rate_limit_rate": 0.05}}
+
+Latency specs: "fixed:<ms>", "uniform:<min_ms>:<max_ms>", "lognormal:<median_ms>:<sigma>".
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import types
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Stand-in behaviour per upstream service
+DEFAULT_PROFILES = {
+    'groq': {'latency': 'lognormal:900:0.4', 'error_rate': 0.01, 'rate_limit_rate': 0.02},
+    'openrouter': {'latency': 'lognormal:1500:0.5', 'error_rate': 0.02, 'rate_limit_rate': 0.03},
+    'custom_search': {'latency': 'lognormal:250:0.3', 'error_rate': 0.01, 'rate_limit_rate': 0.01},
+    'earthengine_api': {'latency': 'lognormal:600:0.5', 'error_rate': 0.01, 'rate_limit_rate': 0.0},
+    'earthengine_thumbs': {'latency': 'lognormal:1200:0.5', 'error_rate': 0.01, 'rate_limit_rate': 0.0,
+                           'image_side': 512},
+    'earthengine_tiles': {'latency': 'lognormal:250:0.4', 'error_rate': 0.005, 'rate_limit_rate': 0.0},
+}
+
+STAGES = ('satellite', 'agent1', 'agent2', 'agent3')
+
+
+def sample_latency(spec: str, rng: random.Random) -> float:
+    """Draw one latency in seconds from a latency spec string"""
+    kind, *params = spec.split(':')
+    values = [float(p) for p in params]
+    if kind == 'fixed':
+        ms = values[0]
+    elif kind == 'uniform':
+        ms = rng.uniform(values[0], values[1])
+    elif kind == 'lognormal':
+        ms = values[0] * math.exp(rng.gauss(0, values[1]))
+    else:
+        raise ValueError(f"Unknown latency spec: {spec}")
+    return ms / 1000
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies: list) -> dict:
+    """p50/p95/p99 in milliseconds"""
+    return {
+        'count': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+class Upstream:
+    """Shared behaviour and bookkeeping for one stand-in service"""
+
+    def __init__(self, name: str, profile: dict, seed: int):
+        self.name = name
+        self.profile = profile
+        self.rng = random.Random(f"{seed}:{name}")
+        self.lock = threading.Lock()
+        self.statuses = {}
+        self.latencies = []
+
+    def decide(self) -> tuple:
+        """Pick (delay seconds, HTTP status) for one request"""
+        with self.lock:
+            delay = sample_latency(self.profile['latency'], self.rng)
+            roll = self.rng.random()
+        if roll < self.profile.get('rate_limit_rate', 0):
+            return delay, 429
+        if roll < self.profile.get('rate_limit_rate', 0) + self.profile.get('error_rate', 0):
+            return delay, 500
+        return delay, 200
+
+    def record(self, status: int, delay: float) -> None:
+        with self.lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.latencies.append(delay)
+
+    def report(self) -> dict:
+        return {'statuses': {str(k): v for k, v in sorted(self.statuses.items())}, **summarize(self.latencies)}
+
+
+def chat_completion_body(seed_text: str) -> dict:
+    """OpenAI-compatible completion whose content also satisfies agent1's JSON schema"""
+    digest = sum(seed_text.encode('utf-8')) % 1000
+    content = {
+        "valuation": 400000 + digest * 100,
+        "confidence": 80,
+        "reasoning": "Stand-in analysis: sale deed with survey number, owner, location, area and boundaries present.",
+        "risk_factors": [],
+        "document_verification": {
+            "is_land_document": True,
+            "document_type_found": "Sale Deed",
+            "authenticity_score": 85,
+            "missing_fields": [],
+            "red_flags": []
+        }
+    }
+    prompt_tokens = max(1, len(seed_text) // 4)
+    return {
+        "id": "chatcmpl-loadtest",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "stand-in",
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": json.dumps(content)}
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": 150,
+            "total_tokens": prompt_tokens + 150,
+            "prompt_tokens_details": {"cached_tokens": int(prompt_tokens * 0.6)}
+        }
+    }
+
+
+def search_body(query: str) -> dict:
+    """Custom Search response with extractable prices"""
+    rng = random.Random(query)
+    items = []
+    for i in range(10):
+        price = rng.randint(150, 900) * 1000
+        items.append({
+            "title": f"Residential plot {i + 1} for sale",
+            "link": f"https://listings.example/{i}",
+            "snippet": f"Land parcel near {query[-30:]} listed at ${price:,} with clear title."
+        })
+    return {"searchInformation": {"totalResults": str(len(items))}, "items": items}
+
+
+@lru_cache(maxsize=512)
+def synthetic_png(key: str, side: int) -> bytes:
+    """Deterministic RGB PNG per URL (smooth field plus noise), so identical scenes deduplicate"""
+    rng = random.Random(key)
+    phase = rng.randint(0, 255)
+    noise = rng.randbytes(side * 3)
+    rows = []
+    for y in range(side):
+        row = bytearray(b'\x00')  # filter type: none
+        for x in range(side):
+            base = (x + y + phase) // 4
+            row += bytes(((base + noise[(x * 3 + y) % len(noise)] // 16) & 255,
+                          (base // 2 + 60) & 255, (200 - base // 3) & 255))
+        rows.append(bytes(row))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    header = struct.pack('>IIBBBBB', side, side, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(b''.join(rows), 6)) + chunk(b'IEND', b''))
+
+
+def make_handler(upstreams: dict):
+    """HTTP handler that routes by path to the matching stand-in"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _route(self):
+            if self.path.split('?')[0].endswith('/chat/completions'):
+                return 'groq' if '/openai/' in self.path else 'openrouter'
+            if self.path.startswith('/customsearch'):
+                return 'custom_search'
+            if self.path.startswith('/thumb'):
+                return 'earthengine_thumbs'
+            if self.path.startswith('/tile'):
+                return 'earthengine_tiles'
+            return None
+
+        def _send(self, status: int, body: bytes, content_type: str):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            if status == 429:
+                self.send_header('Retry-After', '0')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _handle(self, request_body: bytes):
+            name = self._route()
+            if name is None:
+                return self._send(404, b'{"error": "unknown stand-in path"}', 'application/json')
+
+            upstream = upstreams[name]
+            delay, status = upstream.decide()
+            time.sleep(delay)
+            upstream.record(status, delay)
+
+            if status != 200:
+                error = {'error': {'message': f'stand-in {name} returned {status}', 'code': status}}
+                return self._send(status, json.dumps(error).encode('utf-8'), 'application/json')
+
+            if name in ('groq', 'openrouter'):
+                body = json.dumps(chat_completion_body(request_body.decode('utf-8', 'replace'))).encode('utf-8')
+                return self._send(200, body, 'application/json')
+            if name == 'custom_search':
+                return self._send(200, json.dumps(search_body(self.path)).encode('utf-8'), 'application/json')
+
+            side = 256 if name == 'earthengine_tiles' else int(upstream.profile.get('image_side', 512))
+            body = synthetic_png(self.path, side)
+            return self._send(200, body, 'image/png')
+
+        def do_GET(self):
+            self._handle(b'')
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            self._handle(self.rfile.read(length))
+
+    return Handler
+
+
+def build_fake_ee(upstream: Upstream, thumb_base: str):
+    """
+    Minimal stand-in for the earthengine-api surface used by satellite_service.
+
+    Every getInfo()/getThumbURL()/getMapId() sleeps for a sampled Earth Engine latency
+    and may raise like the real client would.
+    """
+    ee = types.ModuleType('ee')
+
+    class EEException(Exception):
+        pass
+
+    def round_trip():
+        delay, status = upstream.decide()
+        time.sleep(delay)
+        upstream.record(status, delay)
+        if status == 429:
+            raise EEException('Too many concurrent aggregations.')
+        if status != 200:
+            raise EEException('Internal error (stand-in).')
+
+    class Computed:
+        def __init__(self, value=None, lon=0.0, lat=0.0):
+            self.value = value
+            self.lon = lon
+            self.lat = lat
+
+        def getInfo(self):
+            round_trip()
+            return self.value
+
+    class Geometry(Computed):
+        @staticmethod
+        def Point(coords):
+            return Geometry(lon=coords[0], lat=coords[1])
+
+        def buffer(self, radius, *args, **kwargs):
+            geometry = Geometry(lon=self.lon, lat=self.lat)
+            geometry.radius = radius
+            return geometry
+
+        @staticmethod
+        def Polygon(coords, *args, **kwargs):
+            lon, lat = coords[0][0]
+            return Geometry(lon=lon, lat=lat)
+
+        @staticmethod
+        def MultiPolygon(coords, *args, **kwargs):
+            lon, lat = coords[0][0][0]
+            return Geometry(lon=lon, lat=lat)
+
+    class Image(Computed):
+        def __init__(self, scene_id='S2_STANDIN', lon=0.0, lat=0.0):
+            properties = {
+                'CLOUDY_PIXEL_PERCENTAGE': round(random.Random(scene_id).uniform(0, 20), 2),
+                'GENERATION_TIME': int(time.time() * 1000),
+                'system:index': scene_id,
+            }
+            super().__init__({'id': scene_id, 'properties': properties}, lon, lat)
+            self.scene_id = scene_id
+
+        def normalizedDifference(self, bands):
+            return Image(self.scene_id + ':nd', self.lon, self.lat)
+
+        def rename(self, name):
+            return self
+
+        def select(self, *args, **kwargs):
+            return self
+
+        def reduceRegion(self, reducer=None, geometry=None, scale=None, maxPixels=None, **kwargs):
+            ndvi = random.Random(f"{self.lon:.3f},{self.lat:.3f}").uniform(0.1, 0.8)
+            return Computed({'NDVI': ndvi})
+
+        def getThumbURL(self, params):
+            round_trip()
+            key = f"{self.scene_id}-{abs(hash(json.dumps(params, sort_keys=True))) % 10 ** 8}"
+            return f"{thumb_base}/thumb/{key}.png"
+
+        def getMapId(self, params):
+            round_trip()
+            key = f"{self.scene_id}-{abs(hash(json.dumps(params, sort_keys=True))) % 10 ** 8}"
+            return {'tile_fetcher': types.SimpleNamespace(url_format=f"{thumb_base}/tile/{key}/{{z}}/{{x}}/{{y}}.png")}
+
+    class ImageCollection:
+        def __init__(self, name):
+            self.name = name
+            self.lon = 0.0
+            self.lat = 0.0
+            self.dates = None
+
+        def filterBounds(self, geometry):
+            self.lon, self.lat = geometry.lon, geometry.lat
+            return self
+
+        def filterDate(self, start, end):
+            self.dates = (start, end)
+            return self
+
+        def map(self, fn):
+            # Server-side per-scene reduction: one scene every 5 days with a seasonal NDVI curve
+            start, end = (value.millis if isinstance(value, Date) else 0 for value in self.dates)
+            features = []
+            step = 5 * 86400 * 1000
+            for time_start in range(start - start % step + step, end, step):
+                day = time_start / 86400000
+                rng = random.Random(f"{self.lon:.3f},{self.lat:.3f},{time_start}")
+                features.append({'properties': {
+                    'time': time_start,
+                    'ndvi': 0.45 + 0.2 * math.sin(2 * math.pi * day / 365.25) + rng.uniform(-0.05, 0.05),
+                    'cloud': rng.uniform(0, 80),
+                }})
+            return Computed({'type': 'FeatureCollection', 'features': features})
+
+        def sort(self, *args, **kwargs):
+            return self
+
+        def filter(self, condition):
+            self.tile = condition[1]
+            return self
+
+        def limit(self, count):
+            return self
+
+        def aggregate_array(self, prop):
+            # Catalog query: a few ranked scenes per tile
+            rng = random.Random(getattr(self, 'tile', self.name))
+            clouds = sorted(round(rng.uniform(0, 30), 2) for _ in range(5))
+            return {'system:id': [f"S2_{getattr(self, 'tile', 'T')}_{i}" for i in range(5)],
+                    'CLOUDY_PIXEL_PERCENTAGE': clouds,
+                    'system:time_start': [int(time.time() * 1000) - i * 86400000 for i in range(5)]}[prop]
+
+        def first(self):
+            if isinstance(self.name, list):
+                return Image(self.name[0].scene_id, self.lon, self.lat)
+            # Neighbouring parcels share a scene, as they would within one Sentinel-2 tile
+            return Image(f"S2_{round(self.lon, 1)}_{round(self.lat, 1)}", self.lon, self.lat)
+
+    class Date:
+        def __init__(self, millis):
+            self.millis = int(millis)
+
+    ee.EEException = EEException
+    ee.Date = Date
+    ee.Dictionary = Computed
+    ee.Filter = types.SimpleNamespace(eq=lambda name, value: (name, value))
+    ee.Feature = lambda geometry, properties: properties
+    ee.FeatureCollection = lambda collection: collection
+    ee.Authenticate = lambda *args, **kwargs: None
+    ee.Initialize = lambda *args, **kwargs: None
+    ee.data = types.SimpleNamespace(setDeadline=lambda milliseconds: None)
+    ee.Geometry = Geometry
+    ee.Image = Image
+    ee.ImageCollection = ImageCollection
+    ee.Reducer = types.SimpleNamespace(mean=lambda: 'mean')
+    return ee
+
+
+DEED_TEMPLATE = """SALE DEED
+This Deed of Sale is executed on {day} day of March 2024 at the office of the Sub-Registrar.
+SELLER: {seller}, residing at {house} Gandhi Road, Chennai 600{pin:03d}.
+BUYER: {buyer}, residing at {house2} Anna Salai, Chennai 600{pin2:03d}.
+PROPERTY: Survey No. {survey}/{sub}, Plot No. {plot}, Village Sholinganallur, Taluk Chengalpattu.
+TOTAL AREA: {area} square metres.
+BOUNDARIES: North - Survey No. {north}; South - 30 ft road; East - Plot No. {east}; West - Plot No. {west}.
+CONSIDERATION: Rs. {price:,} paid in full. Registered as Document No. {doc}/2024.
+"""
+
+
+def synthetic_parcel(index: int, rng: random.Random) -> dict:
+    """Random parcel clustered around a few subdivisions with one synthetic deed"""
+    centers = [(13.0827, 80.2707), (12.9716, 77.5946), (19.0760, 72.8777)]
+    lat, lon = rng.choice(centers)
+    area = rng.randint(150, 2000)
+    deed = DEED_TEMPLATE.format(
+        day=rng.randint(1, 28), seller=f"Seller {index}", buyer=f"Buyer {index}",
+        house=rng.randint(1, 400), house2=rng.randint(1, 400), pin=rng.randint(1, 120), pin2=rng.randint(1, 120),
+        survey=rng.randint(1, 999), sub=rng.randint(1, 9), plot=rng.randint(1, 300), area=area,
+        north=rng.randint(1, 999), east=rng.randint(1, 300), west=rng.randint(1, 300),
+        price=area * rng.randint(2000, 9000), doc=rng.randint(1000, 9999)
+    )
+    lat, lon = round(lat + rng.uniform(-0.01, 0.01), 6), round(lon + rng.uniform(-0.01, 0.01), 6)
+    # Square boundary matching the deed's area
+    half_lat = math.sqrt(area) / 2 / 111320
+    half_lon = half_lat / math.cos(math.radians(lat))
+    corners = [(lon - half_lon, lat - half_lat), (lon + half_lon, lat - half_lat),
+               (lon + half_lon, lat + half_lat), (lon - half_lon, lat + half_lat), (lon - half_lon, lat - half_lat)]
+    return {
+        'request_id': f"loadtest-{index}",
+        'latitude': lat,
+        'longitude': lon,
+        'boundary': {'type': 'Polygon', 'coordinates': [[[round(x, 7), round(y, 7)] for x, y in corners]]},
+        'document_contents': [deed * rng.randint(1, 4)],
+        'document_count': 1,
+    }
+
+
+class Pipeline:
+    """Runs one verification the way the orchestrator does: satellite, then 3 agents in parallel"""
+
+    def __init__(self, modules: dict, agent_pool: ThreadPoolExecutor):
+        self.modules = modules
+        self.agent_pool = agent_pool
+        self.lock = threading.Lock()
+        self.stage_latencies = {stage: [] for stage in STAGES}
+        self.stage_errors = {stage: {} for stage in STAGES}
+        self.request_latencies = []
+        self.completed = 0
+        self.failed = 0
+        self.tile_hits = 0
+        self.tile_misses = 0
+
+    def _record(self, stage: str, elapsed: float, error: str = None) -> None:
+        with self.lock:
+            self.stage_latencies[stage].append(elapsed)
+            if error:
+                key = error.split(':')[0][:80]
+                self.stage_errors[stage][key] = self.stage_errors[stage].get(key, 0) + 1
+
+    def _timed_agent(self, stage: str, package: dict) -> dict:
+        started = time.perf_counter()
+        try:
+            result = self.modules[stage].analyze_property(dict(package))
+        except Exception as e:
+            result = {'error': f"{type(e).__name__}: {e}"}
+        self._record(stage, time.perf_counter() - started, result.get('error'))
+        return result
+
+    def run(self, parcel: dict) -> None:
+        started = time.perf_counter()
+        try:
+            satellite_data = self.modules['satellite'].fetch_satellite_data(
+                parcel['latitude'], parcel['longitude'], parcel.get('boundary'))
+            self._record('satellite', time.perf_counter() - started)
+            tiles = satellite_data.get('tile_cache')
+            if tiles:
+                with self.lock:
+                    self.tile_hits += tiles['hits']
+                    self.tile_misses += tiles['misses']
+        except Exception as e:
+            self._record('satellite', time.perf_counter() - started, str(e))
+            with self.lock:
+                self.failed += 1
+                self.request_latencies.append(time.perf_counter() - started)
+            return
+
+        package = dict(parcel, satellite_data=satellite_data, location=f"{parcel['latitude']},{parcel['longitude']}")
+        futures = [self.agent_pool.submit(self._timed_agent, stage, package) for stage in ('agent1', 'agent2', 'agent3')]
+        results = [future.result() for future in futures]
+
+        with self.lock:
+            self.request_latencies.append(time.perf_counter() - started)
+            # The orchestrator needs at least 2 agent responses for consensus
+            if sum(1 for r in results if not r.get('error')) >= 2:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+
+def start_standins(profiles: dict, seed: int) -> tuple:
+    """Start the stand-in HTTP server and return (server, base URL, upstreams)"""
+    upstreams = {name: Upstream(name, profile, seed) for name, profile in profiles.items()}
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(upstreams))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", upstreams
+
+
+def configure_environment(base_url: str, work_dir: str, imagery: str) -> None:
+    """Point every client at the stand-ins (set before the agents load .env)"""
+    os.environ.update({
+        'GROQ_API_KEY': 'loadtest',
+        'GROQ_BASE_URL': base_url,
+        'OPENROUTER_API_KEY': 'loadtest',
+        'OPENROUTER_BASE_URL': f"{base_url}/api/v1",
+        'GOOGLE_API_KEY': 'loadtest',
+        'GOOGLE_CSE_ID': 'loadtest',
+        'GOOGLE_CSE_ENDPOINT': f"{base_url}/customsearch/v1",
+        'GOOGLE_EARTH_ENGINE_PROJECT_ID': 'loadtest',
+        'ARTIFACT_STORE_DIR': os.path.join(work_dir, 'artifacts'),
+        'TILE_CACHE_DIR': os.path.join(work_dir, 'tiles'),
+        'SATELLITE_IMAGERY_MODE': imagery,
+        'NDVI_HISTORY_DIR': os.path.join(work_dir, 'ndvi-history'),
+        'SCENE_CATALOG_DIR': os.path.join(work_dir, 'scene-catalog'),
+        'DOC_INDEX_DIR': os.path.join(work_dir, 'doc-index'),
+        'STAGE_CACHE_DIR': os.path.join(work_dir, 'stage-cache'),
+        'VALUATION_MODEL_DIR': os.path.join(work_dir, 'valuation-model'),
+    })
+
+
+def run_load(rate: float, duration: float, concurrency: int, profiles: dict, seed: int,
+             imagery: str = 'thumb') -> dict:
+    """Submit synthetic parcels at a fixed arrival rate and collect the report"""
+    server, base_url, upstreams = start_standins(profiles, seed)
+    work_dir = tempfile.mkdtemp(prefix='prop99-loadtest-')
+    configure_environment(base_url, work_dir, imagery)
+    sys.modules['ee'] = build_fake_ee(upstreams['earthengine_api'], base_url)
+    sys.path.insert(0, BASE_DIR)
+
+    import agent1
+    import agent2
+    import agent3
+    import satellite_service
+
+    modules = {'satellite': satellite_service, 'agent1': agent1, 'agent2': agent2, 'agent3': agent3}
+    rng = random.Random(seed)
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as request_pool, \
+                ThreadPoolExecutor(max_workers=concurrency * 3) as agent_pool:
+            pipeline = Pipeline(modules, agent_pool)
+            started = time.perf_counter()
+            futures = []
+            index = 0
+            # Open-loop arrivals: requests are submitted on schedule even if earlier ones are slow
+            while time.perf_counter() - started < duration:
+                next_at = started + index / rate
+                time.sleep(max(0.0, next_at - time.perf_counter()))
+                futures.append(request_pool.submit(pipeline.run, synthetic_parcel(index, rng)))
+                index += 1
+            for future in futures:
+                future.result()
+            elapsed = time.perf_counter() - started
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    tiles = pipeline.tile_hits + pipeline.tile_misses
+    return {
+        'config': {'rate': rate, 'duration_s': duration, 'concurrency': concurrency, 'seed': seed, 'imagery': imagery},
+        'requests': {
+            'submitted': index,
+            'completed': pipeline.completed,
+            'failed': pipeline.failed,
+            'throughput_rps': round(pipeline.completed / elapsed, 3) if elapsed else 0,
+            **summarize(pipeline.request_latencies),
+        },
+        'stages': {
+            stage: {**summarize(pipeline.stage_latencies[stage]), 'errors': pipeline.stage_errors[stage]}
+            for stage in STAGES
+        },
+        'upstreams': {name: upstream.report() for name, upstream in upstreams.items()},
+        'tile_cache': {
+            'hits': pipeline.tile_hits,
+            'misses': pipeline.tile_misses,
+            'hit_ratio': round(pipeline.tile_hits / tiles, 3) if tiles else None,
+        } if imagery == 'tiles' else None,
+    }
+
+
+def print_report(report: dict) -> None:
+    requests = report['requests']
+    print(f"\nRequests: {requests['submitted']} submitted, {requests['completed']} completed, "
+          f"{requests['failed']} failed, {requests['throughput_rps']} req/s")
+    print(f"End-to-end: p50 {requests['p50_ms']} ms, p95 {requests['p95_ms']} ms, p99 {requests['p99_ms']} ms\n")
+    print(f"{'stage':12} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  errors")
+    for stage, stats in report['stages'].items():
+        errors = ', '.join(f"{k} x{v}" for k, v in stats['errors'].items()) or '-'
+        print(f"{stage:12} {stats['count']:>6} {stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}  {errors}")
+    print(f"\n{'upstream':20} {'count':>6} {'p50 ms':>9} {'p99 ms':>9}  statuses")
+    for name, stats in report['upstreams'].items():
+        print(f"{name:20} {stats['count']:>6} {stats['p50_ms']:>9} {stats['p99_ms']:>9}  {stats['statuses']}")
+    if report.get('tile_cache'):
+        tiles = report['tile_cache']
+        print(f"\nTile cache: {tiles['hits']} hits, {tiles['misses']} misses, hit ratio {tiles['hit_ratio']}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Offline load test for the Python verification pipeline')
+    parser.add_argument('--rate', type=float, default=1.0, help='parcels submitted per second')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds to keep submitting')
+    parser.add_argument('--concurrency', type=int, default=8, help='parallel pipelines')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--config', help='JSON file overriding stand-in profiles')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--verbose', action='store_true', help='keep agent/service stderr output')
+    parser.add_argument('--imagery', choices=('thumb', 'tiles'), default='thumb',
+                        help='satellite imagery mode (tiles uses the shared tile cache)')
+    args = parser.parse_args()
+
+    profiles = {name: dict(profile) for name, profile in DEFAULT_PROFILES.items()}
+    if args.config:
+        with open(args.config) as f:
+            for name, overrides in json.load(f).items():
+                profiles.setdefault(name, {}).update(overrides)
+
+    print(f"🚀 Load test: {args.rate} req/s for {args.duration}s, concurrency {args.concurrency}")
+    sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stderr(open(os.devnull, 'w'))
+    with sink:
+        report = run_load(args.rate, args.duration, args.concurrency, profiles, args.seed, args.imagery)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📄 Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+NDVI History
+Per-parcel NDVI and cloud-cover time series, updated incrementally from Earth Engine
+
+Each parcel's history is a flat binary file of fixed-size records
+(acquisition time, mean NDVI, cloud cover) under NDVI_HISTORY_DIR. A refresh
+only asks Earth Engine for scenes acquired after the last stored one, so an
+update costs work proportional to the new scenes. Enabled in the satellite
+service with SATELLITE_NDVI_HISTORY=1.
+"""
+import hashlib
+import json
+import math
+import os
+import struct
+import time
+from datetime import datetime, timezone
+
+from artifact_store import write_atomic
+from tracing import get_logger, span
+
+logger = get_logger('ndvi_history')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+NDVI_HISTORY_DIR = os.getenv('NDVI_HISTORY_DIR', os.path.join(BASE_DIR, '.ndvi-history'))
+
+# How far back a new parcel's history starts
+NDVI_HISTORY_DAYS = int(os.getenv('NDVI_HISTORY_DAYS', '365'))
+
+# Skip the Earth Engine query if the history was checked this recently (Sentinel-2 revisits every ~5 days)
+NDVI_HISTORY_REFRESH_HOURS = float(os.getenv('NDVI_HISTORY_REFRESH_HOURS', '24'))
+
+# Scenes cloudier than this are kept in the store but left out of summaries
+NDVI_HISTORY_MAX_CLOUD = float(os.getenv('NDVI_HISTORY_MAX_CLOUD', '40'))
+
+# Re-query a few days before the last stored scene, since EE ingests some scenes late
+OVERLAP_MS = 3 * 86400 * 1000
+
+# time_start (ms since epoch), mean NDVI, cloudy pixel percentage
+RECORD = struct.Struct('<qff')
+
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def parcel_key(region: dict) -> str:
+    """Stable store key for a parcel's analysis region"""
+    return hashlib.sha256(json.dumps(region, sort_keys=True).encode('utf-8')).hexdigest()[:24]
+
+
+def history_path(key: str) -> str:
+    return os.path.join(NDVI_HISTORY_DIR, key[:2], key + '.bin')
+
+
+def load_history(key: str) -> list:
+    """Stored (time_ms, ndvi, cloud) records, oldest first"""
+    try:
+        with open(history_path(key), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    return list(RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size]))
+
+
+def save_history(key: str, records: list) -> None:
+    write_atomic(history_path(key), b''.join(RECORD.pack(*record) for record in records))
+
+
+def merge_records(records: list, new_records: list) -> list:
+    """Add scenes not already stored (by acquisition time), keeping time order"""
+    known = {record[0] for record in records}
+    added = [record for record in new_records if record[0] not in known]
+    return sorted(records + added) if added else records
+
+
+def query_scenes(ee, collection, region, start_ms: int, end_ms: int) -> list:
+    """Mean NDVI and cloud cover of every scene in a date range, in one Earth Engine round trip"""
+    def per_scene(image):
+        ndvi = image.normalizedDifference(['B8', 'B4']).reduceRegion(
+            reducer=ee.Reducer.mean(),
+            geometry=region,
+            scale=10,
+            maxPixels=1e9
+        ).get('nd')
+        return ee.Feature(None, {
+            'time': image.get('system:time_start'),
+            'ndvi': ndvi,
+            'cloud': image.get('CLOUDY_PIXEL_PERCENTAGE'),
+        })
+
+    scenes = ee.FeatureCollection(
+        collection.filterBounds(region).filterDate(ee.Date(start_ms), ee.Date(end_ms)).map(per_scene)
+    ).getInfo()
+
+    records = []
+    for feature in scenes.get('features', []):
+        properties = feature.get('properties', {})
+        if properties.get('time') is None:
+            continue
+        ndvi = properties.get('ndvi')
+        cloud = properties.get('cloud')
+        records.append((
+            int(properties['time']),
+            float('nan') if ndvi is None else float(ndvi),
+            float('nan') if cloud is None else float(cloud),
+        ))
+    return records
+
+
+def refresh_history(ee, collection, region, key: str, now: float = None) -> tuple:
+    """
+    Bring a parcel's history up to date.
+
+    Returns:
+        (all records, number of scenes fetched, whether Earth Engine was queried)
+    """
+    now = now or time.time()
+    path = history_path(key)
+    records = load_history(key)
+
+    # Checked recently, even if that check found no scenes (the file is written either way)
+    if os.path.exists(path) and now - os.path.getmtime(path) < NDVI_HISTORY_REFRESH_HOURS * 3600:
+        return records, 0, False
+
+    end_ms = int(now * 1000)
+    if records:
+        start_ms = records[-1][0] - OVERLAP_MS
+    else:
+        start_ms = end_ms - NDVI_HISTORY_DAYS * 86400 * 1000
+
+    with span('ee.ndvi_history', since=_iso_date(start_ms)) as s:
+        new_records = query_scenes(ee, collection, region, start_ms, end_ms)
+        s.set(scenes=len(new_records))
+
+    merged = merge_records(records, new_records)
+    # Rewriting also marks the history as checked for NDVI_HISTORY_REFRESH_HOURS
+    save_history(key, merged)
+    return merged, len(merged) - len(records), True
+
+
+def _iso_date(time_ms: int) -> str:
+    return datetime.fromtimestamp(time_ms / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+
+
+def summarize_history(records: list, max_cloud: float = None) -> dict:
+    """
+    Trend and seasonality of the clear-sky NDVI series.
+
+    Returns:
+        Scene counts, date span, latest/mean NDVI, linear trend per year and
+        monthly means with peak month and seasonal amplitude
+    """
+    max_cloud = NDVI_HISTORY_MAX_CLOUD if max_cloud is None else max_cloud
+    clear = [
+        (time_ms, ndvi) for time_ms, ndvi, cloud in records
+        if not math.isnan(ndvi) and not (cloud > max_cloud)
+    ]
+    summary = {
+        'scenes': len(records),
+        'clear_scenes': len(clear),
+        'max_cloud': max_cloud,
+    }
+    if not clear:
+        return summary
+
+    values = [ndvi for _, ndvi in clear]
+    summary.update({
+        'first_date': _iso_date(clear[0][0]),
+        'last_date': _iso_date(clear[-1][0]),
+        'latest_ndvi': round(values[-1], 4),
+        'mean_ndvi': round(sum(values) / len(values), 4),
+    })
+
+    # Least-squares slope in NDVI per year
+    if len(clear) >= 3:
+        years = [time_ms / (365.25 * 86400 * 1000) for time_ms, _ in clear]
+        mean_x = sum(years) / len(years)
+        mean_y = summary['mean_ndvi']
+        variance = sum((x - mean_x) ** 2 for x in years)
+        if variance > 0:
+            slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(years, values)) / variance
+            summary['trend_per_year'] = round(slope, 4)
+
+    by_month = {}
+    for time_ms, ndvi in clear:
+        month = datetime.fromtimestamp(time_ms / 1000, tz=timezone.utc).month
+        by_month.setdefault(month, []).append(ndvi)
+    monthly = {MONTHS[month - 1]: round(sum(v) / len(v), 4) for month, v in sorted(by_month.items())}
+    summary['monthly_mean'] = monthly
+    if len(monthly) >= 2:
+        summary['peak_month'] = max(monthly, key=monthly.get)
+        summary['seasonal_amplitude'] = round(max(monthly.values()) - min(monthly.values()), 4)
+
+        # How the latest scene compares with the usual value for its month
+        latest_month = MONTHS[datetime.fromtimestamp(clear[-1][0] / 1000, tz=timezone.utc).month - 1]
+        summary['latest_vs_month_mean'] = round(values[-1] - monthly[latest_month], 4)
+
+    return summary
+
+
+def describe_history(summary: dict) -> str:
+    """One prompt line per fact for the agents ("" when there is no usable history)"""
+    if not summary or not summary.get('clear_scenes'):
+        return ""
+    lines = [
+        f"- NDVI History: {summary['clear_scenes']} clear scenes {summary['first_date']} to {summary['last_date']}, "
+        f"mean {summary['mean_ndvi']}"
+    ]
+    if 'trend_per_year' in summary:
+        lines.append(f"- NDVI Trend: {summary['trend_per_year']:+.3f} per year")
+    if 'peak_month' in summary:
+        lines.append(f"- NDVI Seasonality: peak in {summary['peak_month']}, amplitude {summary['seasonal_amplitude']}, "
+                     f"latest scene {summary['latest_vs_month_mean']:+.3f} vs its month's mean")
+    return '\n' + '\n'.join(lines)
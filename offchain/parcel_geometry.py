@@ -0,0 +1,163 @@
+"""
+Parcel Geometry
+Local geodesic area, bounds and simplification for parcel boundaries given as GeoJSON
+
+The satellite service accepts the surveyed parcel boundary as a GeoJSON
+Polygon or MultiPolygon (bare geometry or Feature, coordinates in WGS84
+lon/lat). Area is computed on the WGS84 ellipsoid through an equal-area
+projection, so it costs no Earth Engine round trip, and the boundary is
+simplified before it is sent as the reduction region.
+"""
+import math
+import os
+
+# Maximum deviation of the simplified boundary from the surveyed one, in metres
+# (a fifth of a Sentinel-2 10 m pixel by default)
+PARCEL_SIMPLIFY_TOLERANCE_M = float(os.getenv('PARCEL_SIMPLIFY_TOLERANCE_M', '2'))
+
+# Radius of the analysis region when no boundary is given
+DEFAULT_BUFFER_M = 100
+
+# WGS84 ellipsoid
+SEMI_MAJOR_AXIS = 6378137.0
+FLATTENING = 1 / 298.257223563
+ECCENTRICITY = math.sqrt(FLATTENING * (2 - FLATTENING))
+
+
+def parse_boundary(geojson: dict) -> list:
+    """
+    Polygons of a GeoJSON Polygon/MultiPolygon (or a Feature wrapping one).
+
+    Returns:
+        List of polygons, each a list of closed rings of (lon, lat) tuples;
+        the first ring is the exterior, the rest are holes
+
+    Raises:
+        ValueError: If the geometry is not a usable polygon
+    """
+    if not isinstance(geojson, dict):
+        raise ValueError("Parcel boundary must be a GeoJSON object")
+    if geojson.get('type') == 'Feature':
+        geojson = geojson.get('geometry') or {}
+
+    geometry_type = geojson.get('type')
+    coordinates = geojson.get('coordinates')
+    if geometry_type == 'Polygon':
+        polygons = [coordinates]
+    elif geometry_type == 'MultiPolygon':
+        polygons = coordinates
+    else:
+        raise ValueError(f"Parcel boundary must be a Polygon or MultiPolygon, got {geometry_type}")
+    if not polygons:
+        raise ValueError("Parcel boundary has no coordinates")
+
+    parsed = []
+    for polygon in polygons:
+        rings = []
+        for ring in polygon or []:
+            points = [(float(point[0]), float(point[1])) for point in ring]
+            if points and points[0] != points[-1]:
+                points.append(points[0])
+            if len(points) < 4:
+                raise ValueError("Parcel boundary ring needs at least 3 distinct points")
+            for lon, lat in points:
+                if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+                    raise ValueError(f"Parcel boundary point out of range: {lon}, {lat}")
+            rings.append(points)
+        if not rings:
+            raise ValueError("Parcel boundary polygon has no rings")
+        parsed.append(rings)
+    return parsed
+
+
+def _authalic_q(latitude: float) -> float:
+    """q(phi) of the ellipsoid's equal-area (authalic) mapping"""
+    e = ECCENTRICITY
+    sin_lat = math.sin(math.radians(latitude))
+    return (1 - e * e) * (
+        sin_lat / (1 - (e * sin_lat) ** 2)
+        - math.log((1 - e * sin_lat) / (1 + e * sin_lat)) / (2 * e)
+    )
+
+
+def _ring_area(ring: list) -> float:
+    """Unsigned area of one ring in square metres (cylindrical equal-area projection + shoelace)"""
+    # Unwrap longitudes against the first vertex so rings crossing the antimeridian stay contiguous
+    lon0 = ring[0][0]
+    projected = []
+    for lon, lat in ring:
+        d_lon = (lon - lon0 + 180) % 360 - 180
+        projected.append((SEMI_MAJOR_AXIS * math.radians(d_lon), SEMI_MAJOR_AXIS * _authalic_q(lat) / 2))
+    twice_area = sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(projected, projected[1:]))
+    return abs(twice_area) / 2
+
+
+def geodesic_area(polygons: list) -> float:
+    """Area in square metres on the WGS84 ellipsoid, holes excluded"""
+    return sum(_ring_area(rings[0]) - sum(_ring_area(hole) for hole in rings[1:]) for rings in polygons)
+
+
+def bounds(polygons: list) -> list:
+    """[west, south, east, north] of the exterior rings"""
+    lons = [lon for rings in polygons for lon, _ in rings[0]]
+    lats = [lat for rings in polygons for _, lat in rings[0]]
+    return [min(lons), min(lats), max(lons), max(lats)]
+
+
+def _simplify_indices(points: list, first: int, last: int, tolerance: float) -> list:
+    """Douglas-Peucker over points[first..last] (planar metres); returns the kept indices in order"""
+    keep = {first, last}
+    stack = [(first, last)]
+    while stack:
+        start, end = stack.pop()
+        (x0, y0), (x1, y1) = points[start], points[end]
+        dx, dy = x1 - x0, y1 - y0
+        length = math.hypot(dx, dy)
+        farthest, max_distance = None, tolerance
+        for i in range(start + 1, end):
+            x, y = points[i]
+            if length:
+                distance = abs(dy * (x - x0) - dx * (y - y0)) / length
+            else:
+                distance = math.hypot(x - x0, y - y0)
+            if distance > max_distance:
+                farthest, max_distance = i, distance
+        if farthest is not None:
+            keep.add(farthest)
+            stack.append((start, farthest))
+            stack.append((farthest, end))
+    return sorted(keep)
+
+
+def simplify(polygons: list, tolerance_m: float = None) -> list:
+    """
+    Drop boundary vertices that move the outline by less than the tolerance.
+
+    Rings are simplified in a local metric frame; a ring that would collapse
+    below a triangle is kept as surveyed.
+    """
+    tolerance_m = PARCEL_SIMPLIFY_TOLERANCE_M if tolerance_m is None else tolerance_m
+    if tolerance_m <= 0:
+        return polygons
+
+    _, south, _, north = bounds(polygons)
+    metres_per_degree = math.pi * SEMI_MAJOR_AXIS / 180
+    metres_per_degree_lon = metres_per_degree * math.cos(math.radians((south + north) / 2))
+
+    simplified = []
+    for rings in polygons:
+        kept_rings = []
+        for ring in rings:
+            lon0 = ring[0][0]
+            local = [(((lon - lon0 + 180) % 360 - 180) * metres_per_degree_lon, lat * metres_per_degree)
+                     for lon, lat in ring]
+            # The ring is closed, so split it at the vertex farthest from the start and simplify both halves
+            far = max(range(len(local)), key=lambda i: math.hypot(local[i][0] - local[0][0], local[i][1] - local[0][1]))
+            indices = _simplify_indices(local, 0, far, tolerance_m) + _simplify_indices(local, far, len(ring) - 1, tolerance_m)[1:]
+            kept_rings.append([ring[i] for i in indices] if len(indices) >= 4 else ring)
+        simplified.append(kept_rings)
+    return simplified
+
+
+def vertex_count(polygons: list) -> int:
+    return sum(len(ring) for rings in polygons for ring in rings)
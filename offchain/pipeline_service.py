@@ -0,0 +1,284 @@
+"""
+Pipeline Service
+Long-running local HTTP service that shares satellite fetches and market searches between concurrent requests
+
+Requests with the same normalized key (coordinates rounded to
+SERVICE_COORD_DECIMALS, boundary, search location) join the computation
+already in flight instead of starting their own, and upstream work is
+bounded per endpoint. Runs on asyncio with the blocking fetches on a
+thread pool; no extra dependencies.
+
+    python pipeline_service.py [--host 127.0.0.1] [--port 8765]
+
+Endpoints (JSON in, JSON out):
+    POST /satellite   {"latitude", "longitude", "boundary"?, "deadline"?}  -> fetch_satellite_data result
+    POST /market      {"location", "latitude", "longitude", "area_sqm", "deadline"?}  -> get_market_valuation result
+    GET  /stats       requests, upstream calls and coalescing ratio per endpoint
+    GET  /health
+
+Point clients at it with PIPELINE_SERVICE_URL (e.g. http://127.0.0.1:8765):
+agent2's market search and the orchestrator's satellite fetch then go through
+the service, falling back to running locally if it is unreachable.
+
+A request's "deadline" (Unix time, see deadline.py) bounds how long it waits
+(504 once it passes). A computation runs under the latest deadline among the
+requests waiting for it (none if any of them has none), so a waiter may
+still receive a result with optional steps skipped (listed under "skipped").
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import re
+import sys
+import time
+
+from deadline import annotate, deadline_scope, extend_deadline, new_scope, read_deadline
+from profiling import pop_profile_flag, profiled
+from tracing import get_logger
+
+logger = get_logger('pipeline_service')
+
+SERVICE_HOST = os.getenv('SERVICE_HOST', '127.0.0.1')
+SERVICE_PORT = int(os.getenv('SERVICE_PORT', '8765'))
+
+# Requests within ~1 m (5 decimals) share one satellite fetch
+SERVICE_COORD_DECIMALS = int(os.getenv('SERVICE_COORD_DECIMALS', '5'))
+
+# Upstream computations running at once per endpoint (Earth Engine limits concurrent requests)
+SERVICE_SATELLITE_CONCURRENCY = int(os.getenv('SERVICE_SATELLITE_CONCURRENCY', '4'))
+SERVICE_MARKET_CONCURRENCY = int(os.getenv('SERVICE_MARKET_CONCURRENCY', '8'))
+
+MAX_BODY_BYTES = 1 << 20
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large', 502: 'Bad Gateway',
+           504: 'Gateway Timeout'}
+
+COORDINATE_PAIR = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+class SingleFlight:
+    """Runs one blocking computation per key at a time; later callers with the key await the same result"""
+
+    def __init__(self, name: str, concurrency: int, executor):
+        self.name = name
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.executor = executor
+        self.in_flight = {}
+        self.stats = {'requests': 0, 'upstream_calls': 0, 'coalesced': 0, 'errors': 0,
+                      'max_in_flight': 0, 'upstream_ms': 0.0}
+
+    async def run(self, key: str, fn, *args, deadline: float = None):
+        """
+        Result of fn(*args) for this key; raises asyncio.TimeoutError once deadline (Unix time) passes.
+
+        fn runs in a deadline scope that callers joining later extend to their own deadline.
+        """
+        self.stats['requests'] += 1
+        flight = self.in_flight.get(key)
+        if flight is None:
+            scope = new_scope(deadline)
+            # A separate task, so a disconnecting first caller does not cancel it for the others
+            task = asyncio.get_running_loop().create_task(self._compute(scope, fn, *args))
+            self.in_flight[key] = (task, scope)
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], len(self.in_flight))
+        else:
+            task, scope = flight
+            extend_deadline(scope, deadline)
+            self.stats['coalesced'] += 1
+        if deadline is None:
+            return await asyncio.shield(task)
+        # Only this caller stops waiting; the computation continues for the others
+        return await asyncio.wait_for(asyncio.shield(task), max(0.0, deadline - time.time()))
+
+    async def _compute(self, scope: dict, fn, *args):
+        async with self.semaphore:
+            self.stats['upstream_calls'] += 1
+            started = time.perf_counter()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    self.executor, contextvars.copy_context().run, run_in_scope, scope, fn, *args)
+            finally:
+                self.stats['upstream_ms'] += (time.perf_counter() - started) * 1000
+
+    def _finish(self, key: str, task) -> None:
+        self.in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self.stats['errors'] += 1
+
+    def report(self) -> dict:
+        stats = self.stats
+        return {
+            **{name: value for name, value in stats.items() if name != 'upstream_ms'},
+            'in_flight': len(self.in_flight),
+            'concurrency': self.concurrency,
+            'coalescing_ratio': round(stats['coalesced'] / stats['requests'], 3) if stats['requests'] else None,
+            'avg_upstream_ms': round(stats['upstream_ms'] / stats['upstream_calls'], 1) if stats['upstream_calls'] else None,
+        }
+
+
+def run_in_scope(scope: dict, fn, *args):
+    with deadline_scope(scope=scope):
+        return fn(*args)
+
+
+def normalize_location(location: str, latitude: float, longitude: float) -> str:
+    """Search location with whitespace/case folded; bare "lat,lon" strings are rounded like coordinates"""
+    match = COORDINATE_PAIR.match(location or '')
+    if match:
+        return f"{round(float(match.group(1)), SERVICE_COORD_DECIMALS)},{round(float(match.group(2)), SERVICE_COORD_DECIMALS)}"
+    return ' '.join((location or f"{latitude},{longitude}").lower().split())
+
+
+class PipelineService:
+    """Routes requests to the single-flight groups"""
+
+    def __init__(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=SERVICE_SATELLITE_CONCURRENCY + SERVICE_MARKET_CONCURRENCY, thread_name_prefix='upstream')
+        self.satellite = SingleFlight('satellite', SERVICE_SATELLITE_CONCURRENCY, self.executor)
+        self.market = SingleFlight('market', SERVICE_MARKET_CONCURRENCY, self.executor)
+        self.started_at = time.time()
+
+    async def fetch_satellite(self, payload: dict) -> dict:
+        from satellite_service import fetch_satellite_data
+
+        latitude = round(float(payload['latitude']), SERVICE_COORD_DECIMALS)
+        longitude = round(float(payload['longitude']), SERVICE_COORD_DECIMALS)
+        boundary = payload.get('boundary')
+        deadline = read_deadline(payload)
+        key = json.dumps([latitude, longitude, boundary], sort_keys=True)
+        # fetch_satellite_data keeps the scope SingleFlight runs it in
+        return await self.satellite.run(key, fetch_satellite_data, latitude, longitude, boundary,
+                                        deadline=deadline)
+
+    async def market_valuation(self, payload: dict) -> dict:
+        from src.services.priceOracle import apply_area_valuation, search_market_prices
+
+        latitude = round(float(payload.get('latitude', 0)), SERVICE_COORD_DECIMALS)
+        longitude = round(float(payload.get('longitude', 0)), SERVICE_COORD_DECIMALS)
+        location = payload.get('location') or f"{latitude},{longitude}"
+        deadline = read_deadline(payload)
+        # The queries use the location text and the coordinates; normalizing only groups requests
+        key = json.dumps([normalize_location(location, latitude, longitude), latitude, longitude])
+
+        def search():
+            return annotate(search_market_prices(location, latitude, longitude))
+
+        # The search does not depend on the parcel's area, so parcels of any size share it
+        price_data = await self.market.run(key, search, deadline=deadline)
+        if price_data.get('error'):
+            return price_data
+        return apply_area_valuation(dict(price_data), float(payload.get('area_sqm', 0)))
+
+    def stats(self) -> dict:
+        return {
+            'uptime_s': int(time.time() - self.started_at),
+            'satellite': self.satellite.report(),
+            'market': self.market.report(),
+        }
+
+    async def dispatch(self, method: str, path: str, body: bytes) -> tuple:
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok'}
+        if method == 'GET' and path == '/stats':
+            return 200, self.stats()
+        routes = {'/satellite': self.fetch_satellite, '/market': self.market_valuation}
+        if method != 'POST' or path not in routes:
+            return 404, {'error': f"No route for {method} {path}"}
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError as e:
+            return 400, {'error': f"Invalid JSON: {e}"}
+        try:
+            return 200, await routes[path](payload)
+        except (KeyError, TypeError, ValueError) as e:
+            return 400, {'error': f"Invalid request: {e}"}
+        except asyncio.TimeoutError:
+            return 504, {'error': f"Deadline passed before {path} finished"}
+        except Exception as e:
+            logger.warning("%s failed: %s", path, e)
+            return 502, {'error': str(e)}
+
+    async def handle(self, reader, writer) -> None:
+        """Minimal HTTP/1.1: one JSON request per connection"""
+        try:
+            request_line = await reader.readline()
+            method, path = request_line.decode('latin-1').split(' ')[:2]
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+            if length > MAX_BODY_BYTES:
+                status, response = 413, {'error': 'Request body too large'}
+            else:
+                body = await reader.readexactly(length) if length else b''
+                status, response = await self.dispatch(method, path.split('?')[0], body)
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            status, response = 400, {'error': f"Malformed request: {e}"}
+
+        data = json.dumps(response).encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode('latin-1') + data
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+
+async def serve(host: str, port: int, ready=None) -> None:
+    """Run the service until cancelled; ready(server) is called once it is listening"""
+    service = PipelineService()
+    server = await asyncio.start_server(service.handle, host, port)
+    server.service = service
+    logger.info("🛰️  Pipeline service listening on http://%s:%d", host, server.sockets[0].getsockname()[1])
+    if ready:
+        ready(server)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.executor.shutdown(wait=False)
+
+
+def request_service(base_url: str, path: str, payload: dict, timeout: float = 180) -> dict:
+    """POST to a running pipeline service; raises on connection errors and non-200 responses"""
+    import urllib.error
+    import urllib.request
+
+    request = urllib.request.Request(
+        base_url.rstrip('/') + path,
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(f"Pipeline service returned {e.code}: {e.read().decode('utf-8', 'replace')[:200]}")
+
+
+if __name__ == "__main__":
+    # --profile / PROFILE=cpu,sample,memory writes profiles to PROFILE_DIR on shutdown (see profiling.py)
+    parser = argparse.ArgumentParser(description='Single-flight satellite and market service')
+    parser.add_argument('--host', default=SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=SERVICE_PORT)
+    args = parser.parse_args(pop_profile_flag(sys.argv[1:]))
+
+    with profiled('pipeline_service'):
+        try:
+            asyncio.run(serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,180 @@
+"""
+On-Demand Profiling
+CPU and memory profiling hooks for the Python entry points, off unless requested
+
+Enable with PROFILE=<modes> or a --profile[=<modes>] argument, where modes
+is a comma-separated list of:
+    cpu     deterministic cProfile, written as <name>-<stamp>.pstats
+    sample  sampling profiler, written as collapsed stacks (<name>-<stamp>.collapsed)
+            for flamegraph.pl, speedscope or inferno
+    memory  tracemalloc top allocation sites (<name>-<stamp>.alloc.txt)
+    all     all of the above (also PROFILE=1)
+
+Artifacts go to PROFILE_DIR (default offchain/.profiles), one set per
+request. When profiling is off, profiled() only checks an empty set.
+"""
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from tracing import get_logger
+
+logger = get_logger('profiling')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(BASE_DIR, '.profiles'))
+
+# Sampling interval for the 'sample' mode
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+
+# Allocation sites listed in the memory report, and traceback depth kept per allocation
+PROFILE_TOP_ALLOCATIONS = int(os.getenv('PROFILE_TOP_ALLOCATIONS', '25'))
+PROFILE_TRACE_FRAMES = int(os.getenv('PROFILE_TRACE_FRAMES', '10'))
+
+ALL_MODES = ('cpu', 'sample', 'memory')
+
+
+def parse_modes(value: str) -> set:
+    """Profiling modes from a PROFILE / --profile value"""
+    if not value or value.lower() in ('0', 'false', 'off', 'no'):
+        return set()
+    modes = {mode.strip().lower() for mode in value.split(',') if mode.strip()}
+    if modes & {'1', 'true', 'on', 'yes', 'all'}:
+        return set(ALL_MODES)
+    unknown = modes - set(ALL_MODES)
+    if unknown:
+        logger.warning("Ignoring unknown profiling modes: %s", ', '.join(sorted(unknown)))
+    return modes & set(ALL_MODES)
+
+
+_modes = parse_modes(os.getenv('PROFILE', ''))
+
+
+def pop_profile_flag(args: list) -> list:
+    """
+    Enable profiling from a --profile or --profile=<modes> argument.
+
+    Returns:
+        The remaining arguments, for the entry point's own parsing
+    """
+    global _modes
+    remaining = []
+    for arg in args:
+        if arg == '--profile':
+            _modes = set(ALL_MODES)
+        elif arg.startswith('--profile='):
+            _modes = parse_modes(arg.split('=', 1)[1])
+        else:
+            remaining.append(arg)
+    return remaining
+
+
+class _StackSampler(threading.Thread):
+    """Samples every other thread's Python stack at a fixed interval"""
+
+    def __init__(self, interval: float):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.interval = interval
+        self.counts = {}
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            names.update((t.ident, t.name) for t in threading.enumerate())
+            for ident, frame in sys._current_frames().items():
+                if ident == self.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, 'thread'))
+                key = ';'.join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items()))
+
+
+def _write_allocations(path: str, snapshot, peak: int) -> None:
+    import tracemalloc
+
+    # Leave out the profiler's own bookkeeping
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+    stats = snapshot.statistics('traceback')
+    with open(path, 'w') as f:
+        f.write(f"Peak traced memory: {peak / 1024:.1f} KiB\n")
+        f.write(f"Live at exit: {sum(stat.size for stat in stats) / 1024:.1f} KiB in {len(stats)} sites\n\n")
+        for rank, stat in enumerate(stats[:PROFILE_TOP_ALLOCATIONS], 1):
+            f.write(f"#{rank}: {stat.size / 1024:.1f} KiB in {stat.count} blocks\n")
+            for line in stat.traceback.format(most_recent_first=True):
+                f.write(f"    {line}\n")
+
+
+@contextmanager
+def profiled(name: str):
+    """Profile the enclosed block per the active modes and write artifacts under PROFILE_DIR"""
+    if not _modes:
+        yield
+        return
+
+    # Import before any profiler starts so the imports don't show up in the profiles
+    import cProfile
+    import tracemalloc
+
+    modes = set(_modes)
+    profiler = sampler = None
+    if 'memory' in modes:
+        tracemalloc.start(PROFILE_TRACE_FRAMES)
+    if 'sample' in modes:
+        sampler = _StackSampler(PROFILE_SAMPLE_INTERVAL_MS / 1000)
+        sampler.start()
+    if 'cpu' in modes:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+        if sampler:
+            sampler.stop()
+        snapshot = peak = None
+        if 'memory' in modes:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        stem = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            written = []
+            if profiler:
+                profiler.dump_stats(stem + '.pstats')
+                written.append(stem + '.pstats')
+            if sampler:
+                with open(stem + '.collapsed', 'w') as f:
+                    f.write(sampler.collapsed())
+                written.append(f"{stem}.collapsed ({sampler.samples} samples)")
+            if snapshot:
+                _write_allocations(stem + '.alloc.txt', snapshot, peak)
+                written.append(stem + '.alloc.txt')
+            logger.info("Profile written: %s", ', '.join(written))
+        except Exception as e:
+            # Profiling must never fail the request it observes
+            logger.warning("Could not write profile artifacts: %s", e)
@@ -5,60 +5,278 @@ Fetches satellite imagery using Google Earth Engine
 import os
 import sys
 import json
-import ee
-import requests
-import tempfile
+import math
+import contextvars
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
 
-load_dotenv()
+from artifact_store import collect_garbage_if_due, put_artifact, read_meta
+from deadline import annotate, can_afford, deadline_scope, read_deadline, request_timeout, skip, skipped
+from image_encoding import SATELLITE_IMAGE_FORMAT, SATELLITE_IMAGE_QUALITY, SATELLITE_THUMBNAIL_SIZE, encode_layer
+from ndvi_history import parcel_key, refresh_history, summarize_history
+from parcel_geometry import DEFAULT_BUFFER_M, PARCEL_SIMPLIFY_TOLERANCE_M, bounds, geodesic_area, parse_boundary, simplify, vertex_count
+from profiling import pop_profile_flag, profiled
+from scene_catalog import best_scene_ids
+from stage_cache import run_stage, scene_window_end, stage_log
+from tile_cache import new_tile_stats, prune_tiles_if_due, render_layer, summarize_tile_stats
+from tracing import Trace, get_logger, span
 
-def fetch_satellite_data(latitude, longitude):
+logger = get_logger('satellite')
+
+# Threads encoding downloaded layers while the remaining layers download
+SATELLITE_ENCODE_WORKERS = int(os.getenv('SATELLITE_ENCODE_WORKERS', '4'))
+
+# 'thumb' renders each layer per parcel; 'tiles' composes it from the shared tile cache
+SATELLITE_IMAGERY_MODE = os.getenv('SATELLITE_IMAGERY_MODE', 'thumb').lower()
+
+# Keep a per-parcel NDVI time series and report its trend and seasonality
+SATELLITE_NDVI_HISTORY = os.getenv('SATELLITE_NDVI_HISTORY', '0').lower() in ('1', 'true', 'yes', 'on')
+
+# Pick the scene from the per-tile catalog (scene_catalog.py) instead of sorting a year per request
+SATELLITE_SCENE_CATALOG = os.getenv('SATELLITE_SCENE_CATALOG', '0').lower() in ('1', 'true', 'yes', 'on')
+
+# Scenes are searched over this many days before the request
+SCENE_WINDOW_DAYS = 365
+
+# Under a deadline, the optional layers (CIR, true color) and the NDVI history
+# are only fetched with at least this much of the budget left
+SATELLITE_OPTIONAL_LAYER_BUDGET_S = float(os.getenv('SATELLITE_OPTIONAL_LAYER_BUDGET_S', '15'))
+SATELLITE_HISTORY_BUDGET_S = float(os.getenv('SATELLITE_HISTORY_BUDGET_S', '20'))
+
+# Layers every result needs; the rest are dropped first when time is short
+REQUIRED_LAYERS = ('rgb', 'ndvi')
+
+# ee.data.setDeadline is process-wide, so it is only used when this process serves a single
+# request (the CLI); shared processes (pipeline_service.py) check the budget before each call instead
+EE_PROCESS_DEADLINE = False
+
+def download_layer(requests, url, kind, label):
+    """Download one rendered layer and return its bytes (None on a non-200 response)"""
+    logger.debug("Downloading %s image...", label)
+    with span(f'download.{kind}') as s:
+        response = requests.get(url, timeout=request_timeout(45))
+        s.set(status=response.status_code, bytes=len(response.content))
+    if response.status_code != 200:
+        return None
+    return response.content
+
+def store_layer(data, kind, label):
+    """Encode one layer, store it and its thumbnail in the artifact store and return its handle"""
+    with span(f'encode.{kind}') as s:
+        try:
+            encoded = encode_layer(data)
+        except Exception as e:
+            logger.warning("Could not encode %s image, storing it unchanged: %s", label, e)
+            encoded = {
+                'format': 'original', 'extension': '.png', 'data': data, 'thumbnail': None, 'quality': None,
+                'original_bytes': len(data), 'encoded_bytes': len(data), 'thumbnail_bytes': 0, 'encode_ms': 0.0,
+            }
+        s.set(format=encoded['format'], original_bytes=encoded['original_bytes'], encoded_bytes=encoded['encoded_bytes'])
+    
+    handle = put_artifact(encoded['data'], encoded['extension'], kind)
+    if encoded['thumbnail']:
+        handle['thumbnail'] = put_artifact(encoded['thumbnail'], encoded['extension'], f"{kind}_thumbnail")
+    handle['encoding'] = {key: encoded[key] for key in (
+        'format', 'quality', 'original_bytes', 'encoded_bytes', 'thumbnail_bytes', 'encode_ms'
+    )}
+    
+    note = " (already stored)" if handle['deduplicated'] else ""
+    logger.info("%s image saved: %d -> %d bytes as %s in %.0f ms%s", label, encoded['original_bytes'],
+                encoded['encoded_bytes'], encoded['format'], encoded['encode_ms'], note)
+    return handle
+
+def summarize_encoding(artifacts):
+    """Original vs encoded bytes and encode time per layer, plus totals"""
+    layers = {kind: handle['encoding'] for kind, handle in artifacts.items()}
+    return {
+        'layers': layers,
+        'original_bytes': sum(layer['original_bytes'] for layer in layers.values()),
+        'encoded_bytes': sum(layer['encoded_bytes'] for layer in layers.values()),
+        'thumbnail_bytes': sum(layer['thumbnail_bytes'] for layer in layers.values()),
+    }
+
+def fetch_satellite_data(latitude, longitude, boundary=None, deadline=None):
+    """
+    Fetch satellite imagery and metrics, with a per-stage trace under 'trace'.
+    
+    boundary is the parcel's GeoJSON Polygon/MultiPolygon; without it the
+    analysis covers a 100 m radius around the point. deadline (Unix time)
+    caps every Earth Engine call and download; optional layers left out to
+    meet it are listed under 'skipped'.
+    """
+    with Trace('satellite') as trace, stage_log() as stages, deadline_scope(deadline):
+        # Reused while the parcel, scene window and imagery settings are unchanged (STAGE_CACHE);
+        # results missing layers (deadline skips, failed downloads) are not stored
+        result = run_stage('satellite', satellite_stage_inputs(latitude, longitude, boundary),
+                           lambda: _fetch_satellite_data(latitude, longitude, boundary),
+                           cacheable=lambda result: not skipped() and has_required_layers(result),
+                           reusable=refresh_artifacts)
+        annotate(result)
+    result['stages'] = stages
+    result['trace'] = trace.export()
+    return result
+
+def satellite_stage_inputs(latitude, longitude, boundary=None):
+    """Everything a satellite result depends on, for the stage fingerprint"""
+    return {
+        'latitude': round(latitude, 6),
+        'longitude': round(longitude, 6),
+        'boundary': boundary,
+        'simplify_tolerance_m': PARCEL_SIMPLIFY_TOLERANCE_M if boundary else None,
+        'window_days': SCENE_WINDOW_DAYS,
+        # Moves every STAGE_SATELLITE_REFRESH_DAYS, so new acquisitions are picked up
+        'window_end': scene_window_end(),
+        'scene_catalog': SATELLITE_SCENE_CATALOG,
+        'ndvi_history': SATELLITE_NDVI_HISTORY,
+        'imagery': SATELLITE_IMAGERY_MODE,
+        'encoding': [SATELLITE_IMAGE_FORMAT, SATELLITE_IMAGE_QUALITY, SATELLITE_THUMBNAIL_SIZE],
+    }
+
+def has_required_layers(result):
+    """Whether every required layer was stored without download or URL errors"""
+    artifacts = result.get('artifacts') or {}
+    return not result.get('image_errors') and all(kind in artifacts for kind in REQUIRED_LAYERS)
+
+def refresh_artifacts(result):
+    """Whether a stored result's layers are still in the artifact store; marks them used and refreshes IPFS hashes"""
+    if not has_required_layers(result):
+        return False
+    handles = list(result.get('artifacts', {}).values())
+    handles += [handle['thumbnail'] for handle in handles if handle.get('thumbnail')]
+    if not all(os.path.exists(handle['path']) for handle in handles):
+        return False
+    for handle in handles:
+        # Refresh last-use time so retention keeps reused layers
+        os.utime(handle['path'])
+        handle['deduplicated'] = True
+        handle['ipfs_hash'] = read_meta(handle['path']).get('ipfs_hash')
+    return True
+
+def apply_ee_deadline(ee):
+    """Check the budget before an Earth Engine call; in a single-request process also cap its timeout"""
+    # Raises DeadlineExceeded once the budget is spent
+    timeout = request_timeout(None)
+    if timeout is not None and EE_PROCESS_DEADLINE:
+        ee.data.setDeadline(int(timeout * 1000))
+
+def build_region(ee, latitude, longitude, boundary=None):
+    """Earth Engine reduction region and its locally computed area and outline"""
+    if boundary is None:
+        # Create buffer area (100m radius) for calculations
+        roi = ee.Geometry.Point([longitude, latitude]).buffer(DEFAULT_BUFFER_M)
+        return roi, {
+            'source': 'buffer',
+            'buffer_m': DEFAULT_BUFFER_M,
+            'area_sqm': math.pi * DEFAULT_BUFFER_M ** 2,
+            'history_key': {'point': [round(longitude, 6), round(latitude, 6)], 'buffer_m': DEFAULT_BUFFER_M},
+        }
+    
+    polygons = parse_boundary(boundary)
+    simplified = simplify(polygons)
+    coordinates = [[[list(point) for point in ring] for ring in rings] for rings in simplified]
+    if len(coordinates) == 1:
+        roi = ee.Geometry.Polygon(coordinates[0])
+    else:
+        roi = ee.Geometry.MultiPolygon(coordinates)
+    return roi, {
+        'source': 'boundary',
+        'area_sqm': geodesic_area(polygons),
+        'bounds': [round(value, 7) for value in bounds(polygons)],
+        'polygons': len(polygons),
+        'vertices': vertex_count(polygons),
+        'simplified_vertices': vertex_count(simplified),
+        'history_key': {'boundary': [[[[round(lon, 6), round(lat, 6)] for lon, lat in ring] for ring in rings]
+                                     for rings in simplified]},
+    }
+
+def select_scene(ee, roi, latitude, longitude, start_date, end_date):
+    """Least cloudy Sentinel-2 image covering the parcel, and how it was chosen"""
+    if SATELLITE_SCENE_CATALOG:
+        try:
+            tile, scene_ids, refreshed = best_scene_ids(ee, latitude, longitude)
+            if scene_ids:
+                # Catalog order is best first; filterBounds only drops scenes whose footprint misses the parcel
+                scene = ee.ImageCollection([ee.Image(scene_id) for scene_id in scene_ids]).filterBounds(roi).first()
+                return scene, {'source': 'catalog', 'tile': tile, 'candidates': len(scene_ids), 'refreshed': refreshed}
+            logger.warning("Scene catalog has no scenes for tile %s, searching instead", tile)
+        except Exception as catalog_error:
+            logger.warning("Scene catalog lookup failed, searching instead: %s", catalog_error)
+    
+    # Use HARMONIZED collection for better availability - sorted by cloud coverage
+    scene = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED') \
+        .filterBounds(roi) \
+        .filterDate(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')) \
+        .sort('CLOUDY_PIXEL_PERCENTAGE') \
+        .first()
+    return scene, {'source': 'search'}
+
+def fetch_ndvi_history(ee, roi, region):
+    """Refresh the parcel's stored NDVI series and summarize it (None if unavailable)"""
+    try:
+        key = parcel_key(region)
+        records, new_scenes, queried = refresh_history(ee, ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED'), roi, key)
+    except Exception as history_error:
+        logger.warning("NDVI history refresh failed: %s", history_error)
+        return None
+    summary = summarize_history(records)
+    summary.update({'new_scenes': new_scenes, 'refreshed': queried})
+    return summary
+
+def _fetch_satellite_data(latitude, longitude, boundary=None):
     """Fetch satellite imagery and metrics with high resolution"""
     try:
+        # Heavy SDKs are imported here so a cold start only pays for them when fetching
+        with span('ee.import'):
+            import ee
+            import requests
+            from concurrent.futures import ThreadPoolExecutor
+            from dotenv import load_dotenv
+
+        load_dotenv()
+
         # Authenticate and initialize Earth Engine
         project_id = os.getenv('GOOGLE_EARTH_ENGINE_PROJECT_ID')
         
-        # Try to authenticate first (only needed once, but safe to call multiple times)
-        try:
-            ee.Authenticate()
-        except Exception as auth_error:
-            # If already authenticated, this will fail but we can continue
-            print(f"Note: Authentication status: {auth_error}", file=sys.stderr)
-        
-        # Initialize Earth Engine with project ID
-        ee.Initialize(project=project_id)
-        
-        # Create point of interest
-        point = ee.Geometry.Point([longitude, latitude])
+        with span('ee.init'):
+            # Try to authenticate first (only needed once, but safe to call multiple times)
+            try:
+                ee.Authenticate()
+            except Exception as auth_error:
+                # If already authenticated, this will fail but we can continue
+                logger.debug("Authentication status: %s", auth_error)
+            
+            # Initialize Earth Engine with project ID
+            ee.Initialize(project=project_id)
+        apply_ee_deadline(ee)
         
-        # Create buffer area (100m radius) for calculations
-        roi = point.buffer(100)
+        # Region of interest: the parcel boundary, or a 100m buffer around the point
+        roi, parcel = build_region(ee, latitude, longitude, boundary)
+        history_key = parcel.pop('history_key')
         
         # Get recent Sentinel-2 imagery with date range
         end_date = datetime.now()
-        start_date = end_date - timedelta(days=365)
+        start_date = end_date - timedelta(days=SCENE_WINDOW_DAYS)
         
-        # Use HARMONIZED collection for better availability - sorted by cloud coverage
-        sentinel = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED') \
-            .filterBounds(roi) \
-            .filterDate(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')) \
-            .sort('CLOUDY_PIXEL_PERCENTAGE') \
-            .first()
+        sentinel, scene_selection = select_scene(ee, roi, latitude, longitude, start_date, end_date)
         
         # Calculate NDVI (vegetation health)
         ndvi = sentinel.normalizedDifference(['B8', 'B4']).rename('NDVI')
-        ndvi_stats = ndvi.reduceRegion(
-            reducer=ee.Reducer.mean(),
-            geometry=roi,
-            scale=10,
-            maxPixels=1e9
-        ).getInfo()
+        with span('ee.reduce_region'):
+            ndvi_stats = ndvi.reduceRegion(
+                reducer=ee.Reducer.mean(),
+                geometry=roi,
+                scale=10,
+                maxPixels=1e9
+            ).getInfo()
         
         ndvi_value = ndvi_stats.get('NDVI', 0.5)
         
-        # Calculate area
-        area_sqm = roi.area(maxError=1).getInfo()
+        ndvi_history = None
+        if SATELLITE_NDVI_HISTORY:
+            if can_afford(SATELLITE_HISTORY_BUDGET_S):
+                apply_ee_deadline(ee)
+                ndvi_history = fetch_ndvi_history(ee, roi, history_key)
+            else:
+                skip('satellite.ndvi_history')
         
         # Image parameters - WITHOUT region parameter for full square rendering
         # When region is omitted, GEE renders a proper square aligned to lat/lon
@@ -94,99 +312,114 @@ def fetch_satellite_data(latitude, longitude):
             'dimensions': 2048
         }
         
+        # Get image metadata (the scene ID keys the tile cache)
+        apply_ee_deadline(ee)
+        with span('ee.image_info'):
+            image_info = sentinel.getInfo()
+        properties = image_info['properties']
+        
+        layers = (
+            ('rgb', 'RGB', sentinel, rgb_params),
+            ('ndvi', 'NDVI', ndvi, ndvi_params),
+            # CIR (Color Infrared) - best for land analysis
+            ('cir', 'CIR', sentinel, cir_params),
+            ('true_color', 'True Color', sentinel, true_color_params),
+        )
+        tile_mode = SATELLITE_IMAGERY_MODE == 'tiles'
+        tile_stats = new_tile_stats()
+        urls = {}
+        
         # Generate public URLs - simple approach without region for clarity
         try:
-            print("Generating satellite image URLs...", file=sys.stderr)
-            rgb_url = sentinel.getThumbURL(rgb_params)
-            ndvi_url = ndvi.getThumbURL(ndvi_params)
-            true_color_url = sentinel.getThumbURL(true_color_params)
-            cir_url = sentinel.getThumbURL(cir_params)
+            if not tile_mode:
+                logger.debug("Generating satellite image URLs...")
+                with span('ee.thumb_urls', layers=len(layers)):
+                    urls = {kind: image.getThumbURL(params) for kind, _, image, params in layers}
             
-            print("Downloading satellite images for IPFS storage...", file=sys.stderr)
-            # Download the images and save to temp files for IPFS upload
-            rgb_image_path = None
-            ndvi_image_path = None
-            cir_image_path = None
-            true_color_image_path = None
+            logger.debug("Downloading satellite images for IPFS storage...")
+            # Download the images into the artifact store for IPFS upload,
+            # encoding each layer on a worker thread while the next one downloads
+            artifacts = {}
+            image_errors = []
+            encoder = ThreadPoolExecutor(max_workers=SATELLITE_ENCODE_WORKERS, thread_name_prefix='encode')
+            pending = {}
             
-            # Download with parallel requests and longer timeout
             try:
-                # Download RGB image
-                print(f"Downloading RGB image...", file=sys.stderr)
-                rgb_response = requests.get(rgb_url, timeout=45)
-                if rgb_response.status_code == 200:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as f:
-                        f.write(rgb_response.content)
-                        rgb_image_path = f.name
-                        print(f"RGB image saved: {len(rgb_response.content)} bytes", file=sys.stderr)
-                
-                # Download NDVI image
-                print(f"Downloading NDVI image...", file=sys.stderr)
-                ndvi_response = requests.get(ndvi_url, timeout=45)
-                if ndvi_response.status_code == 200:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as f:
-                        f.write(ndvi_response.content)
-                        ndvi_image_path = f.name
-                        print(f"NDVI image saved: {len(ndvi_response.content)} bytes", file=sys.stderr)
-                
-                # Download CIR image (Color Infrared - best for land analysis)
-                print(f"Downloading CIR image...", file=sys.stderr)
-                cir_response = requests.get(cir_url, timeout=45)
-                if cir_response.status_code == 200:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as f:
-                        f.write(cir_response.content)
-                        cir_image_path = f.name
-                        print(f"CIR image saved: {len(cir_response.content)} bytes", file=sys.stderr)
+                for kind, label, image, params in layers:
+                    # Required layers only need some budget left; optional ones a full download's worth
+                    if not can_afford(0 if kind in REQUIRED_LAYERS else SATELLITE_OPTIONAL_LAYER_BUDGET_S):
+                        skip(f'satellite.layer.{kind}')
+                        continue
+                    if tile_mode:
+                        data = render_layer(requests, image, params, kind, image_info.get('id', ''),
+                                            longitude, latitude, tile_stats)
+                    else:
+                        data = download_layer(requests, urls[kind], kind, label)
+                    if data:
+                        # Copy the context so encode spans land in this request's trace
+                        pending[kind] = encoder.submit(contextvars.copy_context().run, store_layer, data, kind, label)
                 
-                # Download True Color image
-                print(f"Downloading True Color image...", file=sys.stderr)
-                true_color_response = requests.get(true_color_url, timeout=45)
-                if true_color_response.status_code == 200:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as f:
-                        f.write(true_color_response.content)
-                        true_color_image_path = f.name
-                        print(f"True Color image saved: {len(true_color_response.content)} bytes", file=sys.stderr)
-                
-                print("All satellite images downloaded successfully!", file=sys.stderr)
+                logger.info("All satellite images downloaded successfully!" if not skipped()
+                            else "Satellite images downloaded (optional layers skipped for the deadline)")
                         
             except requests.Timeout as timeout_error:
-                print(f"Warning: Image download timeout (will continue with available images): {timeout_error}", file=sys.stderr)
+                logger.warning("Image download timeout (will continue with available images): %s", timeout_error)
+                image_errors.append(f"download: {timeout_error}")
             except Exception as download_error:
-                print(f"Warning: Could not download all images (will continue with available): {download_error}", file=sys.stderr)
+                logger.warning("Could not download all images (will continue with available): %s", download_error)
+                image_errors.append(f"download: {download_error}")
+            finally:
+                # Layers downloaded before a failure are still stored
+                for kind, future in pending.items():
+                    try:
+                        artifacts[kind] = future.result()
+                    except Exception as store_error:
+                        logger.warning("Could not store %s image: %s", kind, store_error)
+                        image_errors.append(f"store {kind}: {store_error}")
+                encoder.shutdown()
+            
+            # Apply retention and size quota so the store cannot fill the disk
+            try:
+                with span('artifact_store.gc') as s:
+                    s.set(**(collect_garbage_if_due() or {'due': False}))
+                if tile_mode:
+                    prune_tiles_if_due()
+            except Exception as gc_error:
+                logger.warning("Artifact store cleanup failed: %s", gc_error)
                 
         except Exception as url_error:
-            print(f"Warning: Could not generate image URLs: {url_error}", file=sys.stderr)
-            rgb_url = None
-            ndvi_url = None
-            true_color_url = None
-            cir_url = None
-            rgb_image_path = None
-            ndvi_image_path = None
-            cir_image_path = None
-            true_color_image_path = None
-        
-        # Get image metadata
-        image_info = sentinel.getInfo()
-        properties = image_info['properties']
+            logger.warning("Could not generate image URLs: %s", url_error)
+            urls = {}
+            artifacts = {}
+            image_errors = [f"urls: {url_error}"]
         
         result = {
             'latitude': latitude,
             'longitude': longitude,
-            'area_sqm': round(area_sqm, 2),
+            'area_sqm': round(parcel['area_sqm'], 2),
+            'area_basis': 'parcel boundary' if parcel['source'] == 'boundary' else f"{DEFAULT_BUFFER_M} m radius around the point",
+            'parcel': dict(parcel, area_sqm=round(parcel['area_sqm'], 2)),
             'ndvi': round(ndvi_value, 4),
+            'ndvi_history': ndvi_history,
             'cloud_coverage': round(properties.get('CLOUDY_PIXEL_PERCENTAGE', 0), 2),
             'resolution_meters': 10,
             'image_date': properties.get('GENERATION_TIME', 'N/A'),
             'satellite': 'Sentinel-2',
-            'rgb_image_url': rgb_url,
-            'ndvi_image_url': ndvi_url,
-            'true_color_url': true_color_url,
-            'cir_image_url': cir_url,
-            'rgb_image_path': rgb_image_path,
-            'ndvi_image_path': ndvi_image_path,
-            'cir_image_path': cir_image_path,
-            'true_color_image_path': true_color_image_path,
-            'image_quality': 'ULTRA HIGH (2048x2048 resolution)',
+            'scene_id': image_info.get('id'),
+            'scene_selection': scene_selection,
+            'rgb_image_url': urls.get('rgb'),
+            'ndvi_image_url': urls.get('ndvi'),
+            'true_color_url': urls.get('true_color'),
+            'cir_image_url': urls.get('cir'),
+            'rgb_image_path': artifacts.get('rgb', {}).get('path'),
+            'ndvi_image_path': artifacts.get('ndvi', {}).get('path'),
+            'cir_image_path': artifacts.get('cir', {}).get('path'),
+            'true_color_image_path': artifacts.get('true_color', {}).get('path'),
+            'artifacts': artifacts,
+            'image_errors': image_errors,
+            'image_encoding': summarize_encoding(artifacts),
+            'tile_cache': summarize_tile_stats(tile_stats) if tile_mode else None,
+            'image_quality': 'TILE MOSAIC (shared tile cache)' if tile_mode else 'ULTRA HIGH (2048x2048 resolution)',
             'recommended_view': 'cir_image_url'  # CIR is clearest for land analysis
         }
         
@@ -194,21 +427,31 @@ def fetch_satellite_data(latitude, longitude):
         
     except Exception as e:
         # Fail with real error - no mock data
-        print(f"Error: Satellite service failed: {e}", file=sys.stderr)
+        logger.error("Satellite service failed: %s", e)
         raise Exception(f"Satellite service failed: {str(e)}")
 
 if __name__ == "__main__":
+    # --profile / PROFILE=cpu,sample,memory writes profiles to PROFILE_DIR (see profiling.py)
+    args = pop_profile_flag(sys.argv[1:])
+    # One request per process, so the Earth Engine timeout can follow its deadline
+    EE_PROCESS_DEADLINE = True
+    
     # Read input from stdin or args
     try:
-        if len(sys.argv) > 2:
-            lat = float(sys.argv[1])
-            lon = float(sys.argv[2])
-        else:
-            input_data = json.loads(sys.stdin.read())
-            lat = input_data['latitude']
-            lon = input_data['longitude']
-        
-        result = fetch_satellite_data(lat, lon)
+        with profiled('satellite_service'):
+            if len(args) > 1:
+                lat = float(args[0])
+                lon = float(args[1])
+                boundary = json.loads(args[2]) if len(args) > 2 else None
+                deadline = None
+            else:
+                input_data = json.loads(sys.stdin.read())
+                lat = input_data['latitude']
+                lon = input_data['longitude']
+                boundary = input_data.get('boundary')
+                deadline = read_deadline(input_data)
+            
+            result = fetch_satellite_data(lat, lon, boundary, deadline)
         print(json.dumps(result))
     except Exception as e:
         print(json.dumps({"error": str(e)}))
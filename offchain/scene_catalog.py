@@ -0,0 +1,214 @@
+"""
+Sentinel-2 Scene Catalog
+Ranked best scenes per MGRS tile, so parcels load known images by ID instead of sorting a year
+
+Each catalog entry covers one MGRS tile and a trailing date window and lists
+the least cloudy scene IDs with their cloud cover. Entries are refreshed
+lazily once older than SCENE_CATALOG_MAX_AGE_HOURS, or ahead of time with:
+
+    python scene_catalog.py refresh <latitude> <longitude> [--composite]
+
+--composite also exports a cloud-masked median composite of the ranked
+scenes to SCENE_CATALOG_COMPOSITE_ROOT and records its asset ID.
+"""
+import json
+import math
+import os
+import sys
+import time
+
+from artifact_store import write_atomic
+from tracing import get_logger, span
+
+logger = get_logger('scene_catalog')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCENE_CATALOG_DIR = os.getenv('SCENE_CATALOG_DIR', os.path.join(BASE_DIR, '.scene-catalog'))
+SCENE_CATALOG_MAX_AGE_HOURS = float(os.getenv('SCENE_CATALOG_MAX_AGE_HOURS', '24'))
+SCENE_CATALOG_WINDOW_DAYS = int(os.getenv('SCENE_CATALOG_WINDOW_DAYS', '365'))
+
+# Ranked scenes kept per tile
+SCENE_CATALOG_SIZE = int(os.getenv('SCENE_CATALOG_SIZE', '10'))
+
+# Earth Engine asset folder for exported median composites (e.g. projects/<id>/assets/composites)
+SCENE_CATALOG_COMPOSITE_ROOT = os.getenv('SCENE_CATALOG_COMPOSITE_ROOT')
+
+COLLECTION = 'COPERNICUS/S2_SR_HARMONIZED'
+
+# Scene classification (SCL) values kept in the composite: vegetation, bare soil, water
+CLEAR_SCL_CLASSES = (4, 5, 6)
+
+_loaded = {}
+
+
+def _utm(latitude: float, longitude: float, zone: int) -> tuple:
+    """WGS84 -> UTM easting/northing (northing includes the southern false northing)"""
+    a = 6378137.0
+    f = 1 / 298.257223563
+    k0 = 0.9996
+    e2 = f * (2 - f)
+    ep2 = e2 / (1 - e2)
+
+    lat = math.radians(latitude)
+    central_meridian = math.radians((zone - 1) * 6 - 180 + 3)
+    n = a / math.sqrt(1 - e2 * math.sin(lat) ** 2)
+    t = math.tan(lat) ** 2
+    c = ep2 * math.cos(lat) ** 2
+    a_ = math.cos(lat) * (math.radians(longitude) - central_meridian)
+    m = a * ((1 - e2 / 4 - 3 * e2 ** 2 / 64 - 5 * e2 ** 3 / 256) * lat
+             - (3 * e2 / 8 + 3 * e2 ** 2 / 32 + 45 * e2 ** 3 / 1024) * math.sin(2 * lat)
+             + (15 * e2 ** 2 / 256 + 45 * e2 ** 3 / 1024) * math.sin(4 * lat)
+             - (35 * e2 ** 3 / 3072) * math.sin(6 * lat))
+
+    easting = k0 * n * (a_ + (1 - t + c) * a_ ** 3 / 6
+                        + (5 - 18 * t + t * t + 72 * c - 58 * ep2) * a_ ** 5 / 120) + 500000
+    northing = k0 * (m + n * math.tan(lat) * (a_ * a_ / 2 + (5 - t + 9 * c + 4 * c * c) * a_ ** 4 / 24
+                                              + (61 - 58 * t + t * t + 600 * c - 330 * ep2) * a_ ** 6 / 720))
+    if latitude < 0:
+        northing += 10000000
+    return easting, northing
+
+
+def mgrs_tile(latitude: float, longitude: float) -> str:
+    """Sentinel-2 tile ID (MGRS 100 km square, e.g. '43PGQ') containing a point"""
+    zone = int((longitude + 180) // 6) + 1
+    # Irregular zones around Norway and Svalbard
+    if 56 <= latitude < 64 and 3 <= longitude < 12:
+        zone = 32
+    if 72 <= latitude < 84:
+        for special, west, east in ((31, 0, 9), (33, 9, 21), (35, 21, 33), (37, 33, 42)):
+            if west <= longitude < east:
+                zone = special
+
+    band = "CDEFGHJKLMNPQRSTUVWXX"[int((max(-80, min(84, latitude)) + 80) // 8)]
+    easting, northing = _utm(latitude, longitude, zone)
+    column = ('ABCDEFGH', 'JKLMNPQR', 'STUVWXYZ')[(zone - 1) % 3][int(easting // 100000) - 1]
+    row = 'ABCDEFGHJKLMNPQRSTUV'[(int(northing // 100000) + (5 if zone % 2 == 0 else 0)) % 20]
+    return f"{zone:02d}{band}{column}{row}"
+
+
+def catalog_path(tile: str) -> str:
+    return os.path.join(SCENE_CATALOG_DIR, f"{tile}-{SCENE_CATALOG_WINDOW_DAYS}d.json")
+
+
+def load_entry(tile: str) -> dict:
+    """Catalog entry for a tile (None if never built)"""
+    path = catalog_path(tile)
+    if path in _loaded:
+        return _loaded[path]
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    _loaded[path] = entry
+    return entry
+
+
+def is_stale(entry: dict, now: float = None) -> bool:
+    return entry is None or (now or time.time()) - entry['refreshed_at'] > SCENE_CATALOG_MAX_AGE_HOURS * 3600
+
+
+def rank_scenes(ee, tile: str, start_ms: int, end_ms: int) -> list:
+    """Least cloudy scenes of one tile in a date window, in one Earth Engine round trip"""
+    ranked = ee.ImageCollection(COLLECTION) \
+        .filter(ee.Filter.eq('MGRS_TILE', tile)) \
+        .filterDate(ee.Date(start_ms), ee.Date(end_ms)) \
+        .sort('CLOUDY_PIXEL_PERCENTAGE') \
+        .limit(SCENE_CATALOG_SIZE)
+    columns = ee.Dictionary({
+        'ids': ranked.aggregate_array('system:id'),
+        'clouds': ranked.aggregate_array('CLOUDY_PIXEL_PERCENTAGE'),
+        'times': ranked.aggregate_array('system:time_start'),
+    }).getInfo()
+    return [
+        {'id': scene_id, 'cloud': round(cloud, 2), 'time': int(time_start)}
+        for scene_id, cloud, time_start in zip(columns['ids'], columns['clouds'], columns['times'])
+    ]
+
+
+def export_composite(ee, tile: str, entry: dict) -> dict:
+    """Start an export of the cloud-masked median of the ranked scenes; returns its composite record"""
+    def mask_clouds(image):
+        scl = image.select('SCL')
+        clear = scl.eq(CLEAR_SCL_CLASSES[0])
+        for value in CLEAR_SCL_CLASSES[1:]:
+            clear = clear.Or(scl.eq(value))
+        return image.updateMask(clear)
+
+    images = ee.ImageCollection([ee.Image(scene['id']) for scene in entry['scenes']])
+    composite = images.map(mask_clouds).median().select(['B2', 'B3', 'B4', 'B8'])
+    asset_id = f"{SCENE_CATALOG_COMPOSITE_ROOT}/s2_median_{tile}_{entry['window_start']}_{entry['window_end']}"
+    task = ee.batch.Export.image.toAsset(
+        image=composite,
+        description=f"s2_median_{tile}",
+        assetId=asset_id,
+        region=images.first().geometry(),
+        scale=10,
+        maxPixels=1e10,
+    )
+    task.start()
+    return {'id': asset_id, 'task_id': task.id, 'status': 'exporting'}
+
+
+def refresh_entry(ee, tile: str, now: float = None, composite: bool = False) -> dict:
+    """Rebuild and store one tile's catalog entry"""
+    now = now or time.time()
+    end_ms = int(now * 1000)
+    start_ms = end_ms - SCENE_CATALOG_WINDOW_DAYS * 86400 * 1000
+
+    with span('ee.scene_catalog', tile=tile) as s:
+        scenes = rank_scenes(ee, tile, start_ms, end_ms)
+        s.set(scenes=len(scenes))
+
+    entry = {
+        'tile': tile,
+        'window_start': time.strftime('%Y%m%d', time.gmtime(start_ms / 1000)),
+        'window_end': time.strftime('%Y%m%d', time.gmtime(end_ms / 1000)),
+        'refreshed_at': now,
+        'scenes': scenes,
+    }
+    previous = load_entry(tile)
+    if composite and scenes:
+        if not SCENE_CATALOG_COMPOSITE_ROOT:
+            raise ValueError("SCENE_CATALOG_COMPOSITE_ROOT not configured")
+        entry['composite'] = export_composite(ee, tile, entry)
+    elif previous and previous.get('composite'):
+        # A lazy refresh keeps the last exported composite
+        entry['composite'] = previous['composite']
+
+    path = catalog_path(tile)
+    write_atomic(path, json.dumps(entry, indent=2).encode('utf-8'))
+    _loaded[path] = entry
+    return entry
+
+
+def best_scene_ids(ee, latitude: float, longitude: float) -> tuple:
+    """
+    Ranked scene IDs for the tile containing a point, refreshing the entry if stale.
+
+    Returns:
+        (tile ID, scene IDs best first, whether the catalog was refreshed)
+    """
+    tile = mgrs_tile(latitude, longitude)
+    entry = load_entry(tile)
+    refreshed = is_stale(entry)
+    if refreshed:
+        entry = refresh_entry(ee, tile)
+    return tile, [scene['id'] for scene in entry['scenes']], refreshed
+
+
+if __name__ == "__main__":
+    # Pre-build a tile's entry: python scene_catalog.py refresh <latitude> <longitude> [--composite]
+    if len(sys.argv) >= 4 and sys.argv[1] == 'refresh':
+        import ee
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        ee.Initialize(project=os.getenv('GOOGLE_EARTH_ENGINE_PROJECT_ID'))
+        tile = mgrs_tile(float(sys.argv[2]), float(sys.argv[3]))
+        print(json.dumps(refresh_entry(ee, tile, composite='--composite' in sys.argv), indent=2))
+    else:
+        print("Usage: python scene_catalog.py refresh <latitude> <longitude> [--composite]", file=sys.stderr)
+        sys.exit(1)
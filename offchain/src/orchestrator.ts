@@ -14,6 +14,16 @@ import fs from 'fs';
 import FormData from 'form-data';
 import axios from 'axios';
 
+// Hard limits on the Python processes; each gets a deadline (deadline.py) slightly inside its limit,
+// so it returns a partial result with the skipped steps instead of being killed
+const SATELLITE_TIMEOUT_MS = 180000;
+const AGENT_TIMEOUT_MS = 30000;
+const DEADLINE_MARGIN_MS = 2000;
+
+function deadlineAfter(timeoutMs: number): number {
+  return (Date.now() + timeoutMs - DEADLINE_MARGIN_MS) / 1000;
+}
+
 interface VerificationRequest {
   requestId: string;
   requester: string;
@@ -39,6 +49,11 @@ interface AgentResponse {
     missing_fields: string[];
     red_flags: string[];
   };
+  // Set by agent2/agent3 when their valuation came from the offline valuation model
+  valuation_model?: {
+    version: number;
+    interval: [number, number];
+  };
 }
 
 /**
@@ -299,170 +314,51 @@ export async function processVerificationRequest(request: VerificationRequest) {
     // Step 1.5: Upload satellite images to IPFS if available
     if (satelliteData.rgb_image_path || satelliteData.ndvi_image_path || satelliteData.cir_image_path || satelliteData.true_color_image_path) {
       logger.info('📸 Step 1.5: Uploading satellite images to IPFS (Ultra High Resolution - 2048x2048)...');
+      const artifacts = satelliteData.artifacts || {};
       try {
-        // Upload RGB image
-        if (satelliteData.rgb_image_path && fs.existsSync(satelliteData.rgb_image_path)) {
-          const rgbFormData = new FormData();
-          rgbFormData.append('file', fs.createReadStream(satelliteData.rgb_image_path));
-          rgbFormData.append('pinataMetadata', JSON.stringify({
-            name: `satellite_rgb_${request.requestId}.png`
-          }));
-          
-          const rgbResponse = await axios.post(
-            'https://api.pinata.cloud/pinning/pinFileToIPFS',
-            rgbFormData,
-            {
-              headers: {
-                'Authorization': `Bearer ${process.env.PINATA_JWT}`,
-                ...rgbFormData.getHeaders()
-              }
-            }
-          );
-          
-          const rgbIpfsUrl = `https://gateway.pinata.cloud/ipfs/${rgbResponse.data.IpfsHash}`;
-          satelliteData.rgb_image_url = rgbIpfsUrl;
-          logger.info(`   ✅ RGB image uploaded: ${rgbResponse.data.IpfsHash}`);
-          logger.info(`   🔗 RGB Image URL: ${rgbIpfsUrl}`);
-        }
-        
-        // Upload NDVI image
-        if (satelliteData.ndvi_image_path && fs.existsSync(satelliteData.ndvi_image_path)) {
-          const ndviFormData = new FormData();
-          ndviFormData.append('file', fs.createReadStream(satelliteData.ndvi_image_path));
-          ndviFormData.append('pinataMetadata', JSON.stringify({
-            name: `satellite_ndvi_${request.requestId}.png`
-          }));
-          
-          const ndviResponse = await axios.post(
-            'https://api.pinata.cloud/pinning/pinFileToIPFS',
-            ndviFormData,
-            {
-              headers: {
-                'Authorization': `Bearer ${process.env.PINATA_JWT}`,
-                ...ndviFormData.getHeaders()
-              }
-            }
-          );
-          
-          const ndviIpfsUrl = `https://gateway.pinata.cloud/ipfs/${ndviResponse.data.IpfsHash}`;
-          satelliteData.ndvi_image_url = ndviIpfsUrl;
-          logger.info(`   ✅ NDVI image uploaded: ${ndviResponse.data.IpfsHash}`);
-          logger.info(`   🔗 NDVI Image URL: ${ndviIpfsUrl}`);
-        }
-        
-        // Upload CIR (Color Infrared) image - BEST for vegetation/land analysis
-        if (satelliteData.cir_image_path && fs.existsSync(satelliteData.cir_image_path)) {
-          const cirFormData = new FormData();
-          cirFormData.append('file', fs.createReadStream(satelliteData.cir_image_path));
-          cirFormData.append('pinataMetadata', JSON.stringify({
-            name: `satellite_cir_${request.requestId}.png`
-          }));
-          
-          const cirResponse = await axios.post(
-            'https://api.pinata.cloud/pinning/pinFileToIPFS',
-            cirFormData,
-            {
-              headers: {
-                'Authorization': `Bearer ${process.env.PINATA_JWT}`,
-                ...cirFormData.getHeaders()
-              }
-            }
-          );
-          
-          const cirIpfsUrl = `https://gateway.pinata.cloud/ipfs/${cirResponse.data.IpfsHash}`;
-          satelliteData.cir_image_url = cirIpfsUrl;
-          logger.info(`   ✅ CIR (Color Infrared) image uploaded: ${cirResponse.data.IpfsHash}`);
-          logger.info(`   🔗 CIR Image URL: ${cirIpfsUrl}`);
-        }
-        
-        // Upload True Color image
-        if (satelliteData.true_color_image_path && fs.existsSync(satelliteData.true_color_image_path)) {
-          const trueColorFormData = new FormData();
-          trueColorFormData.append('file', fs.createReadStream(satelliteData.true_color_image_path));
-          trueColorFormData.append('pinataMetadata', JSON.stringify({
-            name: `satellite_true_color_${request.requestId}.png`
-          }));
+        for (const layer of SATELLITE_LAYERS) {
+          const imagePath = satelliteData[layer.pathField];
+          if (!imagePath || !fs.existsSync(imagePath)) {
+            continue;
+          }
           
-          const trueColorResponse = await axios.post(
-            'https://api.pinata.cloud/pinning/pinFileToIPFS',
-            trueColorFormData,
-            {
-              headers: {
-                'Authorization': `Bearer ${process.env.PINATA_JWT}`,
-                ...trueColorFormData.getHeaders()
-              }
-            }
-          );
+          const artifact = artifacts[layer.key];
+          const reused = Boolean(artifact?.ipfs_hash);
+          // Layers may be re-encoded (WebP/AVIF) by the satellite service; keep their extension
+          const extension = path.extname(imagePath) || '.png';
+          const ipfsHash = await uploadSatelliteLayer(imagePath, artifact, `satellite_${layer.key}_${request.requestId}${extension}`);
+          const ipfsUrl = `https://gateway.pinata.cloud/ipfs/${ipfsHash}`;
+          satelliteData[layer.urlField] = ipfsUrl;
+          logger.info(`   ✅ ${layer.label} image ${reused ? 'already pinned' : 'uploaded'}: ${ipfsHash}`);
+          logger.info(`   🔗 ${layer.label} Image URL: ${ipfsUrl}`);
           
-          const trueColorIpfsUrl = `https://gateway.pinata.cloud/ipfs/${trueColorResponse.data.IpfsHash}`;
-          satelliteData.true_color_url = trueColorIpfsUrl;
-          logger.info(`   ✅ True Color image uploaded: ${trueColorResponse.data.IpfsHash}`);
-          logger.info(`   🔗 True Color Image URL: ${trueColorIpfsUrl}`);
-        }
-        
-        logger.info('✅ All satellite images uploaded to IPFS (2048x2048 resolution)\n');
-        
-        // Wait a bit before cleaning up temp files (Windows file handle issue)
-        await new Promise(resolve => setTimeout(resolve, 500));
-        
-        // Clean up temp files
-        try {
-          if (satelliteData.rgb_image_path && fs.existsSync(satelliteData.rgb_image_path)) {
-            fs.unlinkSync(satelliteData.rgb_image_path);
-            logger.info(`   🗑️  Cleaned up temp RGB file`);
-          }
-          if (satelliteData.ndvi_image_path && fs.existsSync(satelliteData.ndvi_image_path)) {
-            fs.unlinkSync(satelliteData.ndvi_image_path);
-            logger.info(`   🗑️  Cleaned up temp NDVI file`);
+          // Small preview for list views, so the frontend doesn't fetch the full layer
+          const thumbnail = artifact?.thumbnail;
+          if (thumbnail?.path && fs.existsSync(thumbnail.path)) {
+            const thumbnailHash = await uploadSatelliteLayer(thumbnail.path, thumbnail, `satellite_${layer.key}_thumbnail_${request.requestId}${extension}`);
+            satelliteData[`${layer.key}_thumbnail_url`] = `https://gateway.pinata.cloud/ipfs/${thumbnailHash}`;
           }
-          if (satelliteData.cir_image_path && fs.existsSync(satelliteData.cir_image_path)) {
-            fs.unlinkSync(satelliteData.cir_image_path);
-            logger.info(`   🗑️  Cleaned up temp CIR file`);
-          }
-          if (satelliteData.true_color_image_path && fs.existsSync(satelliteData.true_color_image_path)) {
-            fs.unlinkSync(satelliteData.true_color_image_path);
-            logger.info(`   🗑️  Cleaned up temp True Color file`);
-          }
-        } catch (cleanupError) {
-          logger.warn(`   ⚠️  Could not delete temp files (files will be cleaned up automatically): ${cleanupError}`);
         }
         
-        // Remove the temporary file paths from satelliteData before storing in evidence
-        delete satelliteData.rgb_image_path;
-        delete satelliteData.ndvi_image_path;
-        delete satelliteData.cir_image_path;
-        delete satelliteData.true_color_image_path;
-        
+        logger.info('✅ All satellite images uploaded to IPFS (2048x2048 resolution)\n');
       } catch (uploadError) {
         logger.error(`❌ Failed to upload satellite images to IPFS: ${uploadError}`);
         
-        // Try to clean up temp files even on error (but don't fail if cleanup fails)
-        try {
-          await new Promise(resolve => setTimeout(resolve, 500));
-          if (satelliteData.rgb_image_path && fs.existsSync(satelliteData.rgb_image_path)) {
-            fs.unlinkSync(satelliteData.rgb_image_path);
-          }
-          if (satelliteData.ndvi_image_path && fs.existsSync(satelliteData.ndvi_image_path)) {
-            fs.unlinkSync(satelliteData.ndvi_image_path);
-          }
-          if (satelliteData.cir_image_path && fs.existsSync(satelliteData.cir_image_path)) {
-            fs.unlinkSync(satelliteData.cir_image_path);
-          }
-          if (satelliteData.true_color_image_path && fs.existsSync(satelliteData.true_color_image_path)) {
-            fs.unlinkSync(satelliteData.true_color_image_path);
-          }
-        } catch (cleanupError) {
-          // Ignore cleanup errors
-        }
-        
-        delete satelliteData.rgb_image_path;
-        delete satelliteData.ndvi_image_path;
-        delete satelliteData.cir_image_path;
-        delete satelliteData.true_color_image_path;
-        
         // Don't throw error - continue with verification even if image upload fails
         logger.warn('   ⚠️  Continuing verification without satellite images in IPFS');
       }
+      
+      // Images live in the artifact store, which applies its own retention and quota;
+      // only loose files from older satellite services are deleted here
+      if (!satelliteData.artifacts) {
+        await cleanupSatelliteFiles(satelliteData);
+      }
+      
+      // Remove local file paths from satelliteData before storing in evidence
+      for (const layer of SATELLITE_LAYERS) {
+        delete satelliteData[layer.pathField];
+      }
+      delete satelliteData.artifacts;
     }
     
     // Step 2: Prepare analysis package with document content
@@ -692,6 +588,7 @@ export async function processVerificationRequest(request: VerificationRequest) {
     logger.info(`   Final confidence: ${consensus.finalConfidence}%`);
     logger.info(`   Consensus score: ${consensus.consensusScore}/100`);
     logger.info(`   Standard deviation: ±$${consensus.statistics.standardDeviation.toLocaleString()}\n`);
+    recordConsensusObservation(request, satelliteData, consensus, validResponses);
     
     // Display individual agent breakdown
     logger.info('📊 INDIVIDUAL AGENT SCORES:');
@@ -857,10 +754,135 @@ export async function processVerificationRequest(request: VerificationRequest) {
   }
 }
 
+/**
+ * Satellite layers produced by satellite_service.py
+ */
+const SATELLITE_LAYERS = [
+  { key: 'rgb', label: 'RGB', pathField: 'rgb_image_path', urlField: 'rgb_image_url' },
+  { key: 'ndvi', label: 'NDVI', pathField: 'ndvi_image_path', urlField: 'ndvi_image_url' },
+  // CIR (Color Infrared) - BEST for vegetation/land analysis
+  { key: 'cir', label: 'CIR (Color Infrared)', pathField: 'cir_image_path', urlField: 'cir_image_url' },
+  { key: 'true_color', label: 'True Color', pathField: 'true_color_image_path', urlField: 'true_color_url' },
+];
+
+/**
+ * Upload one satellite image to IPFS, reusing an earlier upload of the same artifact
+ */
+async function uploadSatelliteLayer(imagePath: string, artifact: any, name: string): Promise<string> {
+  if (artifact?.ipfs_hash) {
+    return artifact.ipfs_hash;
+  }
+  
+  const formData = new FormData();
+  formData.append('file', fs.createReadStream(imagePath));
+  formData.append('pinataMetadata', JSON.stringify({ name }));
+  
+  const response = await axios.post(
+    'https://api.pinata.cloud/pinning/pinFileToIPFS',
+    formData,
+    {
+      headers: {
+        'Authorization': `Bearer ${process.env.PINATA_JWT}`,
+        ...formData.getHeaders()
+      }
+    }
+  );
+  
+  const ipfsHash = response.data.IpfsHash;
+  
+  // Record the pin next to the artifact so identical scenes skip re-upload. This is the only writer
+  // of the sidecar (read by artifact_store.read_meta); existing keys are kept
+  if (artifact?.meta_path) {
+    try {
+      let meta: Record<string, any> = {};
+      try {
+        meta = JSON.parse(fs.readFileSync(artifact.meta_path, 'utf8'));
+      } catch {
+        // No sidecar yet, or an unreadable one that is replaced
+      }
+      const tmpPath = `${artifact.meta_path}.${process.pid}.tmp`;
+      fs.writeFileSync(tmpPath, JSON.stringify({ ...meta, ipfs_hash: ipfsHash, uploaded_at: Math.floor(Date.now() / 1000) }));
+      fs.renameSync(tmpPath, artifact.meta_path);
+    } catch (metaError) {
+      logger.warn(`   ⚠️  Could not record IPFS hash for artifact ${artifact.id}: ${metaError}`);
+    }
+  }
+  
+  return ipfsHash;
+}
+
+/**
+ * Delete loose temp image files (satellite services without an artifact store)
+ */
+async function cleanupSatelliteFiles(satelliteData: any): Promise<void> {
+  // Wait a bit before cleaning up temp files (Windows file handle issue)
+  await new Promise(resolve => setTimeout(resolve, 500));
+  
+  try {
+    for (const layer of SATELLITE_LAYERS) {
+      const imagePath = satelliteData[layer.pathField];
+      if (imagePath && fs.existsSync(imagePath)) {
+        fs.unlinkSync(imagePath);
+        logger.info(`   🗑️  Cleaned up temp ${layer.label} file`);
+      }
+    }
+  } catch (cleanupError) {
+    logger.warn(`   ⚠️  Could not delete temp files (files will be cleaned up automatically): ${cleanupError}`);
+  }
+}
+
+// Confident consensus results are training data for the offline valuation model (valuation_model.py)
+const VALUATION_MODEL_MIN_CONFIDENCE = 70;
+
+function recordConsensusObservation(request: VerificationRequest, satelliteData: any,
+                                    consensus: any, responses: AgentResponse[]): void {
+  // valuation_model.py owns the observation format and decides whether recording is enabled
+  if (!process.env.VALUATION_MODEL) return;
+  if (!consensus.isValid || consensus.finalConfidence < VALUATION_MODEL_MIN_CONFIDENCE || !satelliteData?.area_sqm) return;
+  // A consensus built on the model's own estimates would train the model on its output
+  if (responses.some(response => response.valuation_model)) return;
+
+  const pythonPath = process.env.PYTHON_PATH || 'python';
+  const python = spawn(pythonPath, [path.join(__dirname, '..', 'valuation_model.py'), 'record']);
+  let errorString = '';
+  python.stderr.on('data', (data) => {
+    errorString += data.toString();
+  });
+  python.on('error', (error) => logger.warn(`⚠️  Could not record valuation observation: ${error}`));
+  python.on('close', (code) => {
+    if (code !== 0) logger.warn(`⚠️  Could not record valuation observation: ${errorString}`);
+  });
+  python.stdin.write(JSON.stringify({
+    source: 'consensus',
+    latitude: request.latitude,
+    longitude: request.longitude,
+    area_sqm: satelliteData.area_sqm,
+    ndvi: satelliteData.ndvi ?? 0.5,
+    cloud_coverage: satelliteData.cloud_coverage ?? 0,
+    valuation: consensus.finalValuation,
+  }));
+  python.stdin.end();
+}
+
 /**
  * Fetch satellite data using Python service
  */
 async function fetchSatelliteData(latitude: number, longitude: number): Promise<any> {
+  // Concurrent requests for the same parcel share one fetch in the pipeline service (pipeline_service.py)
+  const serviceUrl = process.env.PIPELINE_SERVICE_URL;
+  const deadline = deadlineAfter(SATELLITE_TIMEOUT_MS);
+  if (serviceUrl) {
+    try {
+      const response = await axios.post(`${serviceUrl.replace(/\/$/, '')}/satellite`, { latitude, longitude, deadline }, { timeout: SATELLITE_TIMEOUT_MS });
+      return response.data;
+    } catch (error: any) {
+      if (error.response) {
+        throw new Error(`Satellite service failed: ${JSON.stringify(error.response.data)}`);
+      }
+      logger.warn(`   ⚠️  Pipeline service unavailable, running satellite_service.py locally: ${error.message}`);
+    }
+  }
+
   return new Promise((resolve, reject) => {
     const pythonPath = process.env.PYTHON_PATH || 'python';
     const scriptPath = path.join(__dirname, '..', 'satellite_service.py');
@@ -892,14 +914,14 @@ async function fetchSatelliteData(latitude: number, longitude: number): Promise<
     });
     
     // Send input
-    python.stdin.write(JSON.stringify({ latitude, longitude }));
+    python.stdin.write(JSON.stringify({ latitude, longitude, deadline: deadlineAfter(SATELLITE_TIMEOUT_MS) }));
     python.stdin.end();
     
     // Timeout after 180 seconds (3 minutes) - downloading 4x 2048x2048 images takes time
     setTimeout(() => {
       python.kill();
       reject(new Error('Satellite service timeout (3 min limit)'));
-    }, 180000);
+    }, SATELLITE_TIMEOUT_MS);
   });
 }
 
@@ -975,7 +997,7 @@ async function runAgent(scriptName: string, data: any, agentName: string): Promi
     });
     
     // Send input
-    python.stdin.write(JSON.stringify(data));
+    python.stdin.write(JSON.stringify({ ...data, deadline: deadlineAfter(AGENT_TIMEOUT_MS) }));
     python.stdin.end();
     
     // Timeout after 30 seconds
@@ -989,6 +1011,6 @@ async function runAgent(scriptName: string, data: any, agentName: string): Promi
         agent: agentName.toLowerCase(),
         error: 'Agent timeout'
       });
-    }, 30000);
+    }, AGENT_TIMEOUT_MS);
   });
 }
\ No newline at end of file
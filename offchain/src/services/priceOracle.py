@@ -4,14 +4,39 @@ Fetches real market prices from property listing sites
 """
 import os
 import re
-import requests
+import sys
 from typing import Dict, Optional, List
-from dotenv import load_dotenv
 
-load_dotenv()
+if not __package__:
+    # Run directly as a script: make the offchain root (tracing.py) importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from deadline import (
+    annotate,
+    can_afford,
+    current_deadline,
+    deadline_scope,
+    merge_skipped,
+    read_deadline,
+    request_timeout,
+    skip,
+)
+from stage_cache import STAGE_MARKET_MAX_AGE_HOURS, run_stage
+from tracing import get_logger, span
+
+logger = get_logger('priceOracle')
+
+# Under a deadline, the second search query is only sent with at least this much of the budget left
+SEARCH_QUERY_BUDGET_S = float(os.getenv('SEARCH_QUERY_BUDGET_S', '5'))
+
+
+def get_search_credentials() -> tuple:
+    """Load .env and return the Custom Search API key and engine ID"""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return os.getenv('GOOGLE_API_KEY'), os.getenv('GOOGLE_CSE_ID')
 
-GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
-GOOGLE_CSE_ID = os.getenv('GOOGLE_CSE_ID')
 
 def extract_prices_from_text(text: str) -> List[float]:
     """Extract price values from text snippets"""
@@ -56,6 +81,15 @@ def extract_prices_from_text(text: str) -> List[float]:
     
     return prices
 
+def build_search_queries(location: str, latitude: float, longitude: float) -> List[str]:
+    """Search queries for a property, most specific first"""
+    return [
+        f"property for sale price {location}",
+        f"real estate price {latitude},{longitude}",
+        f"land price near {location}",
+        f"property valuation {location}"
+    ]
+
 def search_property_prices(location: str, latitude: float, longitude: float) -> Dict:
     """
     Search for property prices using Google Custom Search
@@ -68,7 +102,8 @@ def search_property_prices(location: str, latitude: float, longitude: float) ->
     Returns:
         Dictionary with price data and metadata
     """
-    if not GOOGLE_API_KEY or not GOOGLE_CSE_ID:
+    google_api_key, google_cse_id = get_search_credentials()
+    if not google_api_key or not google_cse_id:
         return {
             'error': 'Google Custom Search API not configured',
             'prices': [],
@@ -77,34 +112,36 @@ def search_property_prices(location: str, latitude: float, longitude: float) ->
         }
     
     # Build more specific search queries
-    queries = [
-        f"property for sale price {location}",
-        f"real estate price {latitude},{longitude}",
-        f"land price near {location}",
-        f"property valuation {location}"
-    ]
+    queries = build_search_queries(location, latitude, longitude)
     
     all_prices = []
     all_sources = []
     
-    for query in queries[:2]:  # Try first 2 queries to save API calls
+    # Imported here so callers that never search don't pay for requests at startup
+    import requests
+    
+    for index, query in enumerate(queries[:2]):  # Try first 2 queries to save API calls
+        if index and not can_afford(SEARCH_QUERY_BUDGET_S):
+            skip('market.second_query')
+            break
         try:
             # Call Google Custom Search API
-            url = "https://www.googleapis.com/customsearch/v1"
+            url = os.getenv('GOOGLE_CSE_ENDPOINT', "https://www.googleapis.com/customsearch/v1")
             params = {
-                'key': GOOGLE_API_KEY,
-                'cx': GOOGLE_CSE_ID,
+                'key': google_api_key,
+                'cx': google_cse_id,
                 'q': query,
                 'num': 10  # Get 10 results
             }
             
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            with span('search.query', query=query) as s:
+                response = requests.get(url, params=params, timeout=request_timeout(10))
+                response.raise_for_status()
+                data = response.json()
+                s.set(bytes=len(response.content), results=len(data.get('items', [])))
             
-            # Debug: Print what we're getting
-            print(f"Query: {query}", file=sys.stderr)
-            print(f"Results: {data.get('searchInformation', {}).get('totalResults', 0)}", file=sys.stderr)
+            logger.debug("Query: %s", query)
+            logger.debug("Results: %s", data.get('searchInformation', {}).get('totalResults', 0))
             
             # Extract prices from search results
             if 'items' in data:
@@ -133,14 +170,14 @@ def search_property_prices(location: str, latitude: float, longitude: float) ->
                             'prices': prices,
                             'snippet': snippet[:100]
                         })
-                        print(f"✓ Found {len(prices)} price(s) in: {title[:50]}", file=sys.stderr)
+                        logger.debug("✓ Found %d price(s) in: %s", len(prices), title[:50])
             
             # If we found prices, don't need more queries
             if all_prices:
                 break
                 
         except Exception as e:
-            print(f"Search query failed: {e}", file=sys.stderr)
+            logger.warning("Search query failed: %s", e)
             continue
     
     if not all_prices:
@@ -154,27 +191,49 @@ def search_property_prices(location: str, latitude: float, longitude: float) ->
             'note': 'Google Custom Search did not return extractable prices. Using satellite-only valuation.'
         }
     
-    # Calculate statistics
-    avg_price = sum(all_prices) / len(all_prices)
-    median_price = sorted(all_prices)[len(all_prices) // 2]
+    price_data = calculate_price_statistics(all_prices)
     
-    # Confidence based on number of results
-    confidence = min(90, 50 + (len(all_prices) * 5))
+    logger.info("✓ Total prices found: %d, Average: $%s", len(all_prices), f"{price_data['average_price']:,}")
+    
+    price_data['sources'] = all_sources[:5]  # Top 5 sources
+    price_data['query'] = queries[0]
+    return price_data
+
+def calculate_price_statistics(prices: List[float]) -> Dict:
+    """Summary statistics and confidence for a non-empty list of extracted prices"""
+    avg_price = sum(prices) / len(prices)
+    median_price = sorted(prices)[len(prices) // 2]
     
-    print(f"✓ Total prices found: {len(all_prices)}, Average: ${int(avg_price):,}", file=sys.stderr)
+    # Confidence based on number of results
+    confidence = min(90, 50 + (len(prices) * 5))
     
     return {
         'average_price': int(avg_price),
         'median_price': int(median_price),
-        'min_price': int(min(all_prices)),
-        'max_price': int(max(all_prices)),
-        'price_count': len(all_prices),
-        'confidence': confidence,
-        'sources': all_sources[:5],  # Top 5 sources
-        'query': queries[0]
+        'min_price': int(min(prices)),
+        'max_price': int(max(prices)),
+        'price_count': len(prices),
+        'confidence': confidence
     }
 
-def get_market_valuation(location: str, latitude: float, longitude: float, area_sqm: float) -> Dict:
+def apply_area_valuation(price_data: Dict, area_sqm: float) -> Dict:
+    """Add estimated_valuation and price_per_sqm to price data, in place"""
+    avg_price = price_data.get('average_price', 0)
+    
+    # Estimate price per sqm if we have area
+    if area_sqm > 0 and avg_price > 0:
+        # Assume found prices are for similar-sized properties
+        # This is a rough estimation
+        estimated_price_per_sqm = avg_price / max(area_sqm, 100)
+        property_valuation = int(estimated_price_per_sqm * area_sqm)
+        
+        price_data['estimated_valuation'] = property_valuation
+        price_data['price_per_sqm'] = int(estimated_price_per_sqm)
+    
+    return price_data
+
+def get_market_valuation(location: str, latitude: float, longitude: float, area_sqm: float,
+                         deadline: Optional[float] = None) -> Dict:
     """
     Get market valuation with price per sqm calculation
     
@@ -183,48 +242,77 @@ def get_market_valuation(location: str, latitude: float, longitude: float, area_
         latitude: Property latitude
         longitude: Property longitude
         area_sqm: Property area in square meters
+        deadline: Unix time the result is needed by (default: the caller's deadline, if any)
     
     Returns:
         Valuation data with price analysis
     """
-    price_data = search_property_prices(location, latitude, longitude)
+    with deadline_scope(deadline):
+        price_data = _get_market_valuation(location, latitude, longitude, area_sqm)
+        if deadline is not None:
+            annotate(price_data)
+    return price_data
+
+def _get_market_valuation(location: str, latitude: float, longitude: float, area_sqm: float) -> Dict:
+    service_url = os.getenv('PIPELINE_SERVICE_URL')
+    if service_url:
+        # Concurrent requests for the same location share one search (pipeline_service.py)
+        try:
+            from pipeline_service import request_service
+            price_data = request_service(service_url, '/market', {
+                'location': location, 'latitude': latitude, 'longitude': longitude, 'area_sqm': area_sqm,
+                'deadline': current_deadline()
+            }, timeout=request_timeout(180))
+            merge_skipped(price_data.get('skipped'))
+            return price_data
+        except Exception as e:
+            logger.warning("Pipeline service unavailable, searching locally: %s", e)
+    
+    price_data = search_market_prices(location, latitude, longitude)
     
     if price_data.get('error'):
         return price_data
     
     # Calculate estimated property value based on area
-    avg_price = price_data.get('average_price', 0)
-    
-    # Estimate price per sqm if we have area
-    if area_sqm > 0 and avg_price > 0:
-        # Assume found prices are for similar-sized properties
-        # This is a rough estimation
-        estimated_price_per_sqm = avg_price / max(area_sqm, 100)
-        property_valuation = int(estimated_price_per_sqm * area_sqm)
-        
-        price_data['estimated_valuation'] = property_valuation
-        price_data['price_per_sqm'] = int(estimated_price_per_sqm)
-    
-    return price_data
+    return apply_area_valuation(price_data, area_sqm)
+
+def search_market_prices(location: str, latitude: float, longitude: float) -> Dict:
+    """Price data for a location, independent of the parcel's area"""
+    # Reused for STAGE_MARKET_MAX_AGE_HOURS while the queries are unchanged (STAGE_CACHE);
+    # failed searches are not stored
+    return run_stage(
+        'market.search',
+        {'queries': build_search_queries(location, latitude, longitude)[:2],
+         'endpoint': os.getenv('GOOGLE_CSE_ENDPOINT', "https://www.googleapis.com/customsearch/v1")},
+        lambda: search_property_prices(location, latitude, longitude),
+        max_age_hours=STAGE_MARKET_MAX_AGE_HOURS,
+        cacheable=lambda data: not data.get('error')
+    )
 
 if __name__ == "__main__":
     # Test with sample data
-    import sys
     import json
+    from profiling import pop_profile_flag, profiled
+    
+    # --profile / PROFILE=cpu,sample,memory writes profiles to PROFILE_DIR (see profiling.py)
+    args = pop_profile_flag(sys.argv[1:])
     
-    if len(sys.argv) > 1:
+    if args:
         # Parse command line args
-        data = json.loads(sys.argv[1])
+        data = json.loads(args[0])
         location = data.get('location', '')
         lat = data.get('latitude', 0)
         lng = data.get('longitude', 0)
         area = data.get('area_sqm', 200)
+        deadline = read_deadline(data)
     else:
         # Default test values
         location = "Chennai, India"
         lat = 13.0827
         lng = 80.2707
         area = 200
+        deadline = None
     
-    result = get_market_valuation(location, lat, lng, area)
+    with profiled('priceOracle'):
+        result = get_market_valuation(location, lat, lng, area, deadline)
     print(json.dumps(result, indent=2))
@@ -0,0 +1,169 @@
+"""
+Stage Cache
+Fingerprinted stage outputs, so a re-verification only re-runs stages whose inputs changed
+
+A stage (satellite fetch, market search, one agent's model call) is keyed by
+a SHA-256 fingerprint of its inputs: coordinates, boundary and scene window,
+search queries, document hashes, prompt hashes and versions, model. Outputs
+are stored as JSON under STAGE_CACHE_DIR/<stage>/<fp[:2]>/<fp>.json. Each
+entry point reports its stages, and whether each was reused, under "stages".
+Enabled with STAGE_CACHE=1.
+
+    python stage_cache.py stats    # entries and bytes per stage
+    python stage_cache.py prune    # remove entries older than STAGE_CACHE_RETENTION_DAYS
+"""
+import contextvars
+import hashlib
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from artifact_store import write_atomic
+from tracing import get_logger, span
+
+logger = get_logger('stage_cache')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STAGE_CACHE = os.getenv('STAGE_CACHE', '0').lower() in ('1', 'true', 'yes', 'on')
+
+STAGE_CACHE_DIR = os.getenv('STAGE_CACHE_DIR', os.path.join(BASE_DIR, '.stage-cache'))
+
+# Market prices go stale even when the query is unchanged
+STAGE_MARKET_MAX_AGE_HOURS = float(os.getenv('STAGE_MARKET_MAX_AGE_HOURS', '24'))
+
+# The satellite scene window ends on a boundary of this many days (Sentinel-2 revisits every ~5 days)
+STAGE_SATELLITE_REFRESH_DAYS = int(os.getenv('STAGE_SATELLITE_REFRESH_DAYS', '5'))
+
+# Entries older than this are removed by 'prune'
+STAGE_CACHE_RETENTION_DAYS = float(os.getenv('STAGE_CACHE_RETENTION_DAYS', '30'))
+
+_stage_log = contextvars.ContextVar('stage_log', default=None)
+
+
+def fingerprint(stage: str, inputs: dict) -> str:
+    """Stable hash of a stage name and its JSON-serializable inputs"""
+    canonical = json.dumps({'stage': stage, 'inputs': inputs}, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def scene_window_end(now: float = None) -> str:
+    """Last STAGE_SATELLITE_REFRESH_DAYS boundary (UTC date), so the window only moves every few days"""
+    period = max(1, STAGE_SATELLITE_REFRESH_DAYS) * 86400
+    return time.strftime('%Y-%m-%d', time.gmtime(((now or time.time()) // period) * period))
+
+
+def entry_path(stage: str, key: str) -> str:
+    return os.path.join(STAGE_CACHE_DIR, stage, key[:2], key + '.json')
+
+
+@contextmanager
+def stage_log():
+    """Collect the stage records of everything run inside the block"""
+    records = []
+    token = _stage_log.set(records)
+    try:
+        yield records
+    finally:
+        _stage_log.reset(token)
+
+
+def _load(stage: str, key: str, max_age_hours: float = None):
+    try:
+        with open(entry_path(stage, key)) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if max_age_hours is not None and time.time() - entry['created_at'] > max_age_hours * 3600:
+        return None
+    return entry
+
+
+def run_stage(stage: str, inputs: dict, compute, max_age_hours: float = None,
+              cacheable=None, reusable=None):
+    """
+    Return a stored output for these inputs, or compute and store it.
+
+    Args:
+        stage: Stage name such as 'satellite' or 'agent1.analysis'
+        inputs: Everything the output depends on (JSON-serializable)
+        compute: Zero-argument function producing the output
+        max_age_hours: Recompute stored outputs older than this
+        cacheable: Predicate on a fresh output; failures such as fallbacks are not stored
+        reusable: Predicate on a stored output, e.g. that its files still exist
+
+    Returns:
+        The stage output
+    """
+    if not STAGE_CACHE:
+        return compute()
+
+    key = fingerprint(stage, inputs)
+    record = {'stage': stage, 'fingerprint': key[:16], 'reused': False}
+    with span(f'stage.{stage}', fingerprint=key[:16]) as s:
+        entry = _load(stage, key, max_age_hours)
+        if entry is not None and (reusable is None or reusable(entry['output'])):
+            record.update(reused=True, age_s=int(time.time() - entry['created_at']))
+            output = entry['output']
+        else:
+            output = compute()
+            if cacheable is None or cacheable(output):
+                try:
+                    entry = {'stage': stage, 'fingerprint': key, 'inputs': inputs,
+                             'created_at': time.time(), 'output': output}
+                    write_atomic(entry_path(stage, key), json.dumps(entry, default=str).encode('utf-8'))
+                except (OSError, TypeError, ValueError) as e:
+                    logger.warning("Could not store %s output: %s", stage, e)
+        s.set(reused=record['reused'])
+
+    records = _stage_log.get()
+    if records is not None:
+        records.append(record)
+    if record['reused']:
+        logger.info("♻️  Reusing %s output (inputs unchanged, %ds old)", stage, record['age_s'])
+    return output
+
+
+def cache_stats() -> dict:
+    stats = {}
+    if not os.path.isdir(STAGE_CACHE_DIR):
+        return stats
+    for stage in sorted(os.listdir(STAGE_CACHE_DIR)):
+        entries, size = 0, 0
+        for directory, _, files in os.walk(os.path.join(STAGE_CACHE_DIR, stage)):
+            for name in files:
+                entries += 1
+                size += os.path.getsize(os.path.join(directory, name))
+        stats[stage] = {'entries': entries, 'bytes': size}
+    return stats
+
+
+def prune(now: float = None) -> int:
+    """Remove entries older than STAGE_CACHE_RETENTION_DAYS; returns the number removed"""
+    if not os.path.isdir(STAGE_CACHE_DIR):
+        return 0
+    cutoff = (now or time.time()) - STAGE_CACHE_RETENTION_DAYS * 86400
+    removed = 0
+    for directory, _, files in os.walk(STAGE_CACHE_DIR):
+        for name in files:
+            path = os.path.join(directory, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.unlink(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    if command == 'stats':
+        print(json.dumps(cache_stats(), indent=2))
+    elif command == 'prune':
+        print(json.dumps({'removed': prune()}))
+    else:
+        print("Usage: python stage_cache.py [stats | prune]", file=sys.stderr)
+        sys.exit(1)
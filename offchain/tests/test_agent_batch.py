@@ -0,0 +1,19 @@
+import pytest
+
+from agent_batch import assign_property_ids
+
+
+def test_ids_fall_back_to_request_id_and_position():
+    assert assign_property_ids([{'property_id': 'p'}, {'request_id': 'r'}, {}]) == ['p', 'r', 'property-3']
+
+
+@pytest.mark.parametrize('names, expected', [
+    (['a', 'a#2', 'a'], ['a', 'a#2', 'a#3']),
+    (['a', 'a#3', 'a'], ['a', 'a#3', 'a#4']),
+    (['a', 'a', 'a#2'], ['a', 'a#2', 'a#2#3']),
+    (['a', 'a', 'a'], ['a', 'a#2', 'a#3']),
+])
+def test_duplicate_ids_are_made_unique(names, expected):
+    ids = assign_property_ids([{'property_id': name} for name in names])
+    assert ids == expected
+    assert len(set(ids)) == len(ids)
@@ -0,0 +1,33 @@
+import io
+import json
+
+import pytest
+
+from agent_input import load_file, read_input, read_ndjson_stream
+
+
+def test_load_file_decodes_json_from_the_mapping(tmp_path):
+    path = tmp_path / 'request.json'
+    path.write_text(json.dumps({'latitude': 1.5, 'document_contents': ['Sy. No. 12 – ₹ 45,00,000']}, ensure_ascii=False),
+                    encoding='utf-8')
+    assert load_file(str(path)) == {'latitude': 1.5, 'document_contents': ['Sy. No. 12 – ₹ 45,00,000']}
+
+
+def test_load_file_rejects_empty_files(tmp_path):
+    path = tmp_path / 'empty.json'
+    path.write_bytes(b'')
+    with pytest.raises(ValueError, match='Empty input file'):
+        load_file(str(path))
+
+
+def test_ndjson_stream_appends_documents():
+    stream = io.BytesIO(b'{"latitude": 2, "document_contents": ["inline"]}\n"first"\n\n"second"\n')
+    assert read_ndjson_stream(stream) == {'latitude': 2, 'document_contents': ['inline', 'first', 'second']}
+
+
+def test_read_input_resolves_document_refs(tmp_path):
+    document = tmp_path / 'deed.txt'
+    document.write_text('SALE DEED', encoding='utf-8')
+    request = tmp_path / 'request.json'
+    request.write_text(json.dumps({'document_refs': [{'path': str(document)}]}), encoding='utf-8')
+    assert read_input(['--input', str(request)]) == {'document_contents': ['SALE DEED']}
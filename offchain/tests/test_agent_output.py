@@ -0,0 +1,208 @@
+import pytest
+
+from agent_output import OutputError, compile_schema, conform, load_output, repair_json
+
+
+@pytest.mark.parametrize('text, expected, repair', [
+    ('```json\n{"a": 1}\n```', {'a': 1}, 'code_fence'),
+    ('Here is the result: {"a": 1}', {'a': 1}, 'leading_text'),
+    ('{"a": 1} Hope this helps', {'a': 1}, 'trailing_text'),
+    ("{'a': 'b'}", {'a': 'b'}, 'single_quotes'),
+    ('{"a": True, "b": None}', {'a': True, 'b': None}, 'python_literals'),
+    ('{"a": ACCEPT}', {'a': 'ACCEPT'}, 'unquoted_strings'),
+    ('{"a": [1, 2,],}', {'a': [1, 2]}, 'trailing_comma'),
+    ('{"a": 1 "b": 2}', {'a': 1, 'b': 2}, 'missing_comma'),
+    ('{"a": 1, "b": "cut', {'a': 1, 'b': 'cut'}, 'truncated'),
+    ('{"a": +5, "b": 01.50}', {'a': 5, 'b': 1.5}, 'invalid_number'),
+    ('{"a": "line\nbreak"}', {'a': 'line\nbreak'}, 'control_characters'),
+    ('{"a": 1, @ "b": 2}', {'a': 1, 'b': 2}, 'stray_characters'),
+])
+def test_repair_kinds(text, expected, repair):
+    assert repair_json(text) == (expected, [repair])
+
+
+def test_valid_json_needs_no_repair():
+    assert repair_json('{"a": "\\u00e9"}') == ({'a': 'é'}, [])
+
+
+def test_truncated_key_and_literal_are_dropped():
+    assert repair_json('{"a": "x", "b"') == ({'a': 'x'}, ['truncated'])
+    assert repair_json('{"a": tru') == ({}, ['truncated'])
+
+
+def test_expect_array_starts_at_bracket():
+    assert repair_json('Results: [1, 2] and more', 'array') == ([1, 2], ['leading_text', 'trailing_text'])
+
+
+def test_no_json_raises():
+    with pytest.raises(OutputError):
+        repair_json('no json here')
+    with pytest.raises(OutputError):
+        repair_json(None)
+
+
+NUMBER = compile_schema({'type': 'number'})
+SCORE = compile_schema({'type': 'integer', 'minimum': 0, 'maximum': 100})
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('$450,000', 450000),
+    ('85%', 85),
+    ('1.2e6 USD', 1200000),
+    ('-3.5', -3.5),
+    (True, 1.0),
+])
+def test_number_coercion(value, expected):
+    coercions = []
+    assert NUMBER(value, coercions) == expected
+    assert len(coercions) == 1
+
+
+def test_number_passes_through_unchanged():
+    coercions = []
+    assert NUMBER(42, coercions) == 42
+    assert coercions == []
+
+
+@pytest.mark.parametrize('value, expected', [(140, 100), (-5, 0), ('250%', 100), (99.6, 100), (50, 50)])
+def test_score_is_rounded_and_clamped(value, expected):
+    assert SCORE(value, []) == expected
+
+
+def test_clamping_is_reported():
+    coercions = []
+    SCORE(140, coercions)
+    assert coercions == ['$: 140 clamped to 100']
+
+
+def test_non_numeric_text_is_rejected():
+    with pytest.raises(OutputError, match='expected a number'):
+        NUMBER('unknown', [])
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('yes', True), ('Y', True), ('true', True), ('1', True), (1, True),
+    ('no', False), (' N ', False), ('false', False), (0, False),
+])
+def test_boolean_coercion(value, expected):
+    assert compile_schema({'type': 'boolean'})(value, []) is expected
+
+
+def test_unrecognized_boolean_is_rejected():
+    with pytest.raises(OutputError, match='expected a boolean'):
+        compile_schema({'type': 'boolean'})('maybe', [])
+
+
+LIST = compile_schema({'type': 'array', 'items': {'type': 'string'}})
+
+
+def test_scalar_is_wrapped_in_a_list():
+    coercions = []
+    assert LIST('Forged seal', coercions) == ['Forged seal']
+    assert coercions == ['$: wrapped in a list']
+
+
+@pytest.mark.parametrize('word', ['', 'none', 'N/A', 'na', 'null', '-'])
+def test_empty_words_become_an_empty_list(word):
+    assert LIST(word, []) == []
+
+
+def test_nulls_are_dropped_from_lists():
+    coercions = []
+    assert LIST(['a', None, 'b'], coercions) == ['a', 'b']
+    assert coercions == ['$[1]: dropped null']
+
+
+def test_scalars_become_strings():
+    assert LIST([5], []) == ['5']
+    with pytest.raises(OutputError, match='expected a string'):
+        LIST([{'a': 1}], [])
+
+
+VERDICT = compile_schema({'type': 'string', 'enum': ['ACCEPT', 'REJECT'], 'default': 'REJECT'})
+
+
+def test_enum_matches_case_insensitively():
+    coercions = []
+    assert VERDICT(' accept ', coercions) == 'ACCEPT'
+    assert len(coercions) == 1
+
+
+def test_unknown_enum_value_falls_back_to_default():
+    coercions = []
+    assert VERDICT('probably fine', coercions) == 'REJECT'
+    assert coercions == ["$: 'probably fine' -> default"]
+
+
+def test_unknown_enum_value_without_default_is_rejected():
+    with pytest.raises(OutputError, match='expected one of'):
+        compile_schema({'type': 'string', 'enum': ['A']})('B', [])
+
+
+def test_min_length():
+    with pytest.raises(OutputError, match='shorter than 3'):
+        compile_schema({'type': 'string', 'minLength': 3})('  a ', [])
+
+
+ANALYSIS = compile_schema({
+    'type': 'object',
+    'required': ['valuation'],
+    'properties': {
+        'valuation': {'type': 'number', 'minimum': 0},
+        'risk_factors': {'type': 'array', 'items': {'type': 'string'}, 'default': []},
+        'verification': {
+            'type': 'object',
+            'properties': {'score': {'type': 'integer', 'minimum': 0, 'maximum': 100, 'default': 0}},
+        },
+    },
+})
+
+
+def test_missing_required_field_is_rejected():
+    with pytest.raises(OutputError, match=r'\$\.valuation: missing'):
+        ANALYSIS({'risk_factors': []}, [])
+    with pytest.raises(OutputError, match=r'\$\.valuation: missing'):
+        ANALYSIS({'valuation': None}, [])
+
+
+def test_defaults_fill_missing_and_null_fields():
+    coercions = []
+    result = ANALYSIS({'valuation': '$1,000', 'verification': {'score': None}}, coercions)
+    assert result == {'valuation': 1000, 'risk_factors': [], 'verification': {'score': 0}}
+    # Only an explicit null is reported; an absent field is filled silently
+    assert coercions == ["$.valuation: '$1,000' -> 1000", '$.verification.score: null -> default']
+
+
+def test_defaults_are_copied():
+    first = ANALYSIS({'valuation': 1}, [])
+    first['risk_factors'].append('changed')
+    assert ANALYSIS({'valuation': 1}, [])['risk_factors'] == []
+
+
+def test_nested_paths_in_errors():
+    with pytest.raises(OutputError, match=r'\$\.verification: expected an object'):
+        ANALYSIS({'valuation': 1, 'verification': 'ok'}, [])
+
+
+def test_conform_returns_none_for_misfits():
+    assert conform(ANALYSIS, {'valuation': 5}) == {'valuation': 5, 'risk_factors': []}
+    assert conform(ANALYSIS, {'risk_factors': []}) is None
+
+
+def test_load_output_counts_repairs_and_reasks():
+    usage = {'repaired': 0, 'reasked': 0}
+    value = load_output("```\n{'valuation': '$2,500'}\n```", ANALYSIS, usage=usage)
+    assert value == {'valuation': 2500, 'risk_factors': []}
+    assert usage == {'repaired': 1, 'reasked': 0}
+
+    problems = []
+    value = load_output('I cannot answer that', ANALYSIS, usage=usage,
+                        reask=lambda problem: problems.append(problem) or '{"valuation": 10}')
+    assert value == {'valuation': 10, 'risk_factors': []}
+    assert usage == {'repaired': 1, 'reasked': 1}
+    assert problems == ['No JSON object in response']
+
+
+def test_load_output_without_reask_raises():
+    with pytest.raises(OutputError):
+        load_output('nothing', ANALYSIS)
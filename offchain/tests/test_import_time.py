@@ -0,0 +1,9 @@
+from check_import_time import IMPORT_BUDGETS_MS, check_budgets
+
+
+def test_entry_points_import_within_budget():
+    results = check_budgets(runs=10)
+    heavy = {module: names for module, (_, names) in results.items() if names}
+    over = {module: round(best_ms, 1) for module, (best_ms, _) in results.items() if best_ms > IMPORT_BUDGETS_MS[module]}
+    assert not heavy, f"eager SDK imports: {heavy}"
+    assert not over, f"over import budget (ms): {over}, budgets: {IMPORT_BUDGETS_MS}"
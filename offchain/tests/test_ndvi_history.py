@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+import ndvi_history
+
+
+@pytest.fixture
+def queries(tmp_path, monkeypatch):
+    """Earth Engine scene queries made by refresh_history, answered from a list"""
+    monkeypatch.setattr(ndvi_history, 'NDVI_HISTORY_DIR', str(tmp_path))
+    calls, scenes = [], []
+
+    def query_scenes(ee, collection, region, start_ms, end_ms):
+        calls.append((start_ms, end_ms))
+        return list(scenes)
+
+    monkeypatch.setattr(ndvi_history, 'query_scenes', query_scenes)
+    return calls, scenes
+
+
+def test_empty_history_is_not_requeried_while_fresh(queries):
+    calls, _ = queries
+    now = 1_700_000_000.0
+    assert ndvi_history.refresh_history(None, None, None, 'abcd', now) == ([], 0, True)
+    os.utime(ndvi_history.history_path('abcd'), (now, now))
+
+    assert ndvi_history.refresh_history(None, None, None, 'abcd', now + 3600) == ([], 0, False)
+    assert len(calls) == 1
+
+    stale = now + ndvi_history.NDVI_HISTORY_REFRESH_HOURS * 3600 + 1
+    assert ndvi_history.refresh_history(None, None, None, 'abcd', stale)[2] is True
+    assert len(calls) == 2
+
+
+def test_refresh_only_queries_after_the_last_scene(queries):
+    calls, scenes = queries
+    now = 1_700_000_000.0
+    scenes.append((int(now * 1000) - 86400 * 1000, 0.5, 3.0))
+    records, fetched, queried = ndvi_history.refresh_history(None, None, None, 'abcd', now)
+    assert (len(records), fetched, queried) == (1, 1, True)
+    assert calls[0][0] == calls[0][1] - ndvi_history.NDVI_HISTORY_DAYS * 86400 * 1000
+
+    later = now + ndvi_history.NDVI_HISTORY_REFRESH_HOURS * 3600 + 1
+    os.utime(ndvi_history.history_path('abcd'), (now, now))
+    records, fetched, queried = ndvi_history.refresh_history(None, None, None, 'abcd', later)
+    assert (len(records), fetched, queried) == (1, 0, True)
+    assert calls[1][0] == scenes[0][0] - ndvi_history.OVERLAP_MS
@@ -0,0 +1,93 @@
+import math
+
+import pytest
+
+from parcel_geometry import SEMI_MAJOR_AXIS, geodesic_area, parse_boundary, simplify, vertex_count
+
+# Surface area of the WGS84 ellipsoid
+EARTH_AREA_M2 = 510_065_621.724e6
+
+METRES_PER_DEGREE = math.pi * SEMI_MAJOR_AXIS / 180
+
+
+def polygon(*rings):
+    return parse_boundary({'type': 'Polygon', 'coordinates': [list(ring) for ring in rings]})
+
+
+def test_octant_is_an_eighth_of_the_ellipsoid():
+    octant = polygon([(0, 0), (90, 0), (90, 90), (0, 90)])
+    assert geodesic_area(octant) == pytest.approx(EARTH_AREA_M2 / 8, rel=1e-9)
+
+
+def test_holes_are_excluded():
+    outer = [(0, 0), (1, 0), (1, 1), (0, 1)]
+    hole = [(0.25, 0.25), (0.75, 0.25), (0.75, 0.75), (0.25, 0.75)]
+    full = geodesic_area(polygon(outer))
+    assert geodesic_area(polygon(outer, hole)) == pytest.approx(full - geodesic_area(polygon(hole)))
+
+
+def test_area_ignores_winding_and_the_antimeridian():
+    square = [(179.5, 10), (-179.5, 10), (-179.5, 11), (179.5, 11)]
+    shifted = [(0.5, 10), (1.5, 10), (1.5, 11), (0.5, 11)]
+    assert geodesic_area(polygon(square)) == pytest.approx(geodesic_area(polygon(shifted)))
+    assert geodesic_area(polygon(list(reversed(square)))) == pytest.approx(geodesic_area(polygon(square)))
+
+
+def _local(ring, latitude):
+    scale = METRES_PER_DEGREE * math.cos(math.radians(latitude))
+    return [(lon * scale, lat * METRES_PER_DEGREE) for lon, lat in ring]
+
+
+def _distance_to_ring(point, ring):
+    """Shortest distance from a point to the segments of a ring, in the ring's units"""
+    best = math.inf
+    (x, y) = point
+    for (x0, y0), (x1, y1) in zip(ring, ring[1:]):
+        dx, dy = x1 - x0, y1 - y0
+        t = max(0.0, min(1.0, ((x - x0) * dx + (y - y0) * dy) / (dx * dx + dy * dy or 1)))
+        best = min(best, math.hypot(x - x0 - t * dx, y - y0 - t * dy))
+    return best
+
+
+def noisy_square(latitude, side_m, noise_m, points_per_side=25):
+    """A square parcel whose edges wobble by up to noise_m, in lon/lat"""
+    step = side_m / points_per_side
+    corners = [(0, 0), (side_m, 0), (side_m, side_m), (0, side_m)]
+    local = []
+    for (x0, y0), (x1, y1) in zip(corners, corners[1:] + corners[:1]):
+        normal = ((y1 - y0) / side_m, -(x1 - x0) / side_m)
+        for i in range(points_per_side):
+            offset = noise_m * (1 if i % 2 else -1) if i else 0
+            local.append((x0 + (x1 - x0) * i * step / side_m + normal[0] * offset,
+                          y0 + (y1 - y0) * i * step / side_m + normal[1] * offset))
+    scale = METRES_PER_DEGREE * math.cos(math.radians(latitude))
+    return [(77.59 + x / scale, latitude + y / METRES_PER_DEGREE) for x, y in local]
+
+
+@pytest.mark.parametrize('tolerance_m', [2.0, 5.0])
+def test_simplified_ring_stays_within_tolerance(tolerance_m):
+    ring = noisy_square(12.97, 200, noise_m=0.8 * tolerance_m)
+    surveyed = polygon(ring)
+    simplified = simplify(surveyed, tolerance_m)
+    # The wobble is below the tolerance, so only the corners remain
+    assert vertex_count(simplified) == 5
+    kept = _local(simplified[0][0], 12.97)
+    assert all(_distance_to_ring(point, kept) <= tolerance_m + 1e-6 for point in _local(surveyed[0][0], 12.97))
+
+
+def test_deviations_above_tolerance_are_kept():
+    ring = noisy_square(12.97, 200, noise_m=3.0)
+    assert vertex_count(simplify(polygon(ring), 2.0)) == vertex_count(polygon(ring))
+
+
+def test_zero_tolerance_keeps_the_boundary():
+    surveyed = polygon(noisy_square(12.97, 200, noise_m=0.5))
+    assert simplify(surveyed, 0) is surveyed
+
+
+def test_rings_are_closed_and_validated():
+    assert polygon([(0, 0), (1, 0), (1, 1)])[0][0][-1] == (0.0, 0.0)
+    with pytest.raises(ValueError):
+        polygon([(0, 0), (1, 0)])
+    with pytest.raises(ValueError):
+        polygon([(0, 0), (200, 0), (1, 1)])
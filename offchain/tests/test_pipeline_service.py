@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from deadline import current_deadline
+from pipeline_service import SingleFlight
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        yield pool
+
+
+class Upstream:
+    """A blocking computation that waits for release() and counts its calls"""
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.released = threading.Event()
+        self.deadlines = []
+
+    def __call__(self, value):
+        self.calls += 1
+        self.deadlines.append(current_deadline())
+        self.started.set()
+        if not self.released.wait(5):
+            raise TimeoutError("never released")
+        return {'value': value}
+
+
+async def started(upstream):
+    await asyncio.get_running_loop().run_in_executor(None, upstream.started.wait, 5)
+
+
+def test_concurrent_waiters_share_one_call(executor):
+    async def scenario():
+        flight, upstream = SingleFlight('test', 2, executor), Upstream()
+        waiters = [asyncio.ensure_future(flight.run('key', upstream, 7)) for _ in range(8)]
+        await started(upstream)
+        upstream.released.set()
+        results = await asyncio.gather(*waiters)
+        return flight, upstream, results
+
+    flight, upstream, results = asyncio.run(scenario())
+    assert upstream.calls == 1
+    assert all(result is results[0] for result in results)
+    assert results[0] == {'value': 7}
+    report = flight.report()
+    assert (report['requests'], report['upstream_calls'], report['coalesced'], report['in_flight']) == (8, 1, 7, 0)
+
+
+def test_different_keys_do_not_share(executor):
+    async def scenario():
+        flight, upstream = SingleFlight('test', 2, executor), Upstream()
+        upstream.released.set()
+        return upstream, await asyncio.gather(flight.run('a', upstream, 1), flight.run('b', upstream, 2))
+
+    upstream, results = asyncio.run(scenario())
+    assert upstream.calls == 2
+    assert results == [{'value': 1}, {'value': 2}]
+
+
+def test_cancelled_waiter_does_not_cancel_the_others(executor):
+    async def scenario():
+        flight, upstream = SingleFlight('test', 2, executor), Upstream()
+        first = asyncio.ensure_future(flight.run('key', upstream, 1))
+        others = [asyncio.ensure_future(flight.run('key', upstream, 1)) for _ in range(3)]
+        await started(upstream)
+        first.cancel()
+        await asyncio.sleep(0)
+        upstream.released.set()
+        results = await asyncio.gather(*others)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return flight, upstream, results
+
+    flight, upstream, results = asyncio.run(scenario())
+    assert upstream.calls == 1
+    assert results == [{'value': 1}] * 3
+    assert flight.report()['in_flight'] == 0
+
+
+def test_expired_deadline_only_stops_that_waiter(executor):
+    async def scenario():
+        flight, upstream = SingleFlight('test', 2, executor), Upstream()
+        patient = asyncio.ensure_future(flight.run('key', upstream, 1))
+        await started(upstream)
+        with pytest.raises(asyncio.TimeoutError):
+            await flight.run('key', upstream, 1, deadline=time.time() + 0.05)
+        upstream.released.set()
+        return upstream, await patient
+
+    upstream, result = asyncio.run(scenario())
+    assert upstream.calls == 1
+    assert result == {'value': 1}
+
+
+def test_joiners_extend_the_shared_deadline(executor):
+    async def scenario():
+        flight, upstream = SingleFlight('test', 2, executor), Upstream()
+        soon = time.time() + 30
+        first = asyncio.ensure_future(flight.run('key', upstream, 1, deadline=soon))
+        await started(upstream)
+        later = asyncio.ensure_future(flight.run('key', upstream, 1, deadline=soon + 60))
+        await asyncio.sleep(0)
+        scope = flight.in_flight['key'][1]
+        extended = scope['deadline']
+        upstream.released.set()
+        await asyncio.gather(first, later)
+        return upstream, soon, extended
+
+    upstream, soon, extended = asyncio.run(scenario())
+    assert upstream.deadlines == [soon]
+    assert extended == soon + 60
+
+
+def test_errors_reach_every_waiter_and_the_key_is_released(executor):
+    calls = []
+
+    def failing():
+        calls.append(1)
+        time.sleep(0.05)
+        raise RuntimeError("upstream down")
+
+    async def scenario():
+        flight = SingleFlight('test', 2, executor)
+        results = await asyncio.gather(*(flight.run('key', failing) for _ in range(3)), return_exceptions=True)
+        retry = await asyncio.gather(flight.run('key', failing), return_exceptions=True)
+        return flight, results, retry
+
+    flight, results, retry = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results + retry)
+    assert len(calls) == 2
+    assert flight.report()['errors'] == 2
@@ -0,0 +1,19 @@
+import pytest
+
+from scene_catalog import mgrs_tile
+
+
+@pytest.mark.parametrize('latitude, longitude, tile', [
+    (12.9716, 77.5946, '43PGQ'),    # Bengaluru
+    (40.7128, -74.0060, '18TWL'),   # New York
+    (-33.8688, 151.2093, '56HLH'),  # Sydney
+    (51.5074, -0.1278, '30UXC'),    # London
+    (48.8566, 2.3522, '31UDQ'),     # Paris
+])
+def test_reference_tiles(latitude, longitude, tile):
+    assert mgrs_tile(latitude, longitude) == tile
+
+
+def test_norway_uses_the_widened_zone_32():
+    # Bergen lies in zone 31 by longitude alone
+    assert mgrs_tile(60.39, 5.32).startswith('32V')
@@ -0,0 +1,209 @@
+"""
+Satellite Tile Cache
+Fixed-grid Web Mercator tiles shared by neighbouring parcels, composed locally into each view
+
+With SATELLITE_IMAGERY_MODE=tiles the satellite service fetches each layer as
+XYZ tiles instead of a per-parcel getThumbURL render. Tiles are cached under
+TILE_CACHE_DIR as <layer key>/<z>/<x>/<y>.png, where the layer key hashes the
+layer name, scene ID and visualization parameters, so parcels on the same
+scene reuse each other's tiles. Requires NumPy and Pillow.
+
+    python tile_cache.py prune    # remove tiles unused for TILE_CACHE_RETENTION_DAYS
+"""
+import hashlib
+import io
+import json
+import math
+import os
+import sys
+import time
+
+from artifact_store import maintenance_due, write_atomic
+from deadline import request_timeout
+from tracing import get_logger, span
+
+logger = get_logger('tile_cache')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TILE_CACHE_DIR = os.getenv('TILE_CACHE_DIR', os.path.join(BASE_DIR, '.tile-cache'))
+
+# Zoom 16 is ~2.4 m/pixel at the equator, finer than Sentinel-2's 10 m bands
+SATELLITE_TILE_ZOOM = int(os.getenv('SATELLITE_TILE_ZOOM', '16'))
+
+# Side of the composed parcel view, in pixels
+SATELLITE_TILE_VIEW_PX = int(os.getenv('SATELLITE_TILE_VIEW_PX', '1024'))
+
+# Parallel tile downloads per layer
+SATELLITE_TILE_WORKERS = int(os.getenv('SATELLITE_TILE_WORKERS', '8'))
+
+# Tiles not used for this long are removed
+TILE_CACHE_RETENTION_DAYS = float(os.getenv('TILE_CACHE_RETENTION_DAYS', '30'))
+
+# The satellite service prunes the cache at most this often (each prune walks every tile)
+TILE_CACHE_PRUNE_INTERVAL_MINUTES = float(os.getenv('TILE_CACHE_PRUNE_INTERVAL_MINUTES', '60'))
+
+TILE_SIZE = 256
+
+
+def new_tile_stats() -> dict:
+    return {'hits': 0, 'misses': 0}
+
+
+def summarize_tile_stats(stats: dict) -> dict:
+    """Hit/miss counts plus hit ratio for the service result"""
+    total = stats['hits'] + stats['misses']
+    return {
+        **stats,
+        'hit_ratio': round(stats['hits'] / total, 3) if total else None,
+        'zoom': SATELLITE_TILE_ZOOM,
+        'view_px': SATELLITE_TILE_VIEW_PX,
+    }
+
+
+def layer_key(kind: str, scene_id: str, vis_params: dict) -> str:
+    """Cache namespace for one rendered layer of one scene"""
+    identity = json.dumps({'layer': kind, 'scene': scene_id, 'vis': vis_params}, sort_keys=True)
+    return hashlib.sha256(identity.encode('utf-8')).hexdigest()[:20]
+
+
+def lonlat_to_pixel(lon: float, lat: float, zoom: int) -> tuple:
+    """Global Web Mercator pixel coordinates at a zoom level"""
+    scale = TILE_SIZE * (1 << zoom)
+    lat = max(-85.05112878, min(85.05112878, lat))
+    sin_lat = math.sin(math.radians(lat))
+    x = (lon + 180.0) / 360.0 * scale
+    y = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * scale
+    return x, y
+
+
+def view_tiles(lon: float, lat: float, zoom: int, view_px: int) -> tuple:
+    """
+    Tiles covering a square view centred on a point.
+
+    Returns:
+        (view origin x, view origin y, list of (x, y) tile coordinates)
+    """
+    center_x, center_y = lonlat_to_pixel(lon, lat, zoom)
+    origin_x = int(round(center_x - view_px / 2))
+    origin_y = int(round(center_y - view_px / 2))
+    tiles = [
+        (x, y)
+        for y in range(origin_y // TILE_SIZE, (origin_y + view_px - 1) // TILE_SIZE + 1)
+        for x in range(origin_x // TILE_SIZE, (origin_x + view_px - 1) // TILE_SIZE + 1)
+    ]
+    return origin_x, origin_y, tiles
+
+
+def tile_path(key: str, zoom: int, x: int, y: int) -> str:
+    return os.path.join(TILE_CACHE_DIR, key, str(zoom), str(x), f"{y}.png")
+
+
+def _fetch_tile(requests, url_format: str, path: str, zoom: int, x: int, y: int, timeout: float = 30) -> None:
+    # Tile x wraps around the antimeridian; the grid position stays unwrapped for composing
+    url = url_format.format(x=x % (1 << zoom), y=y, z=zoom)
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    write_atomic(path, response.content)
+
+
+def render_layer(requests, image, vis_params: dict, kind: str, scene_id: str,
+                 lon: float, lat: float, stats: dict) -> bytes:
+    """
+    Compose one layer's parcel view from cached tiles, fetching only missing ones.
+
+    Args:
+        requests: The requests module (imported lazily by the caller)
+        image: Earth Engine image to render
+        vis_params: Visualization parameters ('dimensions' is ignored)
+        kind: Layer name such as 'rgb' or 'ndvi'
+        scene_id: Earth Engine ID of the source scene
+        lon, lat: Parcel centre
+        stats: Tile hit/miss counters, updated in place
+
+    Returns:
+        PNG bytes of the composed view
+    """
+    import numpy as np
+    from PIL import Image
+
+    vis_params = {k: v for k, v in vis_params.items() if k != 'dimensions'}
+    key = layer_key(kind, scene_id, vis_params)
+    zoom, view_px = SATELLITE_TILE_ZOOM, SATELLITE_TILE_VIEW_PX
+    origin_x, origin_y, tiles = view_tiles(lon, lat, zoom, view_px)
+
+    missing = []
+    for x, y in tiles:
+        path = tile_path(key, zoom, x, y)
+        if os.path.exists(path):
+            # Refresh last-use time so retention keeps tiles neighbours still use
+            os.utime(path)
+        else:
+            missing.append((x, y))
+    stats['hits'] += len(tiles) - len(missing)
+    stats['misses'] += len(missing)
+
+    with span(f'tiles.{kind}', tiles=len(tiles), misses=len(missing)):
+        if missing:
+            from concurrent.futures import ThreadPoolExecutor
+
+            url_format = image.getMapId(vis_params)['tile_fetcher'].url_format
+            # Taken here: the pool's threads do not see the request's deadline scope
+            timeout = request_timeout(30)
+            with ThreadPoolExecutor(max_workers=SATELLITE_TILE_WORKERS) as pool:
+                # list() re-raises the first failed download
+                list(pool.map(lambda tile: _fetch_tile(requests, url_format, tile_path(key, zoom, *tile), zoom, *tile,
+                                                       timeout=timeout),
+                              missing))
+
+        canvas = np.zeros((view_px, view_px, 4), dtype=np.uint8)
+        for x, y in tiles:
+            with Image.open(tile_path(key, zoom, x, y)) as tile:
+                pixels = np.asarray(tile.convert('RGBA'))
+            # Overlap of this tile with the view, in view coordinates
+            left, top = x * TILE_SIZE - origin_x, y * TILE_SIZE - origin_y
+            x0, y0 = max(0, left), max(0, top)
+            x1, y1 = min(view_px, left + TILE_SIZE), min(view_px, top + TILE_SIZE)
+            canvas[y0:y1, x0:x1] = pixels[y0 - top:y1 - top, x0 - left:x1 - left]
+
+        buffer = io.BytesIO()
+        # Fast, lossless; the encoding stage produces the stored format
+        Image.fromarray(canvas, 'RGBA').save(buffer, 'PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def prune_tiles(now: float = None) -> int:
+    """Remove tiles unused for TILE_CACHE_RETENTION_DAYS; returns the number removed"""
+    if not os.path.isdir(TILE_CACHE_DIR):
+        return 0
+    cutoff = (now or time.time()) - TILE_CACHE_RETENTION_DAYS * 86400
+    removed = 0
+    for directory, _, files in os.walk(TILE_CACHE_DIR):
+        for name in files:
+            if name.startswith('.'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.unlink(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def prune_tiles_if_due(now: float = None):
+    """prune_tiles at most every TILE_CACHE_PRUNE_INTERVAL_MINUTES; None when it was not due"""
+    if not os.path.isdir(TILE_CACHE_DIR):
+        return None
+    if not maintenance_due(os.path.join(TILE_CACHE_DIR, '.last-prune'), TILE_CACHE_PRUNE_INTERVAL_MINUTES * 60, now):
+        return None
+    return prune_tiles(now)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'prune':
+        print(json.dumps({'removed': prune_tiles()}))
+    else:
+        print("Usage: python tile_cache.py prune", file=sys.stderr)
+        sys.exit(1)
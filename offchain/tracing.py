@@ -0,0 +1,222 @@
+"""
+Tracing & Logging
+Named timing spans and leveled, sampled logging for the Python services
+
+Spans record a duration plus attributes such as byte and token counts and
+are returned in each service's JSON result under "trace". Set
+TRACE_FORMAT=otel to export OpenTelemetry-compatible span records instead
+of the compact form.
+
+Logging goes to stderr. LOG_LEVEL sets the level (default INFO) and
+LOG_SAMPLE_RATE keeps only that fraction of DEBUG records (default 1.0).
+"""
+import contextvars
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+TRACE_FORMAT = os.getenv('TRACE_FORMAT', 'compact')
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class _SampleFilter:
+    """Drop a random share of DEBUG records; other levels always pass"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > 10 or self.rate >= 1:  # above logging.DEBUG
+            return True
+        import random
+
+        return random.random() < self.rate
+
+
+def _configure(name: str):
+    """The stdlib logger for a service, with its stderr handler attached once"""
+    import logging
+
+    logger = logging.getLogger(f"prop99.{name}")
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter(f"[{name}] %(levelname)s %(message)s"))
+        handler.addFilter(_SampleFilter(float(os.getenv('LOG_SAMPLE_RATE', '1.0'))))
+        logger.addHandler(handler)
+        logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+        logger.propagate = False
+    return logger
+
+
+class _Logger:
+    """
+    Returned by get_logger: modules create their logger at import, but the
+    logging package is only loaded and configured on the first record.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._logger = None
+
+    def __getattr__(self, attribute):
+        if self._logger is None:
+            self._logger = _configure(self._name)
+        value = getattr(self._logger, attribute)
+        if callable(value):
+            # Bound once, so later calls skip __getattr__
+            setattr(self, attribute, value)
+        return value
+
+
+def get_logger(name: str):
+    """Service logger writing leveled, sampled records to stderr (a logging.Logger once used)"""
+    return _Logger(name)
+
+
+class _LazyId:
+    """Random hex ID drawn on first read, so spans that are never exported cost nothing"""
+
+    def __init__(self, hex_digits: int):
+        self.bytes = hex_digits // 2
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.name] = os.urandom(self.bytes).hex()
+        return value
+
+
+class Span:
+    """One timed operation inside a trace"""
+
+    span_id = _LazyId(16)
+
+    def __init__(self, trace, name: str, parent, attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes)
+        self.status = 'ok'
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self.duration_ms = None
+
+    def set(self, **attributes) -> None:
+        """Attach attributes such as bytes or token counts"""
+        self.attributes.update(attributes)
+
+    def end(self, error: Exception = None) -> None:
+        self.duration_ms = round((time.perf_counter() - self._start) * 1000, 2)
+        if error is not None:
+            self.status = 'error'
+            self.attributes['error'] = f"{type(error).__name__}: {error}"[:200]
+
+    @property
+    def parent_id(self):
+        return self.parent.span_id if self.parent else None
+
+    def export(self) -> dict:
+        if TRACE_FORMAT == 'otel':
+            return {
+                'traceId': self.trace.trace_id,
+                'spanId': self.span_id,
+                'parentSpanId': self.parent_id or '',
+                'name': self.name,
+                'startTimeUnixNano': self.start_ns,
+                'endTimeUnixNano': self.start_ns + int((self.duration_ms or 0) * 1e6),
+                'attributes': [_otel_attribute(k, v) for k, v in self.attributes.items()],
+                'status': {'code': 2 if self.status == 'error' else 1},
+            }
+        record = {
+            'name': self.name,
+            'start_ms': round((self.start_ns - self.trace.start_ns) / 1e6, 2),
+            'duration_ms': self.duration_ms,
+        }
+        if self.parent_id:
+            record['parent'] = self.parent_id
+        if self.attributes:
+            record['attrs'] = self.attributes
+        if self.status != 'ok':
+            record['status'] = self.status
+        record['id'] = self.span_id
+        return record
+
+
+def _otel_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': value}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+class Trace:
+    """
+    Collects spans for one service invocation.
+
+    Use as a context manager; spans opened inside it (in this thread or
+    context) are attached automatically.
+    """
+
+    trace_id = _LazyId(32)
+
+    def __init__(self, service: str):
+        self.service = service
+        self.start_ns = time.time_ns()
+        self.spans = []
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_trace.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _current_trace.reset(self._token)
+        return False
+
+    def export(self) -> dict:
+        """Structured trace for the service result"""
+        return {
+            'service': self.service,
+            'trace_id': self.trace_id,
+            'format': TRACE_FORMAT,
+            'spans': [s.export() for s in self.spans if s.duration_ms is not None],
+        }
+
+
+class _NoopSpan:
+    def set(self, **attributes) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block as a span of the current trace (no-op when no trace is active)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield _NOOP_SPAN
+        return
+
+    current = Span(trace, name, _current_span.get(), attributes)
+    trace.spans.append(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(e)
+        raise
+    else:
+        current.end()
+    finally:
+        _current_span.reset(token)
@@ -0,0 +1,429 @@
+"""
+Valuation Model
+Offline-fitted valuation surface, so agents get a calibrated estimate and interval without network access
+
+Observations (market search valuations from agent2, confident consensus
+results from the orchestrator via 'record', unless an agent used this model's
+estimate) are appended to VALUATION_MODEL_DIR/observations.jsonl. 'refit' models log price per sqm as a base value plus
+piecewise-constant tables over binned area, NDVI and cloud cover and offsets
+per ~100 km region and ~5 km cell, fitted by cyclic gradient boosting with
+shrinkage (sparse cells fall back toward their region). The 80% interval
+comes from cross-validated residuals per location level. The tables are
+written as one versioned binary file that is mmapped on first use; an
+estimate is a few array reads and two binary searches.
+
+Enabled in agent2/agent3 (instead of the NDVI step valuation when there is
+no market data) with VALUATION_MODEL=1. Fitting requires NumPy; estimates do not.
+
+    echo '<json>' | python valuation_model.py record  # append an observation (the orchestrator's consensus results)
+    python valuation_model.py refit                  # fit a new version from the observations
+    python valuation_model.py info                   # current version, fit statistics
+    python valuation_model.py estimate '<json>'      # {"area_sqm", "ndvi", "cloud_coverage", "latitude", "longitude"}
+    python valuation_model.py bench [estimates]      # estimate latency
+"""
+import bisect
+import json
+import math
+import os
+import struct
+import sys
+import time
+
+from artifact_store import write_atomic
+from tracing import get_logger
+
+logger = get_logger('valuation_model')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+VALUATION_MODEL = os.getenv('VALUATION_MODEL', '0').lower() in ('1', 'true', 'yes', 'on')
+
+VALUATION_MODEL_DIR = os.getenv('VALUATION_MODEL_DIR', os.path.join(BASE_DIR, '.valuation-model'))
+
+# Location levels: ~5 km cells within ~100 km regions
+VALUATION_CELL_DEG = float(os.getenv('VALUATION_CELL_DEG', '0.05'))
+VALUATION_REGION_DEG = float(os.getenv('VALUATION_REGION_DEG', '1.0'))
+
+# Central coverage of the reported interval
+VALUATION_INTERVAL = float(os.getenv('VALUATION_INTERVAL', '0.8'))
+
+# Model versions kept after a refit
+VALUATION_MODEL_KEEP = int(os.getenv('VALUATION_MODEL_KEEP', '5'))
+
+# Fewer observations than this are not enough to fit
+MIN_OBSERVATIONS = 30
+
+# Boosting: rounds over all features, step size, and pseudo-observations pulling sparse bins toward zero
+BOOST_ROUNDS = 200
+LEARNING_RATE = 0.1
+SHRINKAGE = 5.0
+
+# Cross-validation folds for the interval, and residuals a location level needs for its own interval
+FOLDS = 5
+MIN_LEVEL_RESIDUALS = 20
+
+# Feature bins as (low, high, count); values outside fall in the edge bins
+AREA_BINS = (1.0, 6.0, 25)    # log10 sqm, 10 sqm to 1000 km²
+NDVI_BINS = (-0.2, 1.0, 24)
+CLOUD_BINS = (0.0, 100.0, 10)
+
+MAGIC = b'PVAL'
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct('<4sHI')  # magic, format version, header length
+
+_model = None
+
+
+def observations_path() -> str:
+    return os.path.join(VALUATION_MODEL_DIR, 'observations.jsonl')
+
+
+def current_path() -> str:
+    return os.path.join(VALUATION_MODEL_DIR, 'current')
+
+
+def _bin(value: float, bins: tuple) -> int:
+    low, high, count = bins
+    index = int((value - low) / (high - low) * count)
+    return 0 if index < 0 else count - 1 if index >= count else index
+
+
+def _cell_key(latitude: float, longitude: float, degrees: float) -> int:
+    return (int((latitude + 90) // degrees) << 32) | int((longitude + 180) // degrees)
+
+
+def feature_bins(area_sqm: float, ndvi: float, cloud_coverage: float) -> tuple:
+    return (_bin(math.log10(max(area_sqm, 1.0)), AREA_BINS), _bin(ndvi, NDVI_BINS),
+            _bin(cloud_coverage, CLOUD_BINS))
+
+
+def record_observation(source: str, latitude: float, longitude: float, area_sqm: float,
+                       ndvi: float, cloud_coverage: float, valuation: float) -> None:
+    """Append one valuation with its features for the next refit"""
+    if not VALUATION_MODEL or not area_sqm or not valuation or area_sqm <= 0 or valuation <= 0:
+        return
+    line = json.dumps({
+        'source': source, 'latitude': latitude, 'longitude': longitude, 'area_sqm': area_sqm,
+        'ndvi': ndvi, 'cloud_coverage': cloud_coverage, 'valuation': valuation, 'recorded_at': time.time(),
+    })
+    try:
+        os.makedirs(VALUATION_MODEL_DIR, exist_ok=True)
+        # One short append per line, so concurrent agents do not interleave
+        with open(observations_path(), 'a') as f:
+            f.write(line + '\n')
+    except OSError as e:
+        logger.warning("Could not record valuation observation: %s", e)
+
+
+def load_observations() -> list:
+    """Valid observations, keeping the latest per source and parcel"""
+    latest = {}
+    try:
+        with open(observations_path()) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    values = [float(entry[key]) for key in ('latitude', 'longitude', 'area_sqm', 'ndvi',
+                                                             'cloud_coverage', 'valuation')]
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if all(math.isfinite(value) for value in values) and values[2] > 0 and values[5] > 0:
+                    latest[(entry.get('source'), round(values[0], 5), round(values[1], 5))] = values
+    except FileNotFoundError:
+        pass
+    return list(latest.values())
+
+
+def _encode_locations(np, latitudes, longitudes, degrees: float):
+    keys = np.array([_cell_key(lat, lon, degrees) for lat, lon in zip(latitudes, longitudes)], dtype=np.uint64)
+    unique, index = np.unique(keys, return_inverse=True)
+    return unique, index
+
+
+def _fit(np, rows) -> dict:
+    """Boosted piecewise-constant tables and location offsets for log price per sqm"""
+    latitudes, longitudes, areas, ndvis, clouds, valuations = rows.T
+    y = np.log(valuations / areas)
+    bins = np.array([feature_bins(a, n, c) for a, n, c in zip(areas, ndvis, clouds)], dtype=np.int64)
+    region_keys, region_index = _encode_locations(np, latitudes, longitudes, VALUATION_REGION_DEG)
+    cell_keys, cell_index = _encode_locations(np, latitudes, longitudes, VALUATION_CELL_DEG)
+
+    features = [
+        ('area', bins[:, 0], AREA_BINS[2]),
+        ('ndvi', bins[:, 1], NDVI_BINS[2]),
+        ('cloud', bins[:, 2], CLOUD_BINS[2]),
+        ('region', region_index, len(region_keys)),
+        ('cell', cell_index, len(cell_keys)),
+    ]
+    base = float(y.mean())
+    prediction = np.full(len(y), base)
+    tables = {name: np.zeros(size) for name, _, size in features}
+    for _ in range(BOOST_ROUNDS):
+        for name, index, size in features:
+            residual = y - prediction
+            sums = np.bincount(index, weights=residual, minlength=size)
+            counts = np.bincount(index, minlength=size)
+            step = LEARNING_RATE * sums / (counts + SHRINKAGE)
+            tables[name] += step
+            prediction += step[index]
+    return {'base': base, 'tables': tables, 'region_keys': region_keys, 'cell_keys': cell_keys}
+
+
+def _predict(np, fitted: dict, rows) -> tuple:
+    """Log price per sqm and location level (0 cell, 1 region, 2 global) for held-out rows"""
+    tables = fitted['tables']
+    regions = {int(key): i for i, key in enumerate(fitted['region_keys'])}
+    cells = {int(key): i for i, key in enumerate(fitted['cell_keys'])}
+    predictions, levels = [], []
+    for latitude, longitude, area, ndvi, cloud, _ in rows:
+        a, n, c = feature_bins(area, ndvi, cloud)
+        value = fitted['base'] + tables['area'][a] + tables['ndvi'][n] + tables['cloud'][c]
+        region = regions.get(_cell_key(latitude, longitude, VALUATION_REGION_DEG))
+        cell = cells.get(_cell_key(latitude, longitude, VALUATION_CELL_DEG))
+        value += tables['region'][region] if region is not None else 0.0
+        value += tables['cell'][cell] if cell is not None else 0.0
+        predictions.append(value)
+        levels.append(0 if cell is not None else 1 if region is not None else 2)
+    return np.array(predictions), np.array(levels)
+
+
+def _calibrate(np, rows) -> tuple:
+    """Interval quantiles of cross-validated log residuals per location level, and fit statistics"""
+    order = np.random.default_rng(0).permutation(len(rows))
+    residuals, levels = [], []
+    for fold in range(FOLDS):
+        held_out = order[fold::FOLDS]
+        training = np.setdiff1d(order, held_out)
+        fitted = _fit(np, rows[training])
+        predictions, fold_levels = _predict(np, fitted, rows[held_out])
+        residuals.append(np.log(rows[held_out, 5] / rows[held_out, 2]) - predictions)
+        levels.append(fold_levels)
+    residuals, levels = np.concatenate(residuals), np.concatenate(levels)
+
+    tail = (1 - VALUATION_INTERVAL) / 2
+    overall = [float(np.quantile(residuals, tail)), float(np.quantile(residuals, 1 - tail))]
+    quantiles = {}
+    for level, name in enumerate(('cell', 'region', 'global')):
+        selected = residuals[levels == level]
+        quantiles[name] = overall if len(selected) < MIN_LEVEL_RESIDUALS else [
+            float(np.quantile(selected, tail)), float(np.quantile(selected, 1 - tail))]
+    low = np.array([quantiles[name][0] for name in ('cell', 'region', 'global')])[levels]
+    high = np.array([quantiles[name][1] for name in ('cell', 'region', 'global')])[levels]
+    stats = {
+        'cv_median_abs_pct_error': round(float(np.median(np.abs(np.expm1(residuals)))) * 100, 1),
+        'cv_interval_coverage': round(float(np.mean((residuals >= low) & (residuals <= high))), 3),
+        'cv_levels': {name: int(np.sum(levels == level)) for level, name in enumerate(('cell', 'region', 'global'))},
+    }
+    return quantiles, stats
+
+
+def _next_version() -> int:
+    versions = [int(name[7:-4]) for name in os.listdir(VALUATION_MODEL_DIR)
+                if name.startswith('model-v') and name.endswith('.bin') and name[7:-4].isdigit()]
+    return max(versions, default=0) + 1
+
+
+def refit() -> dict:
+    """Fit a new model version from the stored observations and make it current"""
+    import numpy as np
+
+    observations = load_observations()
+    if len(observations) < MIN_OBSERVATIONS:
+        raise ValueError(f"Need at least {MIN_OBSERVATIONS} observations to fit, have {len(observations)}")
+    rows = np.array(observations, dtype=np.float64)
+
+    started = time.perf_counter()
+    quantiles, stats = _calibrate(np, rows)
+    fitted = _fit(np, rows)
+    os.makedirs(VALUATION_MODEL_DIR, exist_ok=True)
+    version = _next_version()
+
+    arrays = [
+        ('area', 'd', fitted['tables']['area']),
+        ('ndvi', 'd', fitted['tables']['ndvi']),
+        ('cloud', 'd', fitted['tables']['cloud']),
+        ('region_keys', 'Q', fitted['region_keys']),
+        ('region_offsets', 'd', fitted['tables']['region']),
+        ('cell_keys', 'Q', fitted['cell_keys']),
+        ('cell_offsets', 'd', fitted['tables']['cell']),
+    ]
+    header = {
+        'version': version, 'created_at': time.time(), 'observations': len(rows), 'base': fitted['base'],
+        'area_bins': AREA_BINS, 'ndvi_bins': NDVI_BINS, 'cloud_bins': CLOUD_BINS,
+        'cell_deg': VALUATION_CELL_DEG, 'region_deg': VALUATION_REGION_DEG,
+        'interval': VALUATION_INTERVAL, 'quantiles': quantiles, 'byteorder': sys.byteorder,
+        'fit_ms': round((time.perf_counter() - started) * 1000, 1), **stats,
+    }
+    # Offsets are relative to the end of the header
+    layout, offset, body = {}, 0, b''
+    for name, typecode, values in arrays:
+        data = np.ascontiguousarray(values, dtype=np.uint64 if typecode == 'Q' else np.float64).tobytes()
+        layout[name] = [offset, typecode, len(values)]
+        body += data
+        offset += len(data)
+    header['arrays'] = layout
+    header_bytes = json.dumps(header).encode('utf-8')
+    # Keep the arrays 8-byte aligned for memoryview casts
+    header_bytes += b' ' * (-(PREAMBLE.size + len(header_bytes)) % 8)
+    filename = f"model-v{version}.bin"
+    write_atomic(os.path.join(VALUATION_MODEL_DIR, filename),
+                 PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)) + header_bytes + body)
+    write_atomic(current_path(), filename.encode('utf-8'))
+    _prune_versions(version)
+    logger.info("📈 Valuation model v%d fitted on %d observations (CV median error %.1f%%, coverage %.2f)",
+                version, len(rows), stats['cv_median_abs_pct_error'], stats['cv_interval_coverage'])
+    return {key: value for key, value in header.items() if key != 'arrays'}
+
+
+def _prune_versions(current: int) -> None:
+    for name in os.listdir(VALUATION_MODEL_DIR):
+        if name.startswith('model-v') and name.endswith('.bin') and name[7:-4].isdigit():
+            if int(name[7:-4]) <= current - VALUATION_MODEL_KEEP:
+                os.unlink(os.path.join(VALUATION_MODEL_DIR, name))
+
+
+class ValuationModel:
+    """A fitted model file, memory-mapped; estimates read its tables in place"""
+
+    def __init__(self, path: str):
+        import mmap
+
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, format_version, header_length = PREAMBLE.unpack_from(self.buffer)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f"{path}: not a format {FORMAT_VERSION} valuation model")
+        self.header = json.loads(bytes(self.buffer[PREAMBLE.size:PREAMBLE.size + header_length]))
+        if self.header['byteorder'] != sys.byteorder:
+            raise ValueError(f"{path}: written on a {self.header['byteorder']}-endian machine")
+
+        view = memoryview(self.buffer)[PREAMBLE.size + header_length:]
+        for name, (offset, typecode, length) in self.header['arrays'].items():
+            setattr(self, name, view[offset:offset + length * 8].cast(typecode))
+        self.version = self.header['version']
+        self.base = self.header['base']
+        self.bins = (tuple(self.header['area_bins']), tuple(self.header['ndvi_bins']), tuple(self.header['cloud_bins']))
+        self.quantiles = self.header['quantiles']
+
+    def _offset(self, keys, offsets, key: int):
+        index = bisect.bisect_left(keys, key)
+        if index < len(keys) and keys[index] == key:
+            return offsets[index]
+        return None
+
+    def estimate(self, area_sqm: float, ndvi: float, cloud_coverage: float,
+                 latitude: float, longitude: float) -> dict:
+        area_bins, ndvi_bins, cloud_bins = self.bins
+        value = (self.base + self.area[_bin(math.log10(max(area_sqm, 1.0)), area_bins)]
+                 + self.ndvi[_bin(ndvi, ndvi_bins)] + self.cloud[_bin(cloud_coverage, cloud_bins)])
+        region = self._offset(self.region_keys, self.region_offsets,
+                              _cell_key(latitude, longitude, self.header['region_deg']))
+        cell = self._offset(self.cell_keys, self.cell_offsets, _cell_key(latitude, longitude, self.header['cell_deg']))
+        level = 'cell' if cell is not None else 'region' if region is not None else 'global'
+        value += (region or 0.0) + (cell or 0.0)
+
+        price_per_sqm = math.exp(value)
+        low, high = self.quantiles[level]
+        return {
+            'valuation': int(price_per_sqm * area_sqm),
+            'low': int(price_per_sqm * math.exp(low) * area_sqm),
+            'high': int(price_per_sqm * math.exp(high) * area_sqm),
+            'price_per_sqm': int(price_per_sqm),
+            'interval': self.header['interval'],
+            'location_level': level,
+            'model_version': self.version,
+        }
+
+
+def load_model():
+    """The current model version, loaded once per process (None if none has been fitted)"""
+    global _model
+    if _model is None:
+        try:
+            with open(current_path()) as f:
+                _model = ValuationModel(os.path.join(VALUATION_MODEL_DIR, f.read().strip()))
+        except (OSError, ValueError) as e:
+            logger.debug("No valuation model loaded: %s", e)
+            return None
+    return _model
+
+
+def estimate_valuation(area_sqm: float, ndvi: float, cloud_coverage: float,
+                       latitude: float, longitude: float):
+    """Calibrated valuation with its interval from the current model, or None (disabled, not fitted, no area)"""
+    if not VALUATION_MODEL or not area_sqm or area_sqm <= 0:
+        return None
+    model = load_model()
+    if model is None:
+        return None
+    return model.estimate(area_sqm, ndvi, cloud_coverage, latitude, longitude)
+
+
+def apply_estimate(base_valuation: dict, estimate: dict) -> dict:
+    """An agent's step-function valuation with the model's estimate in its place"""
+    return {
+        'valuation': estimate['valuation'],
+        'confidence': base_valuation['confidence'],
+        'factors': {
+            'source': 'valuation_model',
+            'model_version': estimate['model_version'],
+            'location_level': estimate['location_level'],
+            'price_per_sqm': estimate['price_per_sqm'],
+            'interval_coverage': estimate['interval'],
+        },
+        'interval': [estimate['low'], estimate['high']],
+    }
+
+
+def describe_estimate(valuation: dict) -> str:
+    """Prompt note for a model valuation (empty for the step function)"""
+    if 'interval' not in valuation:
+        return ""
+    low, high = valuation['interval']
+    factors = valuation['factors']
+    return (f" (offline valuation model v{factors['model_version']}, "
+            f"{factors['interval_coverage']:.0%} interval ${low:,} - ${high:,})")
+
+
+def bench(estimates: int = 100000) -> dict:
+    model = load_model()
+    if model is None:
+        raise ValueError("No fitted model; run 'refit' first")
+    import random
+
+    rng = random.Random(5)
+    queries = [(rng.uniform(50, 50000), rng.uniform(0, 0.9), rng.uniform(0, 40),
+                rng.uniform(8, 30), rng.uniform(70, 90)) for _ in range(estimates)]
+    started = time.perf_counter()
+    for query in queries:
+        model.estimate(*query)
+    elapsed = time.perf_counter() - started
+    return {'estimates': estimates, 'model_version': model.version,
+            'us_per_estimate': round(elapsed / estimates * 1e6, 2)}
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'record':
+        observation = json.loads(sys.stdin.read())
+        record_observation(observation['source'], float(observation['latitude']), float(observation['longitude']),
+                           float(observation['area_sqm']), float(observation['ndvi']),
+                           float(observation['cloud_coverage']), float(observation['valuation']))
+    elif command == 'refit':
+        print(json.dumps(refit(), indent=2))
+    elif command == 'info':
+        model = load_model()
+        print(json.dumps({key: value for key, value in model.header.items() if key != 'arrays'}
+                         if model else {'error': 'No fitted model'}, indent=2))
+    elif command == 'estimate' and len(sys.argv) > 2:
+        query = json.loads(sys.argv[2])
+        model = load_model()
+        print(json.dumps(model.estimate(float(query['area_sqm']), float(query.get('ndvi', 0.5)),
+                                        float(query.get('cloud_coverage', 0)), float(query['latitude']),
+                                        float(query['longitude']))
+                         if model else {'error': 'No fitted model'}, indent=2))
+    elif command == 'bench':
+        print(json.dumps(bench(int(sys.argv[2]) if len(sys.argv) > 2 else 100000)))
+    else:
+        print("Usage: python valuation_model.py [record | refit | info | estimate '<json>' | bench [estimates]]", file=sys.stderr)
+        sys.exit(1)